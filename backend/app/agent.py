@@ -1,26 +1,36 @@
-import json
+import asyncio
+import contextlib
 import re
-import sqlite3
+import time
 import uuid
-from typing import Any
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable
 
-from langchain_openai import AzureChatOpenAI
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.documents import Document
 
+from . import metrics
+from .cache import order_bucket
 from .config import Settings
-from .rag import build_vector_store
-from .sql import run_text_to_sql
+from .decision import parse_decision
+from .lexical import is_decisive, reciprocal_rank_fusion
+from .matcher import KeywordMatcher
+from .policies import PolicySnapshot, kb_doc_id
+from .prompting import build_messages, summarize_turns
+from .registry import get_registry
+from .resilience import UpstreamUnavailable, prompt_key
+from .sql import SQLITE_MAX_PARAMS, ComplaintHistory, ComplaintRepository, get_pool
+from .streaming import MessageFieldExtractor
+from .tracing import span
 
 
 MESSAGE_MAX_LEN = 800
 CUSTOMER_CARE_HELPLINE = "1800-123-4567"
 ORDER_ID_PATTERN = re.compile(r"^[A-Za-z0-9\-]{3,40}$")
-_VECTOR_STORE = None
-_VECTOR_STORE_KEY = None
-
-# In-memory conversation history store: session_id -> list of {role, content} messages
-_CONVERSATION_HISTORY: dict[str, list[dict[str, str]]] = {}
-MAX_HISTORY_MESSAGES = 10  # Keep last 10 messages (5 user + 5 assistant) to avoid token bloat
+POLICY_SNIPPETS_K = 3
+# Candidates taken from each ranking before fusion.
+FUSION_CANDIDATES = 10
 
 
 def validate_message(message: str) -> str:
@@ -42,77 +52,163 @@ def validate_order_id(order_id: str | None) -> str | None:
 
 
 def load_policies(settings: Settings) -> list[dict[str, Any]]:
-    path = settings.data_dir / "policies.json"
-    return json.loads(path.read_text(encoding="utf-8"))
+    """Current policies from the in-memory registry (re-read only when the file changes)."""
+    return get_registry(settings).policies.current().policies
+
+
+ORDER_SQL = "SELECT order_id, items, status, delivered_at FROM orders WHERE order_id = ?"
+
+
+def _order_from_row(row: tuple | None) -> dict[str, Any] | None:
+    if not row:
+        return None
+    return {"order_id": row[0], "items": row[1], "status": row[2], "delivered_at": row[3]}
+
+
+def get_order(order_id: str, settings: Settings) -> dict[str, Any] | None:
+    with get_pool(settings).connection() as conn:
+        return _order_from_row(conn.execute(ORDER_SQL, (order_id,)).fetchone())
+
+
+def get_order_context(order_id: str, settings: Settings) -> tuple[dict[str, Any] | None, ComplaintHistory]:
+    """The order and its complaint history, read over one pooled connection."""
+    with get_pool(settings).connection() as conn:
+        with span("order_lookup"):
+            order = _order_from_row(conn.execute(ORDER_SQL, (order_id,)).fetchone())
+        with span("complaint_history"):
+            history = ComplaintRepository(settings.db_path).get_history(order_id, conn)
+    return order, history
+
+
+def get_orders(order_ids: list[str], settings: Settings) -> dict[str, dict[str, Any]]:
+    """Bulk order lookup with one ``IN (...)`` query per chunk of IDs."""
+    unique_ids = list(dict.fromkeys(order_ids))
+    orders: dict[str, dict[str, Any]] = {}
+    with get_pool(settings).connection() as conn:
+        for start in range(0, len(unique_ids), SQLITE_MAX_PARAMS):
+            chunk = unique_ids[start : start + SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                "SELECT order_id, items, status, delivered_at FROM orders "
+                f"WHERE order_id IN ({placeholders})",
+                chunk,
+            ).fetchall()
+            for row in rows:
+                orders[row[0]] = _order_from_row(row)
+    return orders
+
+
+def format_order_summary(order: dict[str, Any] | None) -> str | None:
+    if not order:
+        return None
+    return (
+        f"Order {order['order_id']} | items: {order['items']} | status: {order['status']} "
+        f"| delivered_at: {order['delivered_at']}"
+    )
 
 
 def get_order_summary(order_id: str, settings: Settings) -> str | None:
-    conn = sqlite3.connect(settings.db_path)
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT order_id, items, status, delivered_at FROM orders WHERE order_id = ?",
-            (order_id,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
-        return f"Order {row[0]} | items: {row[1]} | status: {row[2]} | delivered_at: {row[3]}"
-    finally:
-        conn.close()
+    return format_order_summary(get_order(order_id, settings))
+
+
+async def aget_order(order_id: str, settings: Settings) -> dict[str, Any] | None:
+    # sqlite3 is blocking; keep it off the event loop.
+    return await asyncio.to_thread(get_order, order_id, settings)
+
+
+async def aget_order_context(order_id: str, settings: Settings) -> tuple[dict[str, Any] | None, ComplaintHistory]:
+    return await asyncio.to_thread(get_order_context, order_id, settings)
 
 
 def retrieve_policy_snippets(vstore, message: str) -> list[Document]:
-    return vstore.similarity_search(message, k=3)
+    return vstore.similarity_search(message, k=POLICY_SNIPPETS_K)
 
 
-def build_llm(settings: Settings) -> AzureChatOpenAI:
-    return AzureChatOpenAI(
-        azure_endpoint=settings.azure_endpoint,
-        api_key=settings.azure_api_key,
-        api_version=settings.azure_api_version,
-        azure_deployment=settings.azure_deployment,
-        temperature=0.2,
-    )
+def lexical_candidates(message: str, snapshot: PolicySnapshot, settings: Settings) -> list[tuple[str, float]]:
+    if settings.retrieval_mode == "vector":
+        return []
+    return snapshot.lexical.search(message, FUSION_CANDIDATES)
 
 
-def safe_json_loads(raw: str) -> dict[str, Any] | None:
-    """Best-effort parser that tolerates the model adding extra text."""
-    if not raw:
-        return None
+def lexical_is_decisive(lexical: list[tuple[str, float]], settings: Settings) -> bool:
+    return settings.retrieval_mode == "lexical" and is_decisive(
+        lexical, settings.lexical_min_score, settings.lexical_margin
+    )
+
 
-    # First, try direct parse
+def lexical_snippets(lexical: list[tuple[str, float]], snapshot: PolicySnapshot) -> list[Document]:
+    return [snapshot.kb_docs[doc_id] for doc_id, _ in lexical[:POLICY_SNIPPETS_K]]
+
+
+def fuse_snippets(
+    dense: list[Document], lexical: list[tuple[str, float]], snapshot: PolicySnapshot
+) -> list[Document]:
+    """Reciprocal-rank fusion of the FAISS and BM25 rankings."""
+    if not lexical:
+        return dense[:POLICY_SNIPPETS_K]
+    docs = dict(snapshot.kb_docs)
+    dense_ids = []
+    for doc in dense:
+        dense_ids.append(kb_doc_id(doc))
+        docs[dense_ids[-1]] = doc
+    fused = reciprocal_rank_fusion([dense_ids, [doc_id for doc_id, _ in lexical]])
+    return [docs[doc_id] for doc_id in fused[:POLICY_SNIPPETS_K]]
+
+
+async def aretrieve_policy_snippets(
+    vstore, message: str, snapshot: PolicySnapshot | None = None, settings: Settings | None = None
+) -> tuple[list[float] | None, list[Document]]:
+    """Hybrid retrieval. Also returns the query vector for reuse; None when no embedding was made.
+
+    Without a snapshot this is plain dense search. In "lexical" mode a decisive
+    BM25 match skips the embedding call entirely, and in any mode with lexical
+    candidates an embeddings failure degrades to the BM25 ranking.
+    """
+    lexical = lexical_candidates(message, snapshot, settings) if snapshot is not None and settings else []
+    if lexical and lexical_is_decisive(lexical, settings):
+        metrics.RETRIEVALS.inc(path="lexical")
+        return None, lexical_snippets(lexical, snapshot)
     try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
-        pass
-
-    # Fallback: extract first JSON object substring
-    start = raw.find("{")
-    end = raw.rfind("}")
-    if start != -1 and end != -1 and end > start:
-        candidate = raw[start : end + 1]
-        try:
-            return json.loads(candidate)
-        except json.JSONDecodeError:
-            return None
-
-    return None
-
-
-def rule_based_fallback(message: str, policies: list[dict[str, Any]]) -> dict[str, Any]:
-    lowered = message.lower()
-    for policy in policies:
-        for keyword in policy.get("keywords", []):
-            if keyword in lowered:
-                return {
-                    "status": "handled",
-                    "resolution": policy.get("default_resolution"),
-                    "message": policy.get("response_template"),
-                    "escalate": False,
-                    "policy_citations": [policy.get("policy_id", "unknown")],
-                    "next_steps": policy.get("next_steps", []),
-                }
+        vector = await vstore.embeddings.aembed_query(message)
+    except Exception:
+        if not lexical:
+            raise
+        metrics.RETRIEVALS.inc(path="lexical_fallback")
+        return None, lexical_snippets(lexical, snapshot)
+    dense = await vstore.asimilarity_search_by_vector(
+        vector, k=FUSION_CANDIDATES if lexical else POLICY_SNIPPETS_K
+    )
+    metrics.RETRIEVALS.inc(path="hybrid" if lexical else "vector")
+    return vector, fuse_snippets(dense, lexical, snapshot) if lexical else dense
+
+
+def get_vector_store(settings: Settings):
+    """Return the process-wide vector store, loading the persisted index on first use."""
+    return get_registry(settings).vector_store()
+
+
+def build_llm(settings: Settings) -> BaseChatModel:
+    """Shared chat model; its HTTP pool is reused across requests."""
+    return get_registry(settings).llm
+
+
+def policy_response(policy: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "status": "handled",
+        "resolution": policy.get("default_resolution"),
+        "message": policy.get("response_template"),
+        "escalate": False,
+        "policy_citations": [policy.get("policy_id", "unknown")],
+        "next_steps": list(policy.get("next_steps", [])),
+    }
+
+
+def rule_based_fallback(
+    message: str, policies: list[dict[str, Any]], matcher: KeywordMatcher | None = None
+) -> dict[str, Any]:
+    matches = (matcher or KeywordMatcher(policies)).match(message)
+    if matches:
+        return policy_response(matches[0].policy)
     return {
         "status": "needs_human",
         "resolution": None,
@@ -138,141 +234,433 @@ def get_or_create_session(session_id: str | None) -> str:
     return session_id
 
 
-def get_conversation_history(session_id: str) -> list[dict[str, str]]:
+def get_conversation_history(session_id: str, settings: Settings) -> list[dict[str, str]]:
     """Get conversation history for a session."""
-    return _CONVERSATION_HISTORY.get(session_id, [])
+    return get_registry(settings).sessions.get_history(session_id)
 
 
-def add_to_history(session_id: str, role: str, content: str) -> None:
-    """Add a message to conversation history, keeping only recent messages."""
-    if session_id not in _CONVERSATION_HISTORY:
-        _CONVERSATION_HISTORY[session_id] = []
-    
-    _CONVERSATION_HISTORY[session_id].append({"role": role, "content": content})
-    
-    # Keep only the last MAX_HISTORY_MESSAGES
-    if len(_CONVERSATION_HISTORY[session_id]) > MAX_HISTORY_MESSAGES:
-        _CONVERSATION_HISTORY[session_id] = _CONVERSATION_HISTORY[session_id][-MAX_HISTORY_MESSAGES:]
+def get_session_summary(session_id: str, settings: Settings) -> str:
+    """Running summary of the messages already trimmed from the session."""
+    return get_registry(settings).sessions.get_summary(session_id)
 
 
-def handle_chat(message: str, order_id: str | None, session_id: str | None, settings: Settings) -> dict[str, Any]:
+def read_session(session_id: str, settings: Settings) -> tuple[list[dict[str, str]], str]:
+    """History and summary of a session, read together so a request pays one thread hop."""
+    return get_conversation_history(session_id, settings), get_session_summary(session_id, settings)
+
+
+def add_to_history(session_id: str, role: str, content: str, settings: Settings) -> list[dict[str, str]]:
+    """Add a message to conversation history; returns the old messages the store trimmed."""
+    return get_registry(settings).sessions.append(session_id, role, content)
+
+
+def record_turn(session_id: str, user_message: str, assistant_message: str, summary: str, settings: Settings) -> None:
+    """Store both sides of a turn and fold whatever the store trimmed into the session summary."""
+    dropped = add_to_history(session_id, "user", user_message, settings)
+    dropped += add_to_history(session_id, "assistant", assistant_message, settings)
+    if dropped:
+        get_registry(settings).sessions.set_summary(
+            session_id,
+            summarize_turns(summary, dropped, settings.session_summary_max_tokens, settings.tokenizer_encoding),
+        )
+
+
+SYSTEM_PROMPT = (
+    "You are a polite, empathetic Zomato complaint resolution chat agent.\n"
+    "\n"
+    "- You are having a conversation with a customer. Previous messages in this conversation\n"
+    "  are provided below, so you can reference what was discussed earlier and maintain context.\n"
+    "- Use the policy snippets, order summary, complaint history, and conversation context to\n"
+    "  decide between refund, redelivery, or escalation.\n"
+    "- Complaint history lists complaint counts for the order, the customer and the restaurant\n"
+    "  (all time, and over the last 7 and 30 days) with the latest resolution; use these counts\n"
+    "  for policies that escalate on multiple prior complaints or repeated restaurant reports.\n"
+    "- For common complaint types that clearly match a policy (missing item, wrong food delivered,\n"
+    "  food smells bad/spoiled, broken or missing seal, late delivery) you should normally RESOLVE\n"
+    "  the issue yourself (set escalate=false) using the policy rules, unless the data is clearly\n"
+    "  contradictory or there is a serious risk that must be reviewed by a human.\n"
+    "- If the customer clearly expresses a preference that is allowed by policy (for example,\n"
+    '  they say things like "I want a refund" or "please resend the food"), honour that preference\n'
+    "  when it is safe and consistent with the policy.\n"
+    "- In the 'message' field, speak directly to the customer in 3–5 short sentences:\n"
+    "  (1) warmly acknowledge and summarize their issue,\n"
+    "  (2) clearly explain WHAT help you can provide (e.g., partial refund, full refund, redelivery,\n"
+    "      credits) and WHY this option fits the policy and their order details,\n"
+    "  (3) briefly describe HOW it will work in practice (for example, when the refund will appear,\n"
+    "      whether they can choose between refund and redelivery, or what information you used),\n"
+    "  (4) if anything is unclear, ask one short follow-up question they can answer in their next\n"
+    "      message (for example, whether they prefer refund vs redelivery).\n"
+    "- Only escalate when the scenario is not covered by policy, the data is inconsistent,\n"
+    "  or your confidence is low, and explain the reason for escalation\n"
+    "  (e.g., missing data, unusual situation, or overlapping policies).\n"
+    "\n"
+    "You MUST respond with a single JSON object and nothing else. Do not include Markdown,\n"
+    "explanations, or additional text outside the JSON. The JSON must have exactly these keys:\n"
+    "status, resolution, message, escalate, policy_citations, next_steps."
+)
+
+
+def normalize_response(
+    parsed: dict[str, Any], order_summary: str | None, session_id: str, policy_version: str | None = None
+) -> dict[str, Any]:
+    # Field types were settled by parse_decision (or the rule-based builders); add the server-side fields.
+    parsed["order_summary"] = order_summary
+    parsed["policy_version"] = policy_version
+    # Add session_id to response
+    parsed["session_id"] = session_id
+    return parsed
+
+
+ProgressCallback = Callable[[str, dict[str, Any]], None]
+
+
+@dataclass
+class ChatTurn:
+    """Everything gathered for one turn before the LLM is called."""
+
+    message: str
+    session_id: str
+    settings: Settings
+    conversation_history: list[dict[str, str]]
+    order: dict[str, Any] | None
+    order_summary: str | None
+    history: ComplaintHistory | None
+    policies: list[dict[str, Any]]
+    matcher: KeywordMatcher
+    version: str
+    query_vector: list[float] | None
+    messages: list[dict[str, str]] = field(default_factory=list)
+    # Set when the turn was answered without the LLM (fast path or response cache).
+    early_result: dict[str, Any] | None = None
+    cache: Any = None
+    cache_bucket: str | None = None
+    summary: str = ""
+    # Prompt tokens per section, plus the model-reported input/output counts once known.
+    token_usage: dict[str, int] = field(default_factory=dict)
+    # What produced the answer: llm, fast_path, cache, fallback (unusable LLM output) or failover.
+    source: str = "llm"
+    started: float = field(default_factory=time.perf_counter)
+
+
+async def prepare_turn(
+    message: str,
+    order_id: str | None,
+    session_id: str | None,
+    settings: Settings,
+    progress: ProgressCallback | None = None,
+) -> ChatTurn:
+    started = time.perf_counter()
     validated_message = validate_message(message)
     validated_order_id = validate_order_id(order_id)
     session_id = get_or_create_session(session_id)
+    notify = progress or (lambda stage, data: None)
     
     # Get conversation history for this session
-    conversation_history = get_conversation_history(session_id)
-
-    global _VECTOR_STORE, _VECTOR_STORE_KEY
-    current_key = (
-        settings.azure_endpoint,
-        settings.azure_api_version,
-        settings.azure_deployment,
-        settings.azure_embeddings_deployment,
-        settings.hf_embeddings_model,
+    with span("session_read"):
+        conversation_history, summary = await asyncio.to_thread(read_session, session_id, settings)
+
+    registry = get_registry(settings)
+    with span("load_policies"):
+        snapshot = registry.policies.current()
+
+    # Only a first request (or a knowledge-base change) builds the store; that one goes to a thread.
+    vstore = registry.built_vector_store(snapshot.kb_version)
+    if vstore is None:
+        with span("vector_store"):
+            vstore = await asyncio.to_thread(registry.vector_store)
+
+    async def retrieve() -> tuple[list[float] | None, list[Document]]:
+        with span("retrieval"):
+            result = await aretrieve_policy_snippets(vstore, validated_message, snapshot, settings)
+        notify("retrieval", {"policy_ids": [doc.metadata.get("policy_id", "unknown") for doc in result[1]]})
+        return result
+
+    async def fetch_order_context() -> tuple[dict[str, Any] | None, ComplaintHistory | None]:
+        if not validated_order_id:
+            return None, None
+        # Order and complaint history share one pooled connection and one thread hop.
+        order, history = await aget_order_context(validated_order_id, settings)
+        notify("order", {"order_id": validated_order_id, "found": order is not None})
+        return order, history
+
+    # Retrieval and the database lookups are independent:
+    # run them concurrently so the pre-LLM latency is the slowest step, not the sum.
+    (query_vector, snippets), (order, history) = await asyncio.gather(retrieve(), fetch_order_context())
+    cache = registry.response_cache
+    if cache is not None and not conversation_history and query_vector is not None:
+        # Decisions other workers cached; the shared file is read in a thread, not on the event loop.
+        await cache.apull_shared(snapshot.version)
+    turn = assemble_turn(
+        validated_message,
+        session_id,
+        settings,
+        conversation_history,
+        order,
+        history,
+        query_vector,
+        snippets,
+        snapshot,
+        summary,
     )
-    if _VECTOR_STORE is None or _VECTOR_STORE_KEY != current_key:
-        _VECTOR_STORE = build_vector_store(settings)
-        _VECTOR_STORE_KEY = current_key
-    vstore = _VECTOR_STORE
-    policies = load_policies(settings)
-    snippets = retrieve_policy_snippets(vstore, validated_message)
-
-    policy_context = "\n\n".join(
-        f"[{doc.metadata.get('policy_id', 'unknown')}] {doc.page_content}"
-        for doc in snippets
+    turn.started = started
+    return turn
+
+
+def assemble_turn(
+    message: str,
+    session_id: str,
+    settings: Settings,
+    conversation_history: list[dict[str, str]],
+    order: dict[str, Any] | None,
+    history: ComplaintHistory | None,
+    query_vector: list[float] | None,
+    snippets: list[Document],
+    snapshot: PolicySnapshot,
+    summary: str = "",
+) -> ChatTurn:
+    """Build the turn from already-fetched context: fast path, cache lookup, then the prompt."""
+    order_summary = format_order_summary(order)
+    turn = ChatTurn(
+        message=message,
+        session_id=session_id,
+        settings=settings,
+        conversation_history=conversation_history,
+        order=order,
+        order_summary=order_summary,
+        history=history,
+        policies=snapshot.policies,
+        matcher=snapshot.matcher,
+        version=snapshot.version,
+        query_vector=query_vector,
+        summary=summary,
     )
 
-    order_summary = None
-    if validated_order_id:
-        order_summary = get_order_summary(validated_order_id, settings)
+    # Fast path: an unambiguous, high-confidence keyword match on a verified order with no complaints
+    # against it, its customer or its restaurant is answered straight from the policy template without an LLM call.
+    if (
+        settings.fast_path_enabled
+        and not conversation_history
+        and order is not None
+        and history is not None
+        and history.clean
+    ):
+        matches = turn.matcher.match(message)
+        if len(matches) == 1 and matches[0].score >= settings.fast_path_min_score:
+            metrics.FAST_PATH.inc()
+            turn.early_result = policy_response(matches[0].policy)
+            turn.source = "fast_path"
+            return turn
+
+    # Cached decisions only apply to the opening turn: later turns depend on the conversation.
+    # Lexical-only retrieval has no query vector to key the cache on.
+    cache = get_registry(settings).response_cache
+    if cache is not None and not conversation_history and query_vector is not None:
+        turn.cache = cache
+        turn.cache_bucket = (
+            order_bucket(order, history.total, history.scope_total("customer"), history.scope_total("restaurant"))
+            if history
+            else order_bucket(order, 0)
+        )
+        with span("cache_lookup"):
+            cached = cache.lookup(query_vector, turn.cache_bucket, snapshot.version)
+        metrics.CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            turn.early_result = cached
+            turn.source = "cache"
+            return turn
+
+    with span("prompt_build"):
+        turn.messages, turn.token_usage = build_messages(
+            SYSTEM_PROMPT,
+            summary,
+            conversation_history,
+            message,
+            order_summary,
+            history.summary() if history else None,
+            snippets,
+            settings.prompt_token_budget,
+            settings.session_summary_max_tokens,
+            settings.tokenizer_encoding,
+        )
+    return turn
+
+
+def resolve_turn(turn: ChatTurn, content: str) -> dict[str, Any]:
+    """Validate the model output (repairing it if needed), falling back to the keyword rules when it is unusable."""
+    with span("parse"):
+        parsed, outcome = parse_decision(content)
+    metrics.LLM_OUTPUT_PARSE.inc(outcome=outcome)
+    if parsed is None:
+        with span("fallback"):
+            parsed = rule_based_fallback(turn.message, turn.policies, turn.matcher)
+        metrics.FALLBACKS.inc()
+        turn.source = "fallback"
+    elif turn.cache is not None:
+        turn.cache.store(turn.query_vector, turn.cache_bucket, turn.version, parsed)
+    return parsed
 
-    text_to_sql_result = run_text_to_sql(
-        f"Find any complaint history related to order_id {validated_order_id}",
-        settings,
-    ) if validated_order_id else None
-
-    llm = build_llm(settings)
-    system_prompt = (
-        "You are a polite, empathetic Zomato complaint resolution chat agent.\n"
-        "\n"
-        "- You are having a conversation with a customer. Previous messages in this conversation\n"
-        "  are provided below, so you can reference what was discussed earlier and maintain context.\n"
-        "- Use the policy snippets, order summary, complaint history, and conversation context to\n"
-        "  decide between refund, redelivery, or escalation.\n"
-        "- For common complaint types that clearly match a policy (missing item, wrong food delivered,\n"
-        "  food smells bad/spoiled, broken or missing seal, late delivery) you should normally RESOLVE\n"
-        "  the issue yourself (set escalate=false) using the policy rules, unless the data is clearly\n"
-        "  contradictory or there is a serious risk that must be reviewed by a human.\n"
-        "- If the customer clearly expresses a preference that is allowed by policy (for example,\n"
-        '  they say things like "I want a refund" or "please resend the food"), honour that preference\n'
-        "  when it is safe and consistent with the policy.\n"
-        "- In the 'message' field, speak directly to the customer in 3–5 short sentences:\n"
-        "  (1) warmly acknowledge and summarize their issue,\n"
-        "  (2) clearly explain WHAT help you can provide (e.g., partial refund, full refund, redelivery,\n"
-        "      credits) and WHY this option fits the policy and their order details,\n"
-        "  (3) briefly describe HOW it will work in practice (for example, when the refund will appear,\n"
-        "      whether they can choose between refund and redelivery, or what information you used),\n"
-        "  (4) if anything is unclear, ask one short follow-up question they can answer in their next\n"
-        "      message (for example, whether they prefer refund vs redelivery).\n"
-        "- Only escalate when the scenario is not covered by policy, the data is inconsistent,\n"
-        "  or your confidence is low, and explain the reason for escalation\n"
-        "  (e.g., missing data, unusual situation, or overlapping policies).\n"
-        "\n"
-        "You MUST respond with a single JSON object and nothing else. Do not include Markdown,\n"
-        "explanations, or additional text outside the JSON. The JSON must have exactly these keys:\n"
-        "status, resolution, message, escalate, policy_citations, next_steps."
-    )
-    user_prompt = f"""
-User message: {validated_message}
 
-Order summary: {order_summary or "not available"}
+async def finish_turn(turn: ChatTurn, parsed: dict[str, Any]) -> dict[str, Any]:
+    parsed = normalize_response(parsed, turn.order_summary, turn.session_id, turn.version)
+    if parsed.get("escalate"):
+        metrics.ESCALATIONS.inc()
+    
+    parsed["token_usage"] = turn.token_usage or None
 
-Complaint history (text-to-sql): {text_to_sql_result or "none"}
+    # Store conversation history: add user message and assistant response
+    with span("session_write"):
+        await asyncio.to_thread(
+            record_turn, turn.session_id, turn.message, parsed.get("message", ""), turn.summary, turn.settings
+        )
 
-Policy snippets:
-{policy_context}
-"""
+    recorder = get_registry(turn.settings).outcomes
+    if recorder is not None:
+        recorder.record(turn_outcome(turn, parsed))
+    return parsed
 
-    # Build messages list: system prompt + conversation history + current user prompt
-    messages = [{"role": "system", "content": system_prompt}]
-    
-    # Add conversation history (previous user/assistant exchanges)
-    if conversation_history:
-        messages.extend(conversation_history)
-    
-    # Add current user message
-    messages.append({"role": "user", "content": user_prompt})
 
-    response = llm.invoke(messages)
+def turn_outcome(turn: ChatTurn, parsed: dict[str, Any]) -> dict[str, Any]:
+    """The decision record the outcome recorder persists for a finished turn."""
+    complaint_type = None
+    if turn.order is not None:
+        # Classified by the first cited policy's scenario, as the seeded complaints are.
+        scenarios = {policy.get("policy_id"): policy.get("scenario") for policy in turn.policies}
+        cited = (scenarios.get(policy_id) for policy_id in parsed.get("policy_citations", []))
+        complaint_type = next((scenario for scenario in cited if scenario), "other")
+    return {
+        "outcome_id": uuid.uuid4().hex,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "session_id": turn.session_id,
+        "order_id": turn.order["order_id"] if turn.order is not None else None,
+        "complaint_type": complaint_type,
+        "source": turn.source,
+        "status": parsed.get("status"),
+        "resolution": parsed.get("resolution"),
+        "escalate": bool(parsed.get("escalate")),
+        "policy_citations": parsed.get("policy_citations", []),
+        "policy_version": turn.version,
+        "latency_ms": (time.perf_counter() - turn.started) * 1000,
+        "input_tokens": turn.token_usage.get("llm_input"),
+        "output_tokens": turn.token_usage.get("llm_output"),
+    }
 
-    parsed = safe_json_loads(response.content)
-    if not parsed:
-        parsed = rule_based_fallback(validated_message, policies)
 
-    # Normalize fields for API schema
-    parsed["order_summary"] = order_summary
-    # next_steps must be a list of strings
-    next_steps = parsed.get("next_steps", [])
-    if isinstance(next_steps, str):
-        next_steps = [next_steps]
-    elif not isinstance(next_steps, list):
-        next_steps = []
-    parsed["next_steps"] = [str(step) for step in next_steps]
-
-    # policy_citations must be a list of strings
-    policy_citations = parsed.get("policy_citations", [])
-    if isinstance(policy_citations, str):
-        policy_citations = [policy_citations]
-    elif not isinstance(policy_citations, list):
-        policy_citations = []
-    parsed["policy_citations"] = [str(pid) for pid in policy_citations]
-    
-    # Add session_id to response
-    parsed["session_id"] = session_id
-    
-    # Store conversation history: add user message and assistant response
-    add_to_history(session_id, "user", validated_message)
-    add_to_history(session_id, "assistant", parsed.get("message", ""))
+async def ahandle_chat(
+    message: str, order_id: str | None, session_id: str | None, settings: Settings
+) -> dict[str, Any]:
+    turn = await prepare_turn(message, order_id, session_id, settings)
+    return await complete_turn(turn)
 
-    return parsed
+
+def failover(turn: ChatTurn) -> dict[str, Any]:
+    """Answer from the keyword rules when the LLM is unavailable (circuit open, saturated or erroring)."""
+    metrics.LLM_FAILOVERS.inc()
+    turn.source = "failover"
+    with span("fallback"):
+        return rule_based_fallback(turn.message, turn.policies, turn.matcher)
+
+
+async def complete_turn(turn: ChatTurn) -> dict[str, Any]:
+    """Call the LLM for a prepared turn (unless already answered) and record the result."""
+    if turn.early_result is not None:
+        return await finish_turn(turn, turn.early_result)
+
+    registry = get_registry(turn.settings)
+
+    async def invoke():
+        metrics.LLM_CALLS.inc()
+        response = await registry.llm.ainvoke(turn.messages)
+        metrics.record_token_usage(response)
+        return response
+
+    try:
+        with span("llm"):
+            # Identical prompts in flight at once (same opening complaint and order state) share one call.
+            response = await registry.llm_guard.call(invoke, key=prompt_key(turn.messages))
+    except UpstreamUnavailable:
+        return await finish_turn(turn, failover(turn))
+    apply_token_usage(turn, response)
+
+    return await finish_turn(turn, resolve_turn(turn, response.content))
+
+
+def apply_token_usage(turn: ChatTurn, response: Any) -> None:
+    """Copy the model-reported token counts onto the turn's token_usage."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage:
+        turn.token_usage["llm_input"] = usage.get("input_tokens", 0)
+        turn.token_usage["llm_output"] = usage.get("output_tokens", 0)
+
+
+async def astream_chat(
+    message: str, order_id: str | None, session_id: str | None, settings: Settings
+) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+    """Yield (event, data) pairs: progress updates, message tokens, then the final response."""
+    events: asyncio.Queue = asyncio.Queue()
+    preparing = asyncio.create_task(
+        prepare_turn(
+            message,
+            order_id,
+            session_id,
+            settings,
+            progress=lambda stage, data: events.put_nowait(("progress", {"stage": stage, **data})),
+        )
+    )
+    try:
+        while not preparing.done() or not events.empty():
+            getter = asyncio.ensure_future(events.get())
+            await asyncio.wait({getter, preparing}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+        turn = preparing.result()
+    finally:
+        preparing.cancel()
+
+    if turn.early_result is not None:
+        parsed = turn.early_result
+        yield "token", {"text": str(parsed.get("message") or "")}
+    else:
+        registry = get_registry(settings)
+        extractor = MessageFieldExtractor()
+        chunks: list[str] = []
+        # Chunks summed into one message: usage_metadata arrives on (and adds up across) the chunks.
+        streamed = None
+
+        def open_stream() -> AsyncIterator[Any]:
+            metrics.LLM_CALLS.inc()
+            return registry.llm.astream(turn.messages, **registry.llm_stream_kwargs)
+
+        # The guard holds an LLM concurrency slot for the whole stream. Sent tokens cannot be
+        # taken back, so it only retries until the first chunk; a failure after that fails over.
+        broke_off = False
+        try:
+            with span("llm"):
+                async with contextlib.aclosing(registry.llm_guard.stream(open_stream)) as stream:
+                    async for chunk in stream:
+                        streamed = chunk if streamed is None else streamed + chunk
+                        text = chunk.content if isinstance(chunk.content, str) else ""
+                        chunks.append(text)
+                        delta = extractor.feed(text)
+                        if delta:
+                            yield "token", {"text": delta}
+            metrics.record_token_usage(streamed)
+            apply_token_usage(turn, streamed)
+            parsed = resolve_turn(turn, "".join(chunks))
+        except UpstreamUnavailable:
+            parsed = failover(turn)
+            if extractor.text:
+                # Part of the LLM's message already went out: tell the client to discard it.
+                broke_off = True
+                yield "fallback", {"reason": "llm_unavailable"}
+        if not extractor.text or broke_off:
+            # Nothing streamed (unparseable output or failover): send the final message whole.
+            yield "token", {"text": str(parsed.get("message") or "")}
+
+    yield "final", await finish_turn(turn, parsed)
+
+
+def handle_chat(message: str, order_id: str | None, session_id: str | None, settings: Settings) -> dict[str, Any]:
+    """Synchronous wrapper around ahandle_chat for scripts and other non-async callers."""
+    return asyncio.run(ahandle_chat(message, order_id, session_id, settings))
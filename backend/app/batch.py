@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterable
+
+from pydantic import ValidationError
+
+from . import metrics
+from .agent import (
+    FUSION_CANDIDATES,
+    POLICY_SNIPPETS_K,
+    assemble_turn,
+    complete_turn,
+    fuse_snippets,
+    get_conversation_history,
+    get_session_summary,
+    get_or_create_session,
+    get_orders,
+    lexical_candidates,
+    lexical_is_decisive,
+    lexical_snippets,
+    validate_message,
+    validate_order_id,
+)
+from .config import Settings
+from .models import ChatRequest, ChatResponse
+from .rag import search_by_vectors
+from .registry import get_registry
+from .sql import ComplaintRepository, get_pool
+from .tracing import span
+
+
+@dataclass
+class _BatchItem:
+    index: int
+    message: str
+    order_id: str | None
+    session_id: str | None
+
+
+async def arun_batch(
+    items: Iterable[ChatRequest | Exception], settings: Settings, concurrency: int | None = None
+) -> AsyncIterator[dict[str, Any]]:
+    """Triage many chat requests; yields one result per input, in input order.
+
+    Items are processed in chunks: each chunk gets one embeddings call, one FAISS
+    search, one order query and one complaint query (retrieval is fused with BM25
+    as in the single-request path), then its LLM calls run with
+    at most ``concurrency`` in flight. Inputs that failed to parse upstream can be
+    passed as exceptions and are reported as errors in place.
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.batch_concurrency)
+    iterator = iter(items)
+    offset = 0
+    while True:
+        chunk = list(itertools.islice(iterator, settings.batch_chunk_size))
+        if not chunk:
+            return
+        async for result in _run_chunk(chunk, offset, settings, semaphore):
+            yield result
+        offset += len(chunk)
+
+
+async def _run_chunk(
+    chunk: list[ChatRequest | Exception], offset: int, settings: Settings, semaphore: asyncio.Semaphore
+) -> AsyncIterator[dict[str, Any]]:
+    errors: dict[int, str] = {}
+    valid: list[_BatchItem] = []
+    for position, item in enumerate(chunk, start=offset):
+        if isinstance(item, Exception):
+            errors[position] = str(item)
+            continue
+        try:
+            valid.append(
+                _BatchItem(
+                    position,
+                    validate_message(item.message),
+                    validate_order_id(item.order_id),
+                    item.session_id,
+                )
+            )
+        except ValueError as exc:
+            errors[position] = str(exc)
+
+    registry = get_registry(settings)
+    vstore = await asyncio.to_thread(registry.vector_store)
+    snapshot = registry.policies.current()
+    order_ids = [item.order_id for item in valid if item.order_id]
+    repository = ComplaintRepository(settings.db_path, pool=get_pool(settings))
+
+    lexical = {item.index: lexical_candidates(item.message, snapshot, settings) for item in valid}
+    # Decisive lexical matches need no embedding; everything else is embedded in one call.
+    to_embed = [item for item in valid if not lexical_is_decisive(lexical[item.index], settings)]
+
+    async def embed() -> list[list[float]] | None:
+        if not to_embed:
+            return []
+        try:
+            with span("batch_embed"):
+                return await vstore.embeddings.aembed_documents([item.message for item in to_embed])
+        except Exception:
+            return None  # Items with lexical candidates still get answered below.
+
+    vectors, orders, histories = await asyncio.gather(
+        embed(),
+        asyncio.to_thread(get_orders, order_ids, settings),
+        asyncio.to_thread(repository.histories_for_orders, order_ids),
+    )
+
+    retrieved: dict[int, tuple[list[float] | None, list]] = {}
+    if vectors:
+        k = FUSION_CANDIDATES if settings.retrieval_mode != "vector" else POLICY_SNIPPETS_K
+        with span("batch_search"):
+            dense = search_by_vectors(vstore, vectors, k)
+        for item, vector, docs in zip(to_embed, vectors, dense):
+            retrieved[item.index] = (vector, fuse_snippets(docs, lexical[item.index], snapshot))
+        metrics.RETRIEVALS.inc(len(to_embed), path="hybrid" if settings.retrieval_mode != "vector" else "vector")
+    for item in valid:
+        if item.index in retrieved:
+            continue
+        if lexical[item.index]:
+            retrieved[item.index] = (None, lexical_snippets(lexical[item.index], snapshot))
+            metrics.RETRIEVALS.inc(path="lexical" if vectors is not None else "lexical_fallback")
+        else:
+            errors[item.index] = "Policy retrieval failed: embeddings backend unavailable."
+
+    async def run_one(item: _BatchItem, vector: list[float] | None, docs) -> dict[str, Any]:
+        async with semaphore:
+            session_id = get_or_create_session(item.session_id)
+            conversation_history = await asyncio.to_thread(get_conversation_history, session_id, settings)
+            summary = await asyncio.to_thread(get_session_summary, session_id, settings)
+            turn = assemble_turn(
+                item.message,
+                session_id,
+                settings,
+                conversation_history,
+                orders.get(item.order_id) if item.order_id else None,
+                histories.get(item.order_id) if item.order_id else None,
+                vector,
+                docs,
+                snapshot,
+                summary,
+            )
+            return await complete_turn(turn)
+
+    if registry.response_cache is not None:
+        await registry.response_cache.apull_shared(snapshot.version)
+    tasks = {
+        item.index: asyncio.create_task(run_one(item, *retrieved[item.index]))
+        for item in valid
+        if item.index in retrieved
+    }
+    try:
+        for position in range(offset, offset + len(chunk)):
+            if position in errors:
+                yield {"index": position, "error": errors[position]}
+                continue
+            try:
+                result = await tasks[position]
+                yield {"index": position, "response": ChatResponse(**result).model_dump()}
+            except Exception as exc:  # one failed item must not abort the whole batch
+                yield {"index": position, "error": str(exc) or type(exc).__name__}
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+
+def read_jsonl(lines: Iterable[str]) -> Iterable[ChatRequest | Exception]:
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield ChatRequest.model_validate_json(line)
+        except ValidationError as exc:
+            yield ValueError(f"Invalid request: {exc.errors()[0]['msg']}")
+
+
+async def _main(args: argparse.Namespace) -> None:
+    from .config import get_settings
+
+    settings = get_settings()
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    sink = sys.stdout if not args.output else open(args.output, "w", encoding="utf-8")
+    try:
+        async for result in arun_batch(read_jsonl(source), settings, args.concurrency):
+            sink.write(json.dumps(result) + "\n")
+            sink.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Bulk complaint triage: JSONL ChatRequests in, NDJSON results out.")
+    parser.add_argument("input", help="JSONL file with one ChatRequest per line, or - for stdin.")
+    parser.add_argument("-o", "--output", type=Path, help="Write NDJSON results here instead of stdout.")
+    parser.add_argument("--concurrency", type=int, help="Maximum concurrent LLM calls (default APP_BATCH_CONCURRENCY).")
+    args = parser.parse_args()
+
+    load_dotenv()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+from .shared_cache import SharedCache
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def _count_band(count: int) -> str:
+    return "2+" if count >= 2 else str(count)
+
+
+def order_bucket(
+    order: dict[str, Any] | None, complaint_count: int, customer_count: int = 0, restaurant_count: int = 0
+) -> str:
+    """Coarse order state: responses are only reused between orders in the same bucket.
+
+    Besides the order's status and its own complaints, the bucket holds the
+    customer's and restaurant's complaint totals (0/1/2+), which the prompt
+    can escalate on.
+    """
+    if order is None:
+        return "no-order"
+    return (
+        f"{order['status']}:{_count_band(complaint_count)}"
+        f":customer={_count_band(customer_count)}:restaurant={_count_band(restaurant_count)}"
+    )
+
+
+class ResponseCache:
+    """Semantic LRU + TTL cache of LLM decisions keyed on query embedding similarity.
+
+    Entries are partitioned by order bucket; a lookup hits when the cosine
+    similarity to a cached query in the same partition reaches the threshold.
+    The whole cache is dropped when the policy version changes.
+
+    With ``shared``, stored decisions are also published to the cache shared by
+    all worker processes (queued to its writer thread), and ``apull_shared``
+    merges in the decisions other workers published, reading the shared file in
+    a thread at most every ``shared_pull_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        similarity_threshold: float,
+        shared: SharedCache | None = None,
+        shared_pull_interval: float = 0.05,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.shared = shared
+        self.shared_pull_interval = shared_pull_interval
+        self._entries: OrderedDict[int, tuple[str, np.ndarray, dict[str, Any], float]] = OrderedDict()
+        self._partitions: dict[str, set[int]] = {}
+        self._version: str | None = None
+        self._next_id = 0
+        # Highest shared row already merged, and when the shared file was last read.
+        self._shared_seen = 0
+        self._pulled_at = float("-inf")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector) -> "np.ndarray":
+        import numpy as np
+
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm else array
+
+    def _remove(self, entry_id: int) -> None:
+        bucket, _, _, _ = self._entries.pop(entry_id)
+        ids = self._partitions[bucket]
+        ids.discard(entry_id)
+        if not ids:
+            del self._partitions[bucket]
+
+    def _check_version(self, version: str) -> None:
+        if self._version != version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._partitions.clear()
+            self._version = version
+            self._shared_seen = 0
+            self._pulled_at = float("-inf")
+
+    def _add(self, bucket: str, vector: "np.ndarray", response: dict[str, Any], stored_at: float) -> None:
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (bucket, vector, response, stored_at)
+        self._partitions.setdefault(bucket, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def apull_shared(self, version: str) -> None:
+        """Merge in decisions other workers published since the last pull. Call before ``lookup``."""
+        if self.shared is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            if now - self._pulled_at < self.shared_pull_interval:
+                return
+            self._pulled_at = now  # Concurrent callers skip rather than queue up behind this read.
+            after = self._shared_seen
+        rows = await asyncio.to_thread(self.shared.responses_since, version, after)
+        if not rows:
+            return
+        offset = time.monotonic() - time.time()  # Shared rows carry wall-clock times.
+        with self._lock:
+            if self._version != version:
+                return
+            for row_id, bucket, vector, response, created_at in rows:
+                if row_id > self._shared_seen:
+                    self._add(bucket, vector, response, created_at + offset)
+            self._shared_seen = max(self._shared_seen, rows[-1][0])
+
+    def lookup(self, vector, bucket: str, version: str) -> dict[str, Any] | None:
+        query = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            ids = []
+            for entry_id in list(self._partitions.get(bucket, ())):
+                if now - self._entries[entry_id][3] > self.ttl_seconds:
+                    self._remove(entry_id)
+                else:
+                    ids.append(entry_id)
+            if ids:
+                import numpy as np
+
+                matrix = np.stack([self._entries[entry_id][1] for entry_id in ids])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    entry_id = ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return copy.deepcopy(self._entries[entry_id][2])
+            self.misses += 1
+            return None
+
+    def store(self, vector, bucket: str, version: str, response: dict[str, Any]) -> None:
+        with self._lock:
+            self._check_version(version)
+            normalized = self._normalize(vector)
+            self._add(bucket, normalized, copy.deepcopy(response), time.monotonic())
+            if self.shared is not None:
+                self.shared.put_response(version, bucket, normalized, response)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
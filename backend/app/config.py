@@ -6,6 +6,10 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parents[1]
 
 
+# Oldest Azure api-version that accepts each output mode's response_format.
+OUTPUT_MODE_MIN_API_VERSION = {"prompt": "", "json_object": "2023-12-01", "json_schema": "2024-08-01"}
+
+
 @dataclass(frozen=True)
 class Settings:
     azure_api_key: str
@@ -16,9 +20,89 @@ class Settings:
     hf_embeddings_model: str | None
     db_path: Path
     data_dir: Path
+    index_dir: Path
+    text_to_sql_analytics: bool = False
+    db_pool_size: int = 8
+    db_mmap_size_mb: int = 256
+    db_cache_size_mb: int = 16
+    session_backend: str = "memory"
+    session_db_path: Path = BASE_DIR / "data" / "sessions.db"
+    session_max_messages: int = 10
+    session_ttl_seconds: float = 3600.0
+    session_max_sessions: int = 10000
+    response_cache_enabled: bool = False
+    response_cache_max_entries: int = 1024
+    response_cache_ttl_seconds: float = 900.0
+    response_cache_similarity: float = 0.95
+    fast_path_enabled: bool = False
+    fast_path_min_score: int = 2
+    llm_backend: str = "azure"
+    llm_output_mode: str = "prompt"
+    fake_llm_latency_ms: float = 0.0
+    fake_embeddings_latency_ms: float = 0.0
+    fake_llm_error_rate: float = 0.0
+    metrics_enabled: bool = True
+    policy_reload_interval_seconds: float = 2.0
+    batch_concurrency: int = 8
+    batch_chunk_size: int = 256
+    embedding_cache_max_entries: int = 4096
+    embedding_cache_path: Path | None = None
+    shared_cache_path: Path | None = None
+    embedding_batch_window_ms: float = 3.0
+    embedding_batch_max_size: int = 64
+    retrieval_mode: str = "hybrid"
+    lexical_min_score: float = 4.0
+    lexical_margin: float = 2.0
+    index_type: str = "flat"
+    index_ann_min_docs: int = 10000
+    index_nlist: int = 0
+    index_nprobe: int = 16
+    index_hnsw_m: int = 32
+    index_hnsw_ef_search: int = 64
+    index_pq_m: int = 48
+    prompt_token_budget: int = 3000
+    session_summary_max_tokens: int = 300
+    tokenizer_encoding: str = "o200k_base"
+    llm_max_concurrency: int = 32
+    llm_queue_timeout_seconds: float = 2.0
+    llm_timeout_seconds: float = 20.0
+    embeddings_max_concurrency: int = 16
+    embeddings_timeout_seconds: float = 5.0
+    upstream_max_retries: int = 2
+    upstream_retry_base_seconds: float = 0.25
+    upstream_retry_max_seconds: float = 4.0
+    circuit_failure_threshold: int = 5
+    circuit_reset_seconds: float = 30.0
+    warmup_prime_upstreams: bool = True
+    outcome_recording_enabled: bool = False
+    outcome_journal_dir: Path = BASE_DIR / "data" / "outcomes"
+    outcome_queue_size: int = 10000
+    outcome_batch_size: int = 500
+    outcome_flush_interval_ms: float = 200.0
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name, "").strip().lower()
+    if not value:
+        return default
+    return value in {"1", "true", "yes", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name, "").strip()
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name, "").strip()
+    return float(value) if value else default
 
 
 def get_settings() -> Settings:
+    llm_backend = os.getenv("APP_LLM_BACKEND", "azure").strip().lower() or "azure"
+    if llm_backend not in {"azure", "fake"}:
+        raise RuntimeError("APP_LLM_BACKEND must be 'azure' or 'fake'.")
+
     azure_api_key = os.getenv("AZURE_OPENAI_API_KEY", "").strip()
     azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "").strip()
     azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "").strip()
@@ -26,19 +110,46 @@ def get_settings() -> Settings:
     azure_embeddings_deployment = os.getenv("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT", "").strip()
     hf_embeddings_model = os.getenv("HF_EMBEDDINGS_MODEL", "").strip()
 
-    if not azure_api_key or not azure_endpoint or not azure_api_version or not azure_deployment:
-        raise RuntimeError(
-            "Missing Azure OpenAI configuration. "
-            "Set AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, "
-            "AZURE_OPENAI_API_VERSION, AZURE_OPENAI_DEPLOYMENT."
-        )
-    if not azure_embeddings_deployment and not hf_embeddings_model:
+    # The fake backend (benchmarks, offline development) needs no credentials.
+    if llm_backend == "azure":
+        if not azure_api_key or not azure_endpoint or not azure_api_version or not azure_deployment:
+            raise RuntimeError(
+                "Missing Azure OpenAI configuration. "
+                "Set AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, "
+                "AZURE_OPENAI_API_VERSION, AZURE_OPENAI_DEPLOYMENT."
+            )
+        if not azure_embeddings_deployment and not hf_embeddings_model:
+            raise RuntimeError(
+                "Missing embeddings configuration. Set either "
+                "AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT or HF_EMBEDDINGS_MODEL."
+            )
+
+    llm_output_mode = os.getenv("APP_LLM_OUTPUT_MODE", "prompt").strip().lower() or "prompt"
+    if llm_output_mode not in OUTPUT_MODE_MIN_API_VERSION:
+        raise RuntimeError("APP_LLM_OUTPUT_MODE must be 'prompt', 'json_object' or 'json_schema'.")
+    min_api_version = OUTPUT_MODE_MIN_API_VERSION[llm_output_mode]
+    if llm_backend == "azure" and azure_api_version[:10] < min_api_version:
         raise RuntimeError(
-            "Missing embeddings configuration. Set either "
-            "AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT or HF_EMBEDDINGS_MODEL."
+            f"APP_LLM_OUTPUT_MODE={llm_output_mode} needs AZURE_OPENAI_API_VERSION {min_api_version} or later "
+            f"(got {azure_api_version}). Use APP_LLM_OUTPUT_MODE=prompt for older api-versions."
         )
 
+    session_backend = os.getenv("APP_SESSION_BACKEND", "memory").strip().lower() or "memory"
+    if session_backend not in {"memory", "sqlite"}:
+        raise RuntimeError("APP_SESSION_BACKEND must be 'memory' or 'sqlite'.")
+
+    retrieval_mode = os.getenv("APP_RETRIEVAL_MODE", "hybrid").strip().lower() or "hybrid"
+    if retrieval_mode not in {"vector", "hybrid", "lexical"}:
+        raise RuntimeError("APP_RETRIEVAL_MODE must be 'vector', 'hybrid' or 'lexical'.")
+
+    index_type = os.getenv("APP_INDEX_TYPE", "flat").strip().lower() or "flat"
+    if index_type not in {"flat", "ivf", "hnsw", "pq"}:
+        raise RuntimeError("APP_INDEX_TYPE must be 'flat', 'ivf', 'hnsw' or 'pq'.")
+
     db_path_env = os.getenv("APP_DB_PATH", str(BASE_DIR / "data" / "complaints.db"))
+    index_dir_env = os.getenv("APP_INDEX_DIR", str(BASE_DIR / "data" / "index"))
+    embedding_cache_path = os.getenv("APP_EMBEDDING_CACHE_PATH", "").strip()
+    shared_cache_path = os.getenv("APP_SHARED_CACHE_PATH", "").strip()
 
     return Settings(
         azure_api_key=azure_api_key,
@@ -49,4 +160,63 @@ def get_settings() -> Settings:
         hf_embeddings_model=hf_embeddings_model or None,
         db_path=Path(db_path_env),
         data_dir=BASE_DIR / "data",
+        index_dir=Path(index_dir_env),
+        text_to_sql_analytics=_env_bool("APP_TEXT_TO_SQL_ANALYTICS"),
+        db_pool_size=_env_int("APP_DB_POOL_SIZE", 8),
+        db_mmap_size_mb=_env_int("APP_DB_MMAP_SIZE_MB", 256),
+        db_cache_size_mb=_env_int("APP_DB_CACHE_SIZE_MB", 16),
+        session_backend=session_backend,
+        session_db_path=Path(os.getenv("APP_SESSION_DB_PATH", str(BASE_DIR / "data" / "sessions.db"))),
+        session_max_messages=_env_int("APP_SESSION_MAX_MESSAGES", 10),
+        session_ttl_seconds=_env_float("APP_SESSION_TTL_SECONDS", 3600.0),
+        session_max_sessions=_env_int("APP_SESSION_MAX_SESSIONS", 10000),
+        response_cache_enabled=_env_bool("APP_RESPONSE_CACHE"),
+        response_cache_max_entries=_env_int("APP_RESPONSE_CACHE_MAX_ENTRIES", 1024),
+        response_cache_ttl_seconds=_env_float("APP_RESPONSE_CACHE_TTL_SECONDS", 900.0),
+        response_cache_similarity=_env_float("APP_RESPONSE_CACHE_SIMILARITY", 0.95),
+        fast_path_enabled=_env_bool("APP_FAST_PATH"),
+        fast_path_min_score=_env_int("APP_FAST_PATH_MIN_SCORE", 2),
+        llm_backend=llm_backend,
+        llm_output_mode=llm_output_mode,
+        fake_llm_latency_ms=_env_float("APP_FAKE_LLM_LATENCY_MS", 0.0),
+        fake_embeddings_latency_ms=_env_float("APP_FAKE_EMBEDDINGS_LATENCY_MS", 0.0),
+        fake_llm_error_rate=_env_float("APP_FAKE_LLM_ERROR_RATE", 0.0),
+        metrics_enabled=_env_bool("APP_METRICS_ENABLED", True),
+        policy_reload_interval_seconds=_env_float("APP_POLICY_RELOAD_INTERVAL_SECONDS", 2.0),
+        batch_concurrency=_env_int("APP_BATCH_CONCURRENCY", 8),
+        batch_chunk_size=_env_int("APP_BATCH_CHUNK_SIZE", 256),
+        embedding_cache_max_entries=_env_int("APP_EMBEDDING_CACHE_MAX_ENTRIES", 4096),
+        embedding_cache_path=Path(embedding_cache_path) if embedding_cache_path else None,
+        shared_cache_path=Path(shared_cache_path) if shared_cache_path else None,
+        embedding_batch_window_ms=_env_float("APP_EMBEDDING_BATCH_WINDOW_MS", 3.0),
+        embedding_batch_max_size=_env_int("APP_EMBEDDING_BATCH_MAX_SIZE", 64),
+        retrieval_mode=retrieval_mode,
+        lexical_min_score=_env_float("APP_LEXICAL_MIN_SCORE", 4.0),
+        lexical_margin=_env_float("APP_LEXICAL_MARGIN", 2.0),
+        index_type=index_type,
+        index_ann_min_docs=_env_int("APP_INDEX_ANN_MIN_DOCS", 10000),
+        index_nlist=_env_int("APP_INDEX_NLIST", 0),
+        index_nprobe=_env_int("APP_INDEX_NPROBE", 16),
+        index_hnsw_m=_env_int("APP_INDEX_HNSW_M", 32),
+        index_hnsw_ef_search=_env_int("APP_INDEX_HNSW_EF_SEARCH", 64),
+        index_pq_m=_env_int("APP_INDEX_PQ_M", 48),
+        prompt_token_budget=_env_int("APP_PROMPT_TOKEN_BUDGET", 3000),
+        session_summary_max_tokens=_env_int("APP_SESSION_SUMMARY_MAX_TOKENS", 300),
+        tokenizer_encoding=os.getenv("APP_TOKENIZER_ENCODING", "o200k_base").strip() or "o200k_base",
+        llm_max_concurrency=_env_int("APP_LLM_MAX_CONCURRENCY", 32),
+        llm_queue_timeout_seconds=_env_float("APP_LLM_QUEUE_TIMEOUT_SECONDS", 2.0),
+        llm_timeout_seconds=_env_float("APP_LLM_TIMEOUT_SECONDS", 20.0),
+        embeddings_max_concurrency=_env_int("APP_EMBEDDINGS_MAX_CONCURRENCY", 16),
+        embeddings_timeout_seconds=_env_float("APP_EMBEDDINGS_TIMEOUT_SECONDS", 5.0),
+        upstream_max_retries=_env_int("APP_UPSTREAM_MAX_RETRIES", 2),
+        upstream_retry_base_seconds=_env_float("APP_UPSTREAM_RETRY_BASE_SECONDS", 0.25),
+        upstream_retry_max_seconds=_env_float("APP_UPSTREAM_RETRY_MAX_SECONDS", 4.0),
+        circuit_failure_threshold=_env_int("APP_CIRCUIT_FAILURE_THRESHOLD", 5),
+        circuit_reset_seconds=_env_float("APP_CIRCUIT_RESET_SECONDS", 30.0),
+        warmup_prime_upstreams=_env_bool("APP_WARMUP_PRIME_UPSTREAMS", True),
+        outcome_recording_enabled=_env_bool("APP_OUTCOME_RECORDING", False),
+        outcome_journal_dir=Path(os.getenv("APP_OUTCOME_JOURNAL_DIR", str(BASE_DIR / "data" / "outcomes"))),
+        outcome_queue_size=_env_int("APP_OUTCOME_QUEUE_SIZE", 10000),
+        outcome_batch_size=_env_int("APP_OUTCOME_BATCH_SIZE", 500),
+        outcome_flush_interval_ms=_env_float("APP_OUTCOME_FLUSH_INTERVAL_MS", 200.0),
     )
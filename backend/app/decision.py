@@ -0,0 +1,110 @@
+import json
+import re
+from typing import Any
+
+from pydantic import ValidationError
+
+from .models import LLMDecision
+
+
+# Strict structured-output schema for LLMDecision: every key required, nothing else allowed.
+DECISION_JSON_SCHEMA = {
+    "name": "complaint_decision",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "status": {"type": "string"},
+            "resolution": {"type": ["string", "null"]},
+            "message": {"type": "string"},
+            "escalate": {"type": "boolean"},
+            "policy_citations": {"type": "array", "items": {"type": "string"}},
+            "next_steps": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["status", "resolution", "message", "escalate", "policy_citations", "next_steps"],
+        "additionalProperties": False,
+    },
+}
+
+_DECODER = json.JSONDecoder()
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def response_format(mode: str) -> dict[str, Any] | None:
+    """The chat completions ``response_format`` for an output mode; None leaves it to the prompt."""
+    if mode == "json_object":
+        return {"type": "json_object"}
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": DECISION_JSON_SCHEMA}
+    return None
+
+
+def parse_decision(raw: str) -> tuple[dict[str, Any] | None, str]:
+    """Validate model output as an LLMDecision: (decision, outcome), outcome being ok, repaired or failed.
+
+    Well-formed output is parsed and validated in one pass by pydantic's JSON
+    parser. Anything else gets one local repair attempt (see repair_json).
+    """
+    try:
+        return LLMDecision.model_validate_json(raw).model_dump(), "ok"
+    except ValidationError:
+        pass
+    candidate = repair_json(raw)
+    if candidate is not None:
+        try:
+            return LLMDecision.model_validate(candidate).model_dump(), "repaired"
+        except ValidationError:
+            pass
+    return None, "failed"
+
+
+def repair_json(raw: str) -> dict[str, Any] | None:
+    """Recover the JSON object from the usual damage: surrounding prose or code fences, trailing commas, truncation."""
+    start = raw.find("{")
+    if start == -1:
+        return None
+    text = raw[start:]
+    # A cut-off object may end inside a key or value: also try dropping the last, partial member.
+    last_comma = text.rfind(",")
+    candidates = (
+        text,
+        _TRAILING_COMMA.sub(r"\1", text),
+        _close_truncated(text),
+        _close_truncated(text[:last_comma]) if last_comma != -1 else None,
+    )
+    for candidate in candidates:
+        if candidate is None:
+            continue
+        try:
+            value, _ = _DECODER.raw_decode(candidate)
+        except json.JSONDecodeError:
+            continue
+        return value if isinstance(value, dict) else None
+    return None
+
+
+def _close_truncated(text: str) -> str | None:
+    """Close the string, arrays and objects left open by output cut off at the token limit."""
+    stack = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            if not stack:
+                return None
+            stack.pop()
+    if not stack:
+        return None  # Balanced already: truncation is not what went wrong.
+    tail = text + ('"' if in_string else "")
+    return tail.rstrip().rstrip(",") + "".join(reversed(stack))
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Iterator
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+POLICY_ID_PATTERN = re.compile(r"\[(POL-\d+)\]")
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-words embeddings with a simulated per-call latency.
+
+    Texts sharing words get similar vectors, so retrieval and semantic caching
+    behave plausibly without a model or network.
+    """
+
+    def __init__(self, size: int = 256, latency_ms: float = 0.0):
+        self.size = size
+        self.latency_ms = latency_ms
+
+    def _vector(self, text: str) -> list[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            bucket = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "little")
+            vector[bucket % self.size] += 1.0
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers with a well-formed decision citing the first policy in the prompt.
+
+    ``error_rate`` makes that share of calls fail like an unreachable endpoint, to exercise failover.
+    """
+
+    latency_ms: float = 0.0
+    chunk_size: int = 16
+    error_rate: float = 0.0
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and random.random() < self.error_rate:
+            import httpx
+            import openai
+
+            raise openai.APIConnectionError(request=httpx.Request("POST", "http://fake-llm/chat/completions"))
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-complaint-agent"
+
+    def _reply(self, messages: list[BaseMessage]) -> str:
+        prompt = str(messages[-1].content) if messages else ""
+        match = POLICY_ID_PATTERN.search(prompt)
+        policy_id = match.group(1) if match else None
+        return json.dumps(
+            {
+                "status": "handled" if policy_id else "needs_human",
+                "resolution": "refund" if policy_id else None,
+                "message": (
+                    "I'm sorry about the trouble with your order. Based on our policy I can offer you a "
+                    "refund for the affected items, which will appear in your account in 3-5 business days. "
+                    "Would you prefer a refund or a redelivery?"
+                ),
+                "escalate": policy_id is None,
+                "policy_citations": [policy_id] if policy_id else [],
+                "next_steps": ["Confirm refund or redelivery preference"],
+            }
+        )
+
+    def _message(self, messages: list[BaseMessage], content: str) -> AIMessage:
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = len(content) // 4
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def _usage_chunk(self, messages: list[BaseMessage], content: str) -> ChatGenerationChunk:
+        # Like a stream with include_usage: a final empty chunk carries the token counts.
+        usage = self._message(messages, content).usage_metadata
+        return ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_ms / 1000)
+        self._maybe_fail()
+        content = self._reply(messages)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        self._maybe_fail()
+        content = self._reply(messages)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        content = self._reply(messages)
+        chunks = [content[i : i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+        for chunk in chunks:
+            time.sleep(self.latency_ms / 1000 / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+        yield self._usage_chunk(messages, content)
+
+    async def _astream(
+        self, messages, stop=None, run_manager=None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        self._maybe_fail()
+        content = self._reply(messages)
+        chunks = [content[i : i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(self.latency_ms / 1000 / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+        yield self._usage_chunk(messages, content)
@@ -0,0 +1,101 @@
+import math
+import re
+from collections import Counter
+from typing import Any
+
+from langchain_core.documents import Document
+
+from .matcher import normalize_text
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it my of on or our so that the their "
+    "then this to was we were with you your me".split()
+)
+# Curated policy keywords count this many times over a word in the KB prose.
+KEYWORD_BOOST = 2
+RRF_K = 60
+
+
+def _stem(token: str) -> str:
+    """Crude suffix stripping so 'sealed'/'seals'/'seal' and 'smells'/'smelling' share a term."""
+    for suffix, min_length in (("ing", 6), ("ed", 5), ("es", 5), ("s", 4)):
+        if len(token) >= min_length and token.endswith(suffix) and not token.endswith("ss"):
+            return token[: -len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        _stem(token)
+        for token in TOKEN_PATTERN.findall(normalize_text(text).replace("'", ""))
+        if token not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """In-process Okapi BM25 over the knowledge base, with each entry's policy keywords folded in."""
+
+    def __init__(
+        self,
+        docs: dict[str, Document],
+        policies: list[dict[str, Any]],
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.k1 = k1
+        self.b = b
+        keywords: dict[str, list[str]] = {}
+        for policy in policies:
+            keywords.setdefault(policy.get("policy_id"), []).extend(policy.get("keywords", []))
+
+        self.doc_ids: list[str] = []
+        lengths: list[int] = []
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        for position, (doc_id, doc) in enumerate(docs.items()):
+            terms = tokenize(f"{doc.metadata.get('title', '')} {doc.page_content}")
+            for keyword in keywords.get(doc.metadata.get("policy_id"), []):
+                terms.extend(tokenize(keyword) * KEYWORD_BOOST)
+            for term, count in Counter(terms).items():
+                self._postings.setdefault(term, []).append((position, count))
+            self.doc_ids.append(doc_id)
+            lengths.append(len(terms))
+
+        total = len(self.doc_ids)
+        average = (sum(lengths) / total) if total else 0.0
+        self._norms = [k1 * (1 - b + b * length / average) if average else k1 for length in lengths]
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """Top ``k`` (doc_id, score) pairs, best first; documents sharing no term are omitted."""
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for position, count in self._postings[term]:
+                scores[position] = scores.get(position, 0.0) + idf * count * (self.k1 + 1) / (
+                    count + self._norms[position]
+                )
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.doc_ids[position], score) for position, score in best]
+
+
+def is_decisive(results: list[tuple[str, float]], min_score: float, margin: float) -> bool:
+    """True when the top lexical hit is strong and clearly ahead of the runner-up."""
+    if not results or results[0][1] < min_score:
+        return False
+    return len(results) == 1 or results[0][1] >= margin * results[1][1]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[str]:
+    """Merge ranked ID lists by summed 1 / (k + rank)."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
@@ -1,27 +1,204 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import Any
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 
+from . import metrics, tracing
 from .config import get_settings
-from .models import ChatRequest, ChatResponse
-from .agent import handle_chat
+from .models import AnalyticsRequest, AnalyticsResponse, BatchChatRequest, ChatRequest, ChatResponse
+from .agent import ahandle_chat, astream_chat, validate_message, validate_order_id
+from .batch import arun_batch
+from .registry import close_registry, current_registry, get_registry
+from .sql import arun_text_to_sql, get_pool
+from .startup import StartupReport, warm_up
+from .streaming import sse_event
 
 
 load_dotenv()
-app = FastAPI(title="Zomato RAG Complaint Agent")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so /health answers at once; /ready reports when the clients,
+    # policy index and pools are in place. Requests before that build what they need on demand.
+    app.state.startup = StartupReport()
+    warmup = None
+    try:
+        settings = get_settings()
+    except RuntimeError as exc:
+        app.state.startup.finish(str(exc))  # Misconfiguration is also reported per request by /chat.
+    else:
+        if settings.metrics_enabled:
+            metrics.enable()
+            tracing.add_listener(metrics.observe_stage)
+        warmup = asyncio.create_task(warm_up(settings, app.state.startup))
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+        with suppress(asyncio.CancelledError):
+            await warmup
+    if metrics.is_enabled():
+        tracing.remove_listener(metrics.observe_stage)
+        metrics.enable(False)
+    await close_registry()
+
+
+app = FastAPI(title="Zomato RAG Complaint Agent", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    request_id = tracing.new_request_id(request.headers.get(tracing.REQUEST_ID_HEADER))
+    response = await call_next(request)
+    response.headers[tracing.REQUEST_ID_HEADER] = request_id
+    return response
 
 
 @app.get("/health")
 def health_check() -> dict[str, str]:
+    """Liveness: the process is up. Use /ready to decide whether to route traffic here."""
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def readiness_check() -> JSONResponse:
+    report = getattr(app.state, "startup", None)
+    if report is None:
+        return JSONResponse({"ready": False, "error": "not started"}, status_code=503)
+    return JSONResponse(report.as_dict(), status_code=200 if report.ready else 503)
+
+
+@app.get("/stats")
+def stats() -> dict[str, dict[str, Any]]:
+    try:
+        settings = get_settings()
+        registry = get_registry(settings)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+    stats = {
+        "db_pool": get_pool(settings).stats(),
+        "sessions": registry.sessions.stats(),
+        "embedding_cache": registry.embeddings.stats(),
+        "llm": registry.llm_guard.stats(),
+        "embeddings": registry.embeddings_guard.stats(),
+    }
+    if registry.response_cache is not None:
+        stats["response_cache"] = registry.response_cache.stats()
+    if registry.shared_cache is not None:
+        stats["shared_cache"] = registry.shared_cache.stats()
+    if registry.outcomes is not None:
+        stats["outcomes"] = registry.outcomes.stats()
+    return stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint() -> PlainTextResponse:
+    if not metrics.is_enabled():
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    report = getattr(app.state, "startup", None)
+    if report is not None:
+        metrics.READY.set(1 if report.ready else 0)
+        for phase, seconds in report.phases.items():
+            metrics.STARTUP_SECONDS.set(seconds, phase=phase)
+    registry = current_registry()
+    if registry is not None:
+        for field, value in registry.sessions.stats().items():
+            metrics.SESSION_STORE.set(value, field=field)
+        for field, value in registry.embeddings.stats().items():
+            metrics.EMBEDDING_CACHE.set(value, field=field)
+        if registry.response_cache is not None:
+            for field, value in registry.response_cache.stats().items():
+                metrics.RESPONSE_CACHE.set(value, field=field)
+        if registry.shared_cache is not None:
+            for field, value in registry.shared_cache.stats().items():
+                metrics.SHARED_CACHE.set(value, field=field)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest) -> ChatResponse:
+async def chat(request: ChatRequest) -> ChatResponse:
+    started = time.perf_counter()
     try:
         settings = get_settings()
-        result = handle_chat(request.message, request.order_id, request.session_id, settings)
+        result = await ahandle_chat(request.message, request.order_id, request.session_id, settings)
+        metrics.CHAT_REQUESTS.inc(outcome="ok")
         return ChatResponse(**result)
     except ValueError as exc:
+        metrics.CHAT_REQUESTS.inc(outcome="bad_request")
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except RuntimeError as exc:
+        metrics.CHAT_REQUESTS.inc(outcome="error")
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+    finally:
+        metrics.CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started)
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """Server-Sent Events: progress events, message tokens as generated, then the final response."""
+    try:
+        settings = get_settings()
+        # Validate up front so bad input is a 400, not an error event mid-stream.
+        validate_message(request.message)
+        validate_order_id(request.order_id)
+    except ValueError as exc:
+        metrics.CHAT_REQUESTS.inc(outcome="bad_request")
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except RuntimeError as exc:
+        metrics.CHAT_REQUESTS.inc(outcome="error")
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+    async def events():
+        started = time.perf_counter()
+        try:
+            async for event, data in astream_chat(
+                request.message, request.order_id, request.session_id, settings
+            ):
+                if event == "final":
+                    data = ChatResponse(**data).model_dump()
+                yield sse_event(event, data)
+            metrics.CHAT_REQUESTS.inc(outcome="ok")
+        except (ValueError, RuntimeError) as exc:
+            metrics.CHAT_REQUESTS.inc(outcome="error")
+            yield sse_event("error", {"detail": str(exc)})
+        finally:
+            metrics.CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest) -> StreamingResponse:
+    """Bulk triage; results stream back as NDJSON ({"index", "response"} or {"index", "error"}) in input order."""
+    try:
+        settings = get_settings()
+    except RuntimeError as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+    async def lines():
+        async for result in arun_batch(request.items, settings, request.concurrency):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/analytics/query", response_model=AnalyticsResponse)
+async def analytics_query(request: AnalyticsRequest) -> AnalyticsResponse:
+    """Free-form text-to-SQL over the complaints DB; opt-in via APP_TEXT_TO_SQL_ANALYTICS."""
+    try:
+        settings = get_settings()
     except RuntimeError as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
+    if not settings.text_to_sql_analytics:
+        raise HTTPException(status_code=404, detail="Text-to-SQL analytics is disabled.")
+    db, chain = await asyncio.to_thread(get_registry(settings).text_to_sql)
+    return AnalyticsResponse(result=await arun_text_to_sql(request.question, db, chain))
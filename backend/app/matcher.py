@@ -0,0 +1,71 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'", "`": "'"})
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.translate(_APOSTROPHES).lower().split())
+
+
+def _trie_pattern(keywords: list[str]) -> str:
+    """Regex for a set of literals, factored as a trie so matching never rescans alternatives."""
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+@dataclass
+class PolicyMatch:
+    policy: dict[str, Any]
+    score: int
+    keywords: list[str] = field(default_factory=list)
+
+
+class KeywordMatcher:
+    """All policy keywords compiled into one word-boundary-aware regex."""
+
+    def __init__(self, policies: list[dict[str, Any]]):
+        self.policies = policies
+        self._owners: dict[str, list[int]] = {}
+        for position, policy in enumerate(policies):
+            for keyword in policy.get("keywords", []):
+                normalized = normalize_text(keyword)
+                if normalized:
+                    owners = self._owners.setdefault(normalized, [])
+                    if position not in owners:
+                        owners.append(position)
+        self._pattern = None
+        if self._owners:
+            self._pattern = re.compile(r"(?<!\w)" + _trie_pattern(list(self._owners)) + r"(?!\w)")
+
+    def match(self, message: str) -> list[PolicyMatch]:
+        """Matching policies, best first. A keyword scores one point per word it spans."""
+        if self._pattern is None:
+            return []
+        found: dict[int, PolicyMatch] = {}
+        for hit in self._pattern.finditer(normalize_text(message)):
+            keyword = hit.group(0)
+            for position in self._owners.get(keyword, ()):
+                entry = found.setdefault(position, PolicyMatch(self.policies[position], 0))
+                if keyword not in entry.keywords:
+                    entry.keywords.append(keyword)
+                    entry.score += len(keyword.split())
+        return [found[position] for position in sorted(found, key=lambda pos: (-found[pos].score, pos))]
@@ -0,0 +1,206 @@
+import threading
+from bisect import bisect_left
+from typing import Any
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_ENABLED = False
+_METRICS: list["_Metric"] = []
+
+
+def enable(enabled: bool = True) -> None:
+    global _ENABLED
+    _ENABLED = enabled
+
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        _METRICS.append(self)
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if not _ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (+Inf last), sum, count]
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not _ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total:g}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: list[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CHAT_REQUESTS = Counter("chat_requests_total", "Chat requests by outcome.", ("outcome",))
+CHAT_REQUEST_SECONDS = Histogram("chat_request_seconds", "End-to-end chat handling time.")
+STAGE_SECONDS = Histogram("chat_stage_seconds", "Time spent per chat pipeline stage.", ("stage",))
+LLM_CALLS = Counter("llm_calls_total", "Chat model invocations.")
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the chat model.", ("kind",))
+LLM_OUTPUT_PARSE = Counter(
+    "llm_output_parse_total", "Chat model outputs by parse outcome (ok, repaired, failed).", ("outcome",)
+)
+FALLBACKS = Counter("rule_based_fallback_total", "Responses produced by the rule-based fallback.")
+FAST_PATH = Counter("fast_path_total", "Responses answered by the keyword fast path.")
+CACHE_LOOKUPS = Counter("response_cache_lookups_total", "Response cache lookups by result.", ("result",))
+ESCALATIONS = Counter("escalations_total", "Responses escalated to a human agent.")
+SESSION_STORE = Gauge("session_store", "Session store gauges.", ("field",))
+RESPONSE_CACHE = Gauge("response_cache", "Response cache gauges.", ("field",))
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "embedding_cache_lookups_total", "Query embedding cache lookups by result.", ("result",)
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "embedding_batch_size", "Queries coalesced per embeddings call.", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+RETRIEVALS = Counter("retrievals_total", "Policy retrievals by the path that produced the snippets.", ("path",))
+PROMPT_TOKENS = Histogram(
+    "prompt_tokens",
+    "Estimated prompt tokens per request by section.",
+    ("section",),
+    buckets=(0, 64, 128, 256, 512, 1024, 2048, 4096, 8192),
+)
+UPSTREAM_CALLS = Counter("upstream_calls_total", "LLM/embeddings calls by outcome.", ("upstream", "outcome"))
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Retried LLM/embeddings calls.", ("upstream",))
+CIRCUIT_STATE = Gauge("circuit_state", "Circuit breaker state (0 closed, 1 open, 2 half-open).", ("upstream",))
+LLM_FAILOVERS = Counter(
+    "llm_failover_total", "Turns answered by the rule-based path because the LLM was unavailable."
+)
+EMBEDDING_CACHE = Gauge("embedding_cache", "Query embedding cache gauges.", ("field",))
+STARTUP_SECONDS = Gauge("startup_phase_seconds", "Worker warm-up time per phase.", ("phase",))
+READY = Gauge("ready", "1 once the worker finished warming up.")
+OUTCOMES = Counter(
+    "resolution_outcomes_total", "Recorded agent decisions by result (committed, spilled, error).", ("result",)
+)
+OUTCOME_QUEUE_DEPTH = Gauge("resolution_outcome_queue_depth", "Decisions waiting for the background writer.")
+OUTCOME_BATCH_SECONDS = Histogram("resolution_outcome_batch_seconds", "Time to commit one batch of decisions.")
+SHARED_CACHE = Gauge("shared_cache", "Cross-worker cache gauges.", ("field",))
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """tracing listener feeding the per-stage histogram."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def record_token_usage(response: Any) -> None:
+    """Token counts from an LLM response, via usage_metadata or the raw token_usage block."""
+    if not _ENABLED:
+        return
+    usage = getattr(response, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens")
+    output_tokens = usage.get("output_tokens")
+    if input_tokens is None and output_tokens is None:
+        raw = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        input_tokens = raw.get("prompt_tokens")
+        output_tokens = raw.get("completion_tokens")
+    if input_tokens:
+        LLM_TOKENS.inc(input_tokens, kind="input")
+    if output_tokens:
+        LLM_TOKENS.inc(output_tokens, kind="output")
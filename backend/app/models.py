@@ -1,4 +1,6 @@
-from pydantic import BaseModel, Field
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 class ChatRequest(BaseModel):
@@ -7,6 +9,29 @@ class ChatRequest(BaseModel):
     session_id: str | None = Field(default=None, max_length=100)
 
 
+class LLMDecision(BaseModel):
+    """The part of a ChatResponse the model writes; its output is validated against this."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    status: str
+    resolution: str | None = None
+    message: str = Field(..., min_length=1)
+    escalate: bool
+    policy_citations: list[str] = []
+    next_steps: list[str] = []
+
+    @field_validator("policy_citations", "next_steps", mode="before")
+    @classmethod
+    def _as_string_list(cls, value: Any) -> list[str]:
+        # Models sometimes answer a one-item list with a bare string.
+        if isinstance(value, str):
+            return [value]
+        if not isinstance(value, list):
+            return []
+        return [str(item) for item in value]
+
+
 class ChatResponse(BaseModel):
     status: str
     resolution: str | None = None
@@ -16,3 +41,18 @@ class ChatResponse(BaseModel):
     policy_citations: list[str] = []
     next_steps: list[str] = []
     session_id: str
+    policy_version: str | None = None
+    token_usage: dict[str, int] | None = None
+
+
+class BatchChatRequest(BaseModel):
+    items: list[ChatRequest] = Field(..., min_length=1, max_length=10000)
+    concurrency: int | None = Field(default=None, ge=1, le=64)
+
+
+class AnalyticsRequest(BaseModel):
+    question: str = Field(..., min_length=1, max_length=500)
+
+
+class AnalyticsResponse(BaseModel):
+    result: str | None = None
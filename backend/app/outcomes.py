@@ -0,0 +1,366 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+from . import metrics
+
+
+OUTCOME_COLUMNS = [
+    "outcome_id",
+    "created_at",
+    "session_id",
+    "order_id",
+    "complaint_type",
+    "source",
+    "status",
+    "resolution",
+    "escalate",
+    "policy_citations",
+    "policy_version",
+    "latency_ms",
+    "input_tokens",
+    "output_tokens",
+]
+INSERT_OUTCOME = (
+    f"INSERT OR IGNORE INTO resolution_outcomes ({', '.join(OUTCOME_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(OUTCOME_COLUMNS))})"
+)
+# The complaint already opened for this order in this conversation, if any.
+SESSION_COMPLAINT = (
+    "SELECT complaint_id FROM resolution_outcomes "
+    "WHERE session_id = ? AND order_id = ? AND complaint_id IS NOT NULL LIMIT 1"
+)
+OUTCOMES_TABLE_EXISTS = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'resolution_outcomes'"
+JOURNAL_GLOB = "outcomes-*.jsonl"
+REQUIRED_FIELDS = ("outcome_id", "created_at", "session_id", "source", "status")
+# Where a journal is locked on Windows (see _lock_journal); past any size a journal reaches.
+WINDOWS_LOCK_OFFSET = 1 << 40
+# Longest pause between retries while the database stays unwritable.
+MAX_RETRY_SECONDS = 5.0
+
+_STOP = object()
+
+
+def complaint_resolution(outcome: dict[str, Any]) -> str:
+    """complaints.resolution is NOT NULL: an unresolved turn is recorded as escalated or none."""
+    return outcome.get("resolution") or ("escalated" if outcome.get("escalate") else "none")
+
+
+class OutcomeRecorder:
+    """Records what the agent decided, off the request path.
+
+    ``record`` appends the outcome to a per-process journal file (an OS write,
+    not an fsync) and hands it to a background thread, which commits queued
+    outcomes to ``resolution_outcomes`` in batched transactions. The first
+    outcome per (session, order) also opens a row in ``complaints``; later
+    turns of that conversation update its resolution, so complaint history and
+    its aggregates reflect the agent's own decisions.
+
+    The queue holds at most ``max_pending`` outcomes. Past that, outcomes stay
+    in the journal only and are committed from there once the writer catches
+    up. The journal is truncated whenever everything in it is committed, and
+    journals left by a process that died are replayed on startup. Outcome IDs
+    make every write idempotent, so replaying twice is harmless.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        journal_dir: Path,
+        max_pending: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+    ):
+        self.db_path = db_path
+        self.journal_dir = journal_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._journal_lock = threading.Lock()
+        self._spilled = False
+        self._spill_seq = 0
+        # Journal bytes before this offset are committed; replays start from here.
+        self._replayed_offset = 0
+        self._conn: sqlite3.Connection | None = None
+        self._file_id: tuple[int, int] | None = None
+        self._closed = False
+        self._orphans_replayed = threading.Event()
+        self.recorded = 0
+        self.committed = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.errors = 0
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        self.journal_path = journal_dir / f"outcomes-{os.getpid()}.jsonl"
+        self._journal = open(self.journal_path, "ab+")
+        # Held for the life of the process: a journal that can be locked belongs to a dead one.
+        _lock_journal(self._journal)
+        if self._journal.tell():
+            self._spilled = True  # Left behind by an earlier process with our pid.
+        self._thread = threading.Thread(target=self._run, name="outcome-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, outcome: dict[str, Any]) -> None:
+        if self._closed:
+            return
+        line = (json.dumps(outcome, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._journal_lock:
+            self._journal.write(line)
+            self._journal.flush()
+            self.recorded += 1
+            try:
+                self._queue.put_nowait(outcome)
+            except queue.Full:
+                self._spilled = True
+                self._spill_seq += 1
+                self.spilled += 1
+                metrics.OUTCOMES.inc(result="spilled")
+        metrics.OUTCOME_QUEUE_DEPTH.set(self._queue.qsize())
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until everything recorded so far is committed; False on timeout."""
+        deadline = time.monotonic() + timeout
+        if not self._orphans_replayed.wait(timeout):
+            return False
+        while time.monotonic() < deadline:
+            with self._journal_lock:
+                if not self._queue.unfinished_tasks and not self._spilled:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Commit what is queued, then stop the writer. Anything left stays in the journal for the next start."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        with self._journal_lock:
+            empty = self._journal.tell() == 0
+            self._journal.close()
+        if empty and not self._thread.is_alive():
+            self.journal_path.unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "recorded": self.recorded,
+            "committed": self.committed,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "errors": self.errors,
+        }
+
+    def _run(self) -> None:
+        self._replay_orphans()
+        self._orphans_replayed.set()
+        stopping = False
+        delay = self.flush_interval
+        while True:
+            batch, stopping = self._next_batch(stopping)
+            if batch and not self._commit_batch(batch):
+                # Not written: the journal still has the batch, so fall back to replaying it.
+                with self._journal_lock:
+                    self._spilled = True
+                    self._spill_seq += 1
+            for _ in batch:
+                self._queue.task_done()
+            if self._spilled:
+                if self._replay_own():
+                    delay = self.flush_interval
+                else:
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RETRY_SECONDS)
+            self._truncate_if_drained()
+            if stopping and self._queue.empty():
+                break
+        if self._conn is not None:
+            self._conn.close()
+
+    def _next_batch(self, stopping: bool) -> tuple[list[dict[str, Any]], bool]:
+        batch: list[dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                timeout = None if stopping else max(0.0, deadline - time.monotonic())
+                item = self._queue.get(block=not stopping, timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.task_done()
+                stopping = True
+                continue
+            batch.append(item)
+        return batch, stopping
+
+    def _connection(self) -> sqlite3.Connection:
+        # The bulk loader swaps the file in by rename; follow it rather than write to the old inode.
+        try:
+            info = os.stat(self.db_path)
+            file_id = (info.st_dev, info.st_ino)
+        except OSError:
+            file_id = None
+        if self._conn is None or file_id != self._file_id:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = sqlite3.connect(self.db_path, timeout=5.0)
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._file_id = file_id
+            # The schema belongs to backend/data/init_db.py; the writer never migrates the file itself.
+            if self._conn.execute(OUTCOMES_TABLE_EXISTS).fetchone() is None:
+                self._conn.close()
+                self._conn = None
+                raise sqlite3.OperationalError(
+                    f"no such table: resolution_outcomes in {self.db_path}; run python backend/data/init_db.py"
+                )
+        return self._conn
+
+    def _commit_batch(self, batch: list[dict[str, Any]]) -> bool:
+        started = time.perf_counter()
+        try:
+            conn = self._connection()
+            with conn:
+                written = sum(self._write(conn, outcome) for outcome in batch)
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+            metrics.OUTCOMES.inc(len(batch), result="error")
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            return False
+        self.committed += written
+        metrics.OUTCOMES.inc(written, result="committed")
+        metrics.OUTCOME_BATCH_SECONDS.observe(time.perf_counter() - started)
+        return True
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, outcome: dict[str, Any]) -> int:
+        row = [outcome.get(column) for column in OUTCOME_COLUMNS]
+        row[OUTCOME_COLUMNS.index("policy_citations")] = json.dumps(outcome.get("policy_citations") or [])
+        if conn.execute(INSERT_OUTCOME, row).rowcount == 0:
+            return 0  # Already committed before (journal replay).
+        order_id, complaint_type = outcome.get("order_id"), outcome.get("complaint_type")
+        if order_id and complaint_type:
+            resolution = complaint_resolution(outcome)
+            existing = conn.execute(SESSION_COMPLAINT, (outcome["session_id"], order_id)).fetchone()
+            if existing is None:
+                complaint_id = conn.execute(
+                    "INSERT INTO complaints (order_id, complaint_type, resolution, created_at) VALUES (?, ?, ?, ?)",
+                    (order_id, complaint_type, resolution, outcome["created_at"]),
+                ).lastrowid
+            else:
+                complaint_id = existing[0]
+                conn.execute(
+                    "UPDATE complaints SET resolution = ? WHERE id = ? AND resolution != ?",
+                    (resolution, complaint_id, resolution),
+                )
+            conn.execute(
+                "UPDATE resolution_outcomes SET complaint_id = ? WHERE outcome_id = ?",
+                (complaint_id, outcome["outcome_id"]),
+            )
+        return 1
+
+    def _replay(self, path: Path, start: int = 0) -> int | None:
+        """Commit the journal from byte ``start``; returns the offset reached, or None if a commit failed."""
+        batch: list[dict[str, Any]] = []
+        offset = start
+        for outcome, offset in _read_journal(path, start):
+            if outcome is not None:
+                batch.append(outcome)
+            if len(batch) >= self.batch_size:
+                if not self._commit_batch(batch):
+                    return None
+                self.replayed += len(batch)
+                batch = []
+        if batch and not self._commit_batch(batch):
+            return None
+        self.replayed += len(batch)
+        return offset
+
+    def _replay_own(self) -> bool:
+        with self._journal_lock:
+            self._journal.flush()
+            seen = self._spill_seq
+        offset = self._replay(self.journal_path, self._replayed_offset)
+        if offset is None:
+            return False
+        with self._journal_lock:
+            self._replayed_offset = offset
+            # Anything spilled while we read is past the offset: leave the flag for the next round.
+            if self._spill_seq == seen:
+                self._spilled = False
+        return True
+
+    def _replay_orphans(self) -> None:
+        for path in sorted(self.journal_dir.glob(JOURNAL_GLOB)):
+            if path == self.journal_path:
+                continue
+            try:
+                handle = open(path, "rb")
+            except OSError:
+                continue
+            with handle:
+                try:
+                    _lock_journal(handle)
+                except OSError:
+                    continue  # A live process's journal.
+                if self._replay(path) is not None:
+                    path.unlink(missing_ok=True)
+
+    def _truncate_if_drained(self) -> None:
+        with self._journal_lock:
+            # Lines are appended under this lock, so nothing can slip in between the check and the truncate.
+            if self._queue.empty() and not self._spilled and self._journal.tell():
+                self._journal.truncate(0)
+                self._journal.seek(0)
+                self._replayed_offset = 0
+
+
+def _lock_journal(handle: IO[bytes]) -> None:
+    """Lock a journal for this process without waiting; OSError if another live process holds it.
+
+    The OS drops the lock when the process dies. Windows has no flock, so there
+    a byte far past any journal data is locked instead: Windows locks are
+    mandatory, and locking real data would block this process's own reader.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        position = handle.tell()
+        handle.seek(WINDOWS_LOCK_OFFSET)
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        finally:
+            handle.seek(position)
+        return
+    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _read_journal(path: Path, start: int = 0) -> Iterator[tuple[dict[str, Any] | None, int]]:
+    """(outcome, offset after its line) for each complete line from ``start``; unreadable lines yield None."""
+    try:
+        handle = open(path, "rb")
+    except OSError:
+        return
+    with handle:
+        handle.seek(start)
+        offset = start
+        for line in handle:
+            if not line.endswith(b"\n"):
+                return  # Still being written, or torn by a crash: not ours to consume yet.
+            offset += len(line)
+            try:
+                outcome = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                outcome = None
+            if not isinstance(outcome, dict) or not all(outcome.get(key) for key in REQUIRED_FIELDS):
+                outcome = None
+            yield outcome, offset
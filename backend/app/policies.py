@@ -0,0 +1,132 @@
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from langchain_core.documents import Document
+
+from .lexical import BM25Index
+from .matcher import KeywordMatcher, normalize_text
+
+
+POLICIES_FILE = "policies.json"
+KNOWLEDGE_BASE_FILE = "knowledge_base.json"
+
+
+def kb_doc_id(doc: Document) -> str:
+    """Stable content-derived ID, so unchanged KB entries keep their ID across reloads."""
+    digest = hashlib.sha256()
+    digest.update(str(doc.metadata.get("policy_id", "")).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(str(doc.metadata.get("title", "")).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(doc.page_content.encode("utf-8"))
+    extra = {key: value for key, value in doc.metadata.items() if key not in ("policy_id", "title")}
+    if extra:
+        digest.update(b"\0")
+        digest.update(json.dumps(extra, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def parse_knowledge_base(raw: list[dict[str, Any]]) -> list[Document]:
+    docs: list[Document] = []
+    for item in raw:
+        metadata = {
+            "title": item.get("title", "policy"),
+            "policy_id": item.get("policy_id", "unknown"),
+        }
+        # Anything else on the entry (region, source, ...) is kept as filterable metadata.
+        metadata.update({key: value for key, value in item.items() if key not in ("content", "title", "policy_id")})
+        docs.append(Document(page_content=item["content"], metadata=metadata))
+    return docs
+
+
+@dataclass(frozen=True)
+class PolicySnapshot:
+    """One immutable, indexed version of policies.json and knowledge_base.json."""
+
+    version: str
+    kb_version: str
+    policies: list[dict[str, Any]]
+    by_id: dict[str, dict[str, Any]]
+    by_keyword: dict[str, tuple[str, ...]]
+    kb_docs: dict[str, Document]
+    matcher: KeywordMatcher
+    lexical: BM25Index
+
+
+def load_snapshot(data_dir: Path) -> PolicySnapshot:
+    policies_raw = (data_dir / POLICIES_FILE).read_bytes()
+    kb_raw = (data_dir / KNOWLEDGE_BASE_FILE).read_bytes()
+    policies = json.loads(policies_raw)
+    docs = parse_knowledge_base(json.loads(kb_raw))
+
+    by_keyword: dict[str, list[str]] = {}
+    for policy in policies:
+        for keyword in policy.get("keywords", []):
+            owners = by_keyword.setdefault(normalize_text(keyword), [])
+            if policy.get("policy_id") not in owners:
+                owners.append(policy.get("policy_id"))
+
+    kb_version = hashlib.sha256(kb_raw).hexdigest()[:12]
+    kb_docs = {kb_doc_id(doc): doc for doc in docs}
+    return PolicySnapshot(
+        version=hashlib.sha256(policies_raw + b"\0" + kb_raw).hexdigest()[:12],
+        kb_version=kb_version,
+        policies=policies,
+        by_id={policy["policy_id"]: policy for policy in policies if "policy_id" in policy},
+        by_keyword={keyword: tuple(owners) for keyword, owners in by_keyword.items()},
+        kb_docs=kb_docs,
+        matcher=KeywordMatcher(policies),
+        lexical=BM25Index(kb_docs, policies),
+    )
+
+
+class PolicyRegistry:
+    """Serves the current PolicySnapshot and hot-swaps it when the data files change.
+
+    File mtimes are checked at most every ``check_interval`` seconds; a changed
+    stamp triggers a re-parse, and the new snapshot replaces the old one in a
+    single reference assignment, so readers never see a half-loaded version.
+    A file that fails to parse (e.g. mid-write) keeps the previous snapshot.
+    """
+
+    def __init__(self, data_dir: Path, check_interval: float = 2.0):
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stamp = self._file_stamp()
+        self._snapshot = load_snapshot(data_dir)
+        self._checked_at = time.monotonic()
+
+    def _file_stamp(self) -> tuple:
+        stamp = []
+        for name in (POLICIES_FILE, KNOWLEDGE_BASE_FILE):
+            stat = (self.data_dir / name).stat()
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stamp)
+
+    def current(self) -> PolicySnapshot:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                self._maybe_reload()
+        return self._snapshot
+
+    def _maybe_reload(self) -> None:
+        try:
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                return
+            snapshot = load_snapshot(self.data_dir)
+        except (OSError, ValueError, KeyError):
+            return  # Keep serving the last good version; retry on the next check.
+        self._stamp = stamp
+        if snapshot.version != self._snapshot.version:
+            self._snapshot = snapshot
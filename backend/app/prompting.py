@@ -0,0 +1,173 @@
+import logging
+from functools import lru_cache
+
+from langchain_core.documents import Document
+
+from . import metrics
+
+
+# Chat-format framing tokens added per message by the provider (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+# Fallback estimate when no tokenizer is available: roughly four characters per token.
+CHARS_PER_TOKEN = 4
+# Per-message cap on the text a rolled-up turn contributes to the summary.
+SUMMARY_LINE_CHARS = 200
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4)
+def _encoding(name: str):
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(name)
+    except Exception as exc:
+        # tiktoken missing, or its BPE file cannot be fetched offline: use the character estimate.
+        # Cached per encoding, so this warns once.
+        logger.warning(
+            "Tokenizer %r unavailable (%s); prompt budgets use a %d-characters-per-token estimate.",
+            name,
+            exc,
+            CHARS_PER_TOKEN,
+        )
+        return None
+
+
+def count_tokens(text: str, encoding: str = "o200k_base") -> int:
+    enc = _encoding(encoding)
+    if enc is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, encoding: str = "o200k_base") -> str:
+    """Keep the last ``max_tokens`` tokens of ``text`` (the most recent part of a summary)."""
+    if max_tokens <= 0:
+        return ""
+    enc = _encoding(encoding)
+    if enc is None:
+        return text[-max_tokens * CHARS_PER_TOKEN :]
+    tokens = enc.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else enc.decode(tokens[-max_tokens:])
+
+
+def build_user_prompt(
+    message: str,
+    order_summary: str | None,
+    complaint_history: str | None,
+    snippets: list[Document],
+) -> str:
+    policy_context = "\n\n".join(
+        f"[{doc.metadata.get('policy_id', 'unknown')}] {doc.page_content}"
+        for doc in snippets
+    )
+    return f"""
+User message: {message}
+
+Order summary: {order_summary or "not available"}
+
+Complaint history: {complaint_history or "none"}
+
+Policy snippets:
+{policy_context}
+"""
+
+
+def summarize_turns(summary: str, messages: list[dict[str, str]], max_tokens: int, encoding: str = "o200k_base") -> str:
+    """Fold ``messages`` into the running summary: one clipped line per message, oldest lines dropped first.
+
+    Extractive on purpose: it runs on every session trim and must not cost an extra LLM call.
+    """
+    lines = [summary] if summary else []
+    for item in messages:
+        speaker = "Customer" if item["role"] == "user" else "Agent"
+        content = " ".join(item["content"].split())
+        if len(content) > SUMMARY_LINE_CHARS:
+            content = content[: SUMMARY_LINE_CHARS - 3] + "..."
+        lines.append(f"{speaker}: {content}")
+    combined = "\n".join(lines)
+    if count_tokens(combined, encoding) <= max_tokens:
+        return combined
+    truncated = truncate_tokens(combined, max_tokens, encoding)
+    # Start on a whole line rather than mid-sentence.
+    return truncated.split("\n", 1)[1] if "\n" in truncated else truncated
+
+
+def build_messages(
+    system_prompt: str,
+    summary: str,
+    conversation_history: list[dict[str, str]],
+    message: str,
+    order_summary: str | None,
+    complaint_history: str | None,
+    snippets: list[Document],
+    budget: int,
+    summary_max_tokens: int,
+    encoding: str = "o200k_base",
+) -> tuple[list[dict[str, str]], dict[str, int]]:
+    """Chat messages fitted to ``budget`` input tokens, plus per-section token accounting.
+
+    The system prompt always leads unchanged, so provider-side prefix caching
+    applies. The current message, order summary and complaint history are always
+    sent. The remaining budget goes, in priority order, to policy snippets (by
+    rank, the top one always kept), the running summary, then history from the
+    newest turn back. History that does not fit is folded into the summary.
+    """
+
+    def cost(text: str) -> int:
+        return count_tokens(text, encoding) + MESSAGE_OVERHEAD_TOKENS
+
+    system_tokens = cost(system_prompt)
+    used = system_tokens + cost(build_user_prompt(message, order_summary, complaint_history, []))
+    usage = {"system": system_tokens, "user": used - system_tokens}
+
+    kept_snippets: list[Document] = []
+    usage["snippets"] = 0
+    for doc in snippets:
+        extra = count_tokens(f"[{doc.metadata.get('policy_id', 'unknown')}] {doc.page_content}\n\n", encoding)
+        if kept_snippets and used + extra > budget:
+            break
+        kept_snippets.append(doc)
+        usage["snippets"] += extra
+        used += extra
+
+    history_costs = [cost(item["content"]) for item in conversation_history]
+    # Reserve the summary's share first so recent history cannot starve it entirely,
+    # unless there is no summary yet and the whole history fits anyway.
+    summary_reserve = 0
+    if summary or used + sum(history_costs) > budget:
+        summary_reserve = min(summary_max_tokens, max(0, budget - used))
+    kept_history: list[dict[str, str]] = []
+    history_tokens = 0
+    for item, extra in zip(reversed(conversation_history), reversed(history_costs)):
+        if used + summary_reserve + history_tokens + extra > budget:
+            break
+        kept_history.insert(0, item)
+        history_tokens += extra
+    dropped = conversation_history[: len(conversation_history) - len(kept_history)]
+    if dropped:
+        summary = summarize_turns(summary, dropped, summary_max_tokens, encoding)
+
+    summary_message = SUMMARY_HEADER + summary if summary else ""
+    if summary_message and cost(summary_message) > summary_reserve:
+        summary = truncate_tokens(summary, summary_reserve - cost(SUMMARY_HEADER), encoding)
+        summary_message = SUMMARY_HEADER + summary if summary else ""
+    usage["summary"] = cost(summary_message) if summary_message else 0
+    usage["history"] = history_tokens
+    usage["history_messages_dropped"] = len(dropped)
+    usage["snippets_dropped"] = len(snippets) - len(kept_snippets)
+    usage["total"] = used + usage["summary"] + history_tokens
+    usage["budget"] = budget
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary_message:
+        messages.append({"role": "system", "content": summary_message})
+    messages.extend(kept_history)
+    messages.append(
+        {"role": "user", "content": build_user_prompt(message, order_summary, complaint_history, kept_snippets)}
+    )
+    for section in ("system", "summary", "history", "snippets", "user", "total"):
+        metrics.PROMPT_TOKENS.observe(usage[section], section=section)
+    return messages, usage
@@ -0,0 +1,260 @@
+import asyncio
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+from . import metrics
+from .matcher import normalize_text
+from .resilience import UpstreamGuard
+from .shared_cache import SharedCache
+
+
+# Bump when what a cached vector was computed from changes; see QueryEmbeddings.identity.
+CACHE_KEY_SCHEME = "raw-text"
+
+
+class QueryEmbeddings(Embeddings):
+    """Query-side wrapper around an embeddings backend: LRU cache plus async micro-batching.
+
+    The cache is keyed on normalized text, so recurring complaint phrases are
+    embedded once; the backend always gets the caller's original text, as the
+    index was built from unnormalized documents. Concurrent cache misses
+    arriving within ``batch_window_ms`` are coalesced into a single
+    ``aembed_documents`` call (one request to Azure, one forward pass for
+    HuggingFace). Async backend calls go through ``guard``
+    when given; sync document embedding (index builds) passes straight through.
+    With ``shared``, local misses are looked up in (and new vectors written to)
+    the cache shared by all worker processes. On the async path that lookup
+    runs in a thread, once per micro-batch; writes are queued to the shared
+    cache's writer thread.
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        max_entries: int = 4096,
+        batch_window_ms: float = 3.0,
+        batch_max_size: int = 64,
+        cache_path: Path | None = None,
+        identity: str = "",
+        guard: UpstreamGuard | None = None,
+        shared: SharedCache | None = None,
+    ):
+        self.base = base
+        self.guard = guard
+        self.shared = shared
+        self.max_entries = max_entries
+        self.batch_window_ms = batch_window_ms
+        self.batch_max_size = batch_max_size
+        self.cache_path = cache_path
+        # Tagged so vectors cached when keys were embedded in normalized form are not reused.
+        self.identity = f"{identity}|{CACHE_KEY_SCHEME}"
+        self._entries: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Cache key -> (the text to embed, callers waiting for it).
+        self._pending: dict[str, tuple[str, list[asyncio.Future]]] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.batches = 0
+        self.batched_queries = 0
+        if cache_path is not None:
+            self._load()
+
+    def _get_local(self, key: str) -> list[float] | None:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if vector is not None:
+            metrics.EMBEDDING_CACHE_LOOKUPS.inc(result="hit")
+        return vector
+
+    def _get_shared(self, keys: list[str], callers: list[int] | None = None) -> dict[str, list[float]]:
+        """Look local misses up in the shared cache (blocking) and count them; ``callers`` weights each key."""
+        found: dict[str, list[float]] = {}
+        if self.shared is not None and self.max_entries > 0:
+            found = self.shared.get_embeddings(self.identity, keys)
+            for key, vector in found.items():
+                self._remember(key, vector)
+        callers = callers or [1] * len(keys)
+        shared_hits = sum(count for key, count in zip(keys, callers) if key in found)
+        misses = sum(callers) - shared_hits
+        with self._lock:
+            self.shared_hits += shared_hits
+            self.misses += misses
+        if shared_hits:
+            metrics.EMBEDDING_CACHE_LOOKUPS.inc(shared_hits, result="shared_hit")
+        if misses:
+            metrics.EMBEDDING_CACHE_LOOKUPS.inc(misses, result="miss")
+        return found
+
+    async def _aget_shared(self, keys: list[str], callers: list[int] | None = None) -> dict[str, list[float]]:
+        if self.shared is None or self.max_entries <= 0:
+            return self._get_shared(keys, callers)  # Only counts the misses; nothing blocks.
+        return await asyncio.to_thread(self._get_shared, keys, callers)
+
+    def _get(self, key: str) -> list[float] | None:
+        vector = self._get_local(key)
+        if vector is None:
+            vector = self._get_shared([key]).get(key)
+        return vector
+
+    def _remember(self, key: str, vector: list[float]) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def _put_many(self, items: list[tuple[str, list[float]]]) -> None:
+        if self.max_entries <= 0:
+            return
+        for key, vector in items:
+            self._remember(key, vector)
+        if self.shared is not None:
+            self.shared.put_embeddings(self.identity, items)
+
+    def _put(self, key: str, vector: list[float]) -> None:
+        self._put_many([(key, vector)])
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.base.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.guard is None:
+            return await self.base.aembed_documents(texts)
+        return await self.guard.call(lambda: self.base.aembed_documents(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        key = normalize_text(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.base.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key = normalize_text(text)
+        vector = self._get_local(key)
+        if vector is not None:
+            return vector
+        if self.batch_window_ms <= 0:
+            vector = (await self._aget_shared([key])).get(key)
+            if vector is None:
+                vector = (await self.aembed_documents([text]))[0]
+                self._put(key, vector)
+            return vector
+        return await self._enqueue(key, text)
+
+    async def _enqueue(self, key: str, text: str) -> list[float]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A new event loop (e.g. a fresh asyncio.run); anything queued on the old one is gone.
+            self._loop = loop
+            self._pending = {}
+            self._flush_handle = None
+        future = loop.create_future()
+        self._pending.setdefault(key, (text, []))[1].append(future)
+        if len(self._pending) >= self.batch_max_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            task = self._loop.create_task(self._run_batch(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, pending: dict[str, tuple[str, list[asyncio.Future]]]) -> None:
+        found = await self._aget_shared(list(pending), [len(futures) for _, futures in pending.values()])
+        for key, vector in found.items():
+            for future in pending.pop(key)[1]:
+                if not future.done():
+                    future.set_result(vector)
+        if not pending:
+            return
+        keys = list(pending)
+        texts = [pending[key][0] for key in keys]
+        self.batches += 1
+        self.batched_queries += len(texts)
+        metrics.EMBEDDING_BATCH_SIZE.observe(len(texts))
+        try:
+            vectors = await self.aembed_documents(texts)
+        except Exception as exc:
+            for _, futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+        self._put_many(list(zip(keys, vectors)))
+        for key, vector in zip(keys, vectors):
+            for future in pending[key][1]:
+                if not future.done():
+                    future.set_result(vector)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "batches": self.batches,
+            "batched_queries": self.batched_queries,
+        }
+
+    def _load(self) -> None:
+        if self.max_entries <= 0:
+            return  # keys[-0:] would be every key.
+        import numpy as np
+
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                if str(data["identity"]) != self.identity:
+                    return
+                keys = data["keys"].tolist()
+                vectors = data["vectors"]
+        except (OSError, KeyError, ValueError):
+            return
+        for key, vector in zip(keys[-self.max_entries :], vectors[-self.max_entries :]):
+            self._entries[key] = vector.tolist()
+
+    def save(self) -> None:
+        """Write the cache to ``cache_path`` (atomically) if it changed since the last save."""
+        if self.cache_path is None or not self._dirty:
+            return
+        import numpy as np
+
+        with self._lock:
+            keys = list(self._entries)
+            vectors = np.asarray(list(self._entries.values()), dtype=np.float32)
+            self._dirty = False
+        if not keys:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_path.parent, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                np.savez(handle, identity=np.array(self.identity), keys=np.array(keys), vectors=vectors)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            Path(tmp).unlink(missing_ok=True)
+            raise
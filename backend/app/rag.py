@@ -1,42 +1,402 @@
+import hashlib
 import json
+import math
+import os
+import shutil
+import tempfile
+import weakref
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from langchain_community.vectorstores import FAISS
-from langchain_openai import AzureOpenAIEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
+from .config import Settings
+from .policies import kb_doc_id, parse_knowledge_base
 
+# faiss, numpy and the langchain_community FAISS wrapper are imported where they are used, so importing
+# the app does not load them; the warm-up imports them ahead of the first request.
+if TYPE_CHECKING:
+    import faiss
+    import numpy as np
+    from langchain_community.vectorstores import FAISS
 
-from .config import Settings
+
+INDEX_FILE = "index.faiss"
+DOCS_FILE = "docs.json"
+MANIFEST_FILE = "manifest.json"
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq")
+# Metadata keys that search_by_vectors can filter on.
+FILTER_KEYS = ("policy_id", "region")
+
+# Per-store inverted index of filterable metadata -> FAISS positions.
+_METADATA_POSITIONS: "weakref.WeakKeyDictionary[FAISS, dict[tuple[str, str], np.ndarray]]" = (
+    weakref.WeakKeyDictionary()
+)
 
 
 def load_knowledge_base(data_dir: Path) -> list[Document]:
     kb_path = data_dir / "knowledge_base.json"
-    raw = json.loads(kb_path.read_text(encoding="utf-8"))
-    docs: list[Document] = []
-    for item in raw:
-        docs.append(
-            Document(
-                page_content=item["content"],
-                metadata={
-                    "title": item.get("title", "policy"),
-                    "policy_id": item.get("policy_id", "unknown"),
-                },
-            )
-        )
-    return docs
+    return parse_knowledge_base(json.loads(kb_path.read_text(encoding="utf-8")))
+
 
+def build_embeddings(
+    settings: Settings, http_client=None, http_async_client=None, max_retries: int = 2
+) -> Embeddings:
+    if settings.llm_backend == "fake":
+        from .fakes import FakeEmbeddings
 
-def build_vector_store(settings: Settings) -> FAISS:
+        return FakeEmbeddings(latency_ms=settings.fake_embeddings_latency_ms)
     if settings.hf_embeddings_model:
-        embeddings = HuggingFaceEmbeddings(model_name=settings.hf_embeddings_model)
+        # Backend clients are imported only when configured; HuggingFace pulls in torch.
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(model_name=settings.hf_embeddings_model)
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    return AzureOpenAIEmbeddings(
+        azure_endpoint=settings.azure_endpoint,
+        api_key=settings.azure_api_key,
+        api_version=settings.azure_api_version,
+        azure_deployment=settings.azure_embeddings_deployment,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        max_retries=max_retries,
+    )
+
+
+def embeddings_identity(settings: Settings) -> str:
+    if settings.llm_backend == "fake":
+        return "fake"
+    if settings.hf_embeddings_model:
+        return f"hf:{settings.hf_embeddings_model}"
+    return f"azure:{settings.azure_endpoint}:{settings.azure_embeddings_deployment}"
+
+
+def index_identity(settings: Settings) -> str:
+    """The index configuration; part of the fingerprint so a config change rebuilds the artifact."""
+    return (
+        f"{settings.index_type}:min={settings.index_ann_min_docs}:nlist={settings.index_nlist}"
+        f":m={settings.index_hnsw_m}:pq={settings.index_pq_m}"
+    )
+
+
+def index_fingerprint(settings: Settings, docs: list[Document]) -> str:
+    """Hash of the knowledge-base content plus the embedding model and index type that indexed it."""
+    digest = hashlib.sha256()
+    digest.update(embeddings_identity(settings).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(index_identity(settings).encode("utf-8"))
+    for doc in docs:
+        digest.update(b"\0")
+        digest.update(kb_doc_id(doc).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _default_nlist(count: int) -> int:
+    # ~4*sqrt(n) lists, capped so every list gets the ~39 training points FAISS asks for.
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def _pq_subquantizers(dimension: int, requested: int) -> int:
+    """Largest divisor of ``dimension`` not above ``requested`` (PQ needs d % m == 0)."""
+    for m in range(min(requested, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def build_faiss_index(vectors: "np.ndarray", settings: Settings) -> "faiss.Index":
+    """An index of the configured type, trained on and filled with ``vectors``.
+
+    Corpora smaller than ``index_ann_min_docs`` always get an exact flat index:
+    below that size a brute-force scan is already sub-millisecond and IVF/PQ
+    training has too few points to be useful.
+    """
+    import faiss
+
+    count, dimension = vectors.shape
+    kind = settings.index_type if count >= settings.index_ann_min_docs else "flat"
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, settings.index_hnsw_m)
+        index.hnsw.efConstruction = max(40, 2 * settings.index_hnsw_m)
+    elif kind in ("ivf", "pq"):
+        nlist = min(settings.index_nlist, count) if settings.index_nlist else _default_nlist(count)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            nbits = 8 if count >= 39 * 256 else 4
+            index = faiss.IndexIVFPQ(
+                quantizer, dimension, nlist, _pq_subquantizers(dimension, settings.index_pq_m), nbits
+            )
+        index.train(vectors)
     else:
-        embeddings = AzureOpenAIEmbeddings(
-            azure_endpoint=settings.azure_endpoint,
-            api_key=settings.azure_api_key,
-            api_version=settings.azure_api_version,
-            azure_deployment=settings.azure_embeddings_deployment,
+        index = faiss.IndexFlatL2(dimension)
+    index.add(vectors)
+    configure_search(index, settings)
+    return index
+
+
+def configure_search(index: "faiss.Index", settings: Settings) -> None:
+    """Apply the query-time knobs (IVF nprobe, HNSW efSearch); they are not persisted with the index."""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = settings.index_nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = settings.index_hnsw_ef_search
+
+
+def _wrap_store(embeddings: Embeddings, index: "faiss.Index", doc_ids: list[str], docs: list[Document]) -> "FAISS":
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS(embeddings, index, InMemoryDocstore(dict(zip(doc_ids, docs))), dict(enumerate(doc_ids)))
+
+
+def _stored_vectors(index: "faiss.Index") -> "np.ndarray | None":
+    """All vectors held by ``index`` when it stores them losslessly, else None."""
+    import faiss
+
+    if isinstance(index, faiss.IndexIVFFlat):
+        try:
+            index.make_direct_map()
+        except RuntimeError:
+            return None
+    elif not isinstance(index, (faiss.IndexFlat, faiss.IndexHNSWFlat)):
+        return None
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def artifact_identity(settings: Settings) -> dict[str, str]:
+    """What an artifact was built with, recorded in its manifest; only same-identity artifacts supersede each other."""
+    return {"embeddings": embeddings_identity(settings), "index": index_identity(settings)}
+
+
+def save_index_artifact(
+    store: "FAISS", index_dir: Path, fingerprint: str, identity: dict[str, str] | None = None
+) -> Path:
+    """Write the index to ``index_dir/<fingerprint>`` atomically; concurrent builders race safely.
+
+    With ``identity``, older artifacts built with the same embeddings and index
+    configuration are removed afterwards. Artifacts of other configurations
+    sharing the directory are left alone.
+    """
+    import faiss
+
+    target = index_dir / fingerprint
+    index_dir.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=".build-", dir=index_dir))
+    try:
+        faiss.write_index(store.index, str(tmp_dir / INDEX_FILE))
+        docs = []
+        for position in range(store.index.ntotal):
+            doc_id = store.index_to_docstore_id[position]
+            doc = store.docstore.search(doc_id)
+            docs.append({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata})
+        (tmp_dir / DOCS_FILE).write_text(json.dumps(docs), encoding="utf-8")
+        # The manifest is written last: its presence marks the artifact as complete.
+        (tmp_dir / MANIFEST_FILE).write_text(
+            json.dumps({"fingerprint": fingerprint, "count": len(docs), **(identity or {})}),
+            encoding="utf-8",
         )
+        try:
+            os.rename(tmp_dir, target)
+        except OSError:
+            # Another worker published the same fingerprint first; theirs is equivalent.
+            if not (target / MANIFEST_FILE).exists():
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if identity:
+        _prune_artifacts(index_dir, fingerprint, identity)
+    return target
+
+
+def _prune_artifacts(index_dir: Path, keep: str, identity: dict[str, str]) -> None:
+    """Remove artifacts superseded by ``keep``: same embeddings and index identity, older knowledge base."""
+    for stale in index_dir.iterdir():
+        if not stale.is_dir() or stale.name == keep or stale.name.startswith("."):
+            continue
+        try:
+            manifest = json.loads((stale / MANIFEST_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue  # Incomplete, or not an artifact: not ours to judge.
+        if all(manifest.get(key) == value for key, value in identity.items()):
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def load_index_artifact(path: Path, embeddings: Embeddings, settings: Settings | None = None) -> "FAISS":
+    """Load a persisted index read-only; the vectors are mmap'd so workers share page cache."""
+    import faiss
+
+    manifest = json.loads((path / MANIFEST_FILE).read_text(encoding="utf-8"))
+    try:
+        index = faiss.read_index(str(path / INDEX_FILE), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Not every index type supports mmap; fall back to a private in-memory copy.
+        index = faiss.read_index(str(path / INDEX_FILE))
+    docs = json.loads((path / DOCS_FILE).read_text(encoding="utf-8"))
+    if index.ntotal != len(docs) or manifest.get("count") != len(docs):
+        raise ValueError(f"Index artifact at {path} is inconsistent.")
+    if settings is not None:
+        configure_search(index, settings)
+
+    return _wrap_store(
+        embeddings,
+        index,
+        [item["id"] for item in docs],
+        [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in docs],
+    )
+
+
+def _metadata_positions(store: "FAISS") -> "dict[tuple[str, str], np.ndarray]":
+    import numpy as np
+
+    positions = _METADATA_POSITIONS.get(store)
+    if positions is None:
+        grouped: dict[tuple[str, str], list[int]] = {}
+        for position, doc_id in store.index_to_docstore_id.items():
+            metadata = store.docstore.search(doc_id).metadata
+            for key in FILTER_KEYS:
+                if key in metadata:
+                    grouped.setdefault((key, str(metadata[key])), []).append(position)
+        positions = {key: np.asarray(ids, dtype=np.int64) for key, ids in grouped.items()}
+        _METADATA_POSITIONS[store] = positions
+    return positions
+
+
+def _filter_params(store: "FAISS", filter: dict[str, str | list[str]]) -> "faiss.SearchParameters | None":
+    """FAISS search parameters restricting results to documents matching ``filter``.
+
+    Values within a key are OR'ed, keys are AND'ed. Returns None when nothing matches.
+    """
+    import faiss
+    import numpy as np
+
+    index_positions = _metadata_positions(store)
+    allowed: np.ndarray | None = None
+    for key, values in filter.items():
+        if key not in FILTER_KEYS:
+            raise ValueError(f"Cannot filter on metadata key {key!r}; expected one of {FILTER_KEYS}.")
+        values = [values] if isinstance(values, str) else values
+        matched = np.unique(
+            np.concatenate([index_positions.get((key, str(value)), np.empty(0, np.int64)) for value in values])
+        )
+        allowed = matched if allowed is None else np.intersect1d(allowed, matched)
+    if allowed is None or not len(allowed):
+        return None
+    selector = faiss.IDSelectorBatch(allowed)
+    ivf = faiss.try_extract_index_ivf(store.index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    elif hasattr(store.index, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=store.index.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    params.selector_ref = selector  # SearchParameters does not own the selector.
+    return params
+
+
+def search_by_vectors(
+    store: "FAISS", vectors: list[list[float]], k: int, filter: dict[str, str | list[str]] | None = None
+) -> list[list[Document]]:
+    """One FAISS search call for a whole batch of query vectors, optionally pre-filtered on metadata."""
+    if not vectors:
+        return []
+    import faiss
+    import numpy as np
+
+    params = None
+    if filter:
+        params = _filter_params(store, filter)
+        if params is None:
+            return [[] for _ in vectors]
+    queries = np.asarray(vectors, dtype=np.float32)
+    if getattr(store, "_normalize_L2", False):
+        faiss.normalize_L2(queries)
+    _, indices = store.index.search(queries, k, params=params)
+    results = []
+    for row in indices:
+        docs = []
+        for position in row:
+            if position == -1:
+                continue
+            docs.append(store.docstore.search(store.index_to_docstore_id[int(position)]))
+        results.append(docs)
+    return results
+
+
+def build_vector_store(
+    settings: Settings, embeddings: Embeddings | None = None, docs: list[Document] | None = None
+) -> "FAISS":
+    import numpy as np
+
+    embeddings = embeddings or build_embeddings(settings)
+    docs = docs if docs is not None else load_knowledge_base(settings.data_dir)
+    fingerprint = index_fingerprint(settings, docs)
+    artifact = settings.index_dir / fingerprint
+    if (artifact / MANIFEST_FILE).exists():
+        try:
+            return load_index_artifact(artifact, embeddings, settings)
+        except (OSError, RuntimeError, ValueError, KeyError):
+            pass  # Corrupt or partial artifact: rebuild it below.
+
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+    store = _wrap_store(embeddings, build_faiss_index(vectors, settings), [kb_doc_id(doc) for doc in docs], docs)
+    _persist(store, settings, fingerprint)
+    return store
+
+
+def reindex_vector_store(
+    store: "FAISS", settings: Settings, embeddings: Embeddings, docs: list[Document]
+) -> "FAISS":
+    """New store for ``docs`` that reuses vectors of unchanged entries and embeds only the rest.
+
+    The old store is left untouched so in-flight searches keep working until the
+    caller swaps the reference.
+    """
+    import numpy as np
+
+    fingerprint = index_fingerprint(settings, docs)
+    positions = {doc_id: position for position, doc_id in store.index_to_docstore_id.items()}
+    doc_ids = [kb_doc_id(doc) for doc in docs]
+    stored = _stored_vectors(store.index)
+    if stored is None:
+        # Quantized indexes cannot give the original vectors back: re-embed everything.
+        positions = {}
+    changed = [i for i, doc_id in enumerate(doc_ids) if doc_id not in positions]
+
+    vectors = np.empty((len(docs), store.index.d), dtype=np.float32)
+    for i, doc_id in enumerate(doc_ids):
+        if doc_id in positions:
+            vectors[i] = stored[positions[doc_id]]
+    if changed:
+        fresh = embeddings.embed_documents([docs[i].page_content for i in changed])
+        vectors[changed] = np.asarray(fresh, dtype=np.float32)
+
+    rebuilt = _wrap_store(embeddings, build_faiss_index(vectors, settings), doc_ids, docs)
+    _persist(rebuilt, settings, fingerprint)
+    return rebuilt
+
+
+def _persist(store: "FAISS", settings: Settings, fingerprint: str) -> None:
+    try:
+        save_index_artifact(store, settings.index_dir, fingerprint, artifact_identity(settings))
+    except OSError:
+        pass  # A read-only index dir only costs us the cache, not the request.
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from .config import get_settings
+
+    load_dotenv()
+    settings = get_settings()
     docs = load_knowledge_base(settings.data_dir)
-    return FAISS.from_documents(docs, embeddings)
+    build_vector_store(settings, docs=docs)
+    print(f"Index ready at {settings.index_dir / index_fingerprint(settings, docs)}")
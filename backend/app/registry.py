@@ -0,0 +1,309 @@
+import threading
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from .cache import ResponseCache
+from .config import Settings
+from .decision import response_format
+from .outcomes import OutcomeRecorder
+from .policies import PolicyRegistry
+from .query_embeddings import QueryEmbeddings
+from .resilience import CircuitBreaker, UpstreamGuard
+from .rag import build_embeddings, build_vector_store, embeddings_identity, reindex_vector_store
+from .sessions import build_session_store
+from .shared_cache import SharedCache
+from .tracing import REQUEST_ID_HEADER, current_request_id
+from .sql import build_text_to_sql_chain, close_pools
+
+
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY_SECONDS = 60.0
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+# First Azure OpenAI API version with stream_options.include_usage; older ones reject the parameter.
+STREAM_USAGE_MIN_API_VERSION = "2024-09-01"
+
+_REGISTRY: "ClientRegistry | None" = None
+_REGISTRY_LOCK = threading.Lock()
+# Built by the pre-fork launcher before the workers exist; see preload().
+_PRELOADED: dict[tuple, tuple] = {}
+
+
+def supports_stream_usage(api_version: str) -> bool:
+    """Whether the Azure API version accepts ``stream_options`` (token usage on streamed replies)."""
+    return api_version[:10] >= STREAM_USAGE_MIN_API_VERSION
+
+
+def _propagate_request_id(request: httpx.Request) -> None:
+    request_id = current_request_id()
+    if request_id:
+        request.headers[REQUEST_ID_HEADER] = request_id
+
+
+async def _apropagate_request_id(request: httpx.Request) -> None:
+    _propagate_request_id(request)
+
+
+def registry_key(settings: Settings) -> tuple:
+    """Settings fields that, when changed, require new clients."""
+    return (
+        settings.llm_backend,
+        settings.llm_output_mode,
+        settings.fake_llm_latency_ms,
+        settings.fake_embeddings_latency_ms,
+        settings.fake_llm_error_rate,
+        settings.azure_endpoint,
+        settings.azure_api_key,
+        settings.azure_api_version,
+        settings.azure_deployment,
+        settings.azure_embeddings_deployment,
+        settings.hf_embeddings_model,
+        settings.db_path,
+        settings.index_dir,
+        settings.data_dir,
+        settings.policy_reload_interval_seconds,
+        settings.session_backend,
+        settings.session_db_path,
+        settings.session_max_messages,
+        settings.session_ttl_seconds,
+        settings.session_max_sessions,
+        settings.response_cache_enabled,
+        settings.response_cache_max_entries,
+        settings.response_cache_ttl_seconds,
+        settings.response_cache_similarity,
+        settings.embedding_cache_max_entries,
+        settings.embedding_cache_path,
+        settings.shared_cache_path,
+        settings.embedding_batch_window_ms,
+        settings.embedding_batch_max_size,
+        settings.index_type,
+        settings.index_ann_min_docs,
+        settings.index_nlist,
+        settings.index_nprobe,
+        settings.index_hnsw_m,
+        settings.index_hnsw_ef_search,
+        settings.index_pq_m,
+        settings.llm_max_concurrency,
+        settings.llm_queue_timeout_seconds,
+        settings.llm_timeout_seconds,
+        settings.embeddings_max_concurrency,
+        settings.embeddings_timeout_seconds,
+        settings.upstream_max_retries,
+        settings.upstream_retry_base_seconds,
+        settings.upstream_retry_max_seconds,
+        settings.circuit_failure_threshold,
+        settings.circuit_reset_seconds,
+        settings.outcome_recording_enabled,
+        settings.outcome_journal_dir,
+        settings.outcome_queue_size,
+        settings.outcome_batch_size,
+        settings.outcome_flush_interval_ms,
+    )
+
+
+class ClientRegistry:
+    """Process-wide, pooled clients and prebuilt chains shared by every request."""
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.key = registry_key(settings)
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        self.http_client = httpx.Client(
+            limits=limits, timeout=HTTP_TIMEOUT, event_hooks={"request": [_propagate_request_id]}
+        )
+        self.http_async_client = httpx.AsyncClient(
+            limits=limits, timeout=HTTP_TIMEOUT, event_hooks={"request": [_apropagate_request_id]}
+        )
+        self.shared_cache = (
+            SharedCache(
+                settings.shared_cache_path,
+                max_embeddings=settings.embedding_cache_max_entries,
+                max_responses=settings.response_cache_max_entries,
+                response_ttl_seconds=settings.response_cache_ttl_seconds,
+            )
+            if settings.shared_cache_path is not None
+            else None
+        )
+        self.llm = self._build_chat_model(temperature=0.2, response_format=response_format(settings.llm_output_mode))
+        # Extra astream() arguments: ask Azure to send token usage with streamed replies where the API allows it.
+        self.llm_stream_kwargs = (
+            {"stream_options": {"include_usage": True}}
+            if settings.llm_backend != "fake" and supports_stream_usage(settings.azure_api_version)
+            else {}
+        )
+        self.llm_guard = self._build_guard("llm", settings.llm_max_concurrency, settings.llm_timeout_seconds)
+        self.embeddings_guard = self._build_guard(
+            "embeddings", settings.embeddings_max_concurrency, settings.embeddings_timeout_seconds
+        )
+        self.embeddings = QueryEmbeddings(
+            build_embeddings(
+                settings,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+                max_retries=0,  # Retries are the guard's job; client-side ones would multiply them.
+            ),
+            max_entries=settings.embedding_cache_max_entries,
+            batch_window_ms=settings.embedding_batch_window_ms,
+            batch_max_size=settings.embedding_batch_max_size,
+            cache_path=settings.embedding_cache_path,
+            identity=embeddings_identity(settings),
+            guard=self.embeddings_guard,
+            shared=self.shared_cache,
+        )
+        self.sessions = build_session_store(settings)
+        self.response_cache = (
+            ResponseCache(
+                max_entries=settings.response_cache_max_entries,
+                ttl_seconds=settings.response_cache_ttl_seconds,
+                similarity_threshold=settings.response_cache_similarity,
+                shared=self.shared_cache,
+            )
+            if settings.response_cache_enabled
+            else None
+        )
+        self.outcomes = (
+            OutcomeRecorder(
+                settings.db_path,
+                settings.outcome_journal_dir,
+                max_pending=settings.outcome_queue_size,
+                batch_size=settings.outcome_batch_size,
+                flush_interval=settings.outcome_flush_interval_ms / 1000,
+            )
+            if settings.outcome_recording_enabled
+            else None
+        )
+        self._lock = threading.Lock()
+        self._vector_store = None
+        self._vector_store_kb_version = None
+        self._text_to_sql = None
+        preloaded = _PRELOADED.pop(self.key, None)
+        if preloaded is None:
+            self.policies = PolicyRegistry(settings.data_dir, settings.policy_reload_interval_seconds)
+        else:
+            self.policies, store, kb_version = preloaded
+            if store is not None:
+                # Shared with the parent page for page; only the query-side client is our own.
+                store.embedding_function = self.embeddings
+                self._vector_store, self._vector_store_kb_version = store, kb_version
+
+    def _build_guard(self, name: str, max_concurrency: int, call_timeout: float) -> UpstreamGuard:
+        return UpstreamGuard(
+            name,
+            max_concurrency=max_concurrency,
+            queue_timeout=self.settings.llm_queue_timeout_seconds,
+            call_timeout=call_timeout,
+            max_retries=self.settings.upstream_max_retries,
+            base_delay=self.settings.upstream_retry_base_seconds,
+            max_delay=self.settings.upstream_retry_max_seconds,
+            breaker=CircuitBreaker(self.settings.circuit_failure_threshold, self.settings.circuit_reset_seconds),
+        )
+
+    def _build_chat_model(self, temperature: float, response_format: dict | None = None) -> BaseChatModel:
+        if self.settings.llm_backend == "fake":
+            from .fakes import FakeChatModel
+
+            return FakeChatModel(
+                latency_ms=self.settings.fake_llm_latency_ms, error_rate=self.settings.fake_llm_error_rate
+            )
+        from langchain_openai import AzureChatOpenAI
+
+        return AzureChatOpenAI(
+            azure_endpoint=self.settings.azure_endpoint,
+            api_key=self.settings.azure_api_key,
+            api_version=self.settings.azure_api_version,
+            azure_deployment=self.settings.azure_deployment,
+            temperature=temperature,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+            max_retries=0,  # See _build_guard: retries happen once, in the guard.
+            model_kwargs={"response_format": response_format} if response_format else {},
+        )
+
+    def vector_store(self):
+        """The FAISS store for the current knowledge base, re-indexed incrementally on change."""
+        snapshot = self.policies.current()
+        if self._vector_store is None or self._vector_store_kb_version != snapshot.kb_version:
+            with self._lock:
+                docs = list(snapshot.kb_docs.values())
+                if self._vector_store is None:
+                    self._vector_store = build_vector_store(self.settings, self.embeddings, docs)
+                elif self._vector_store_kb_version != snapshot.kb_version:
+                    self._vector_store = reindex_vector_store(
+                        self._vector_store, self.settings, self.embeddings, docs
+                    )
+                self._vector_store_kb_version = snapshot.kb_version
+        return self._vector_store
+
+    def built_vector_store(self, kb_version: str):
+        """The store if it is already built for ``kb_version``, else None; never builds or re-indexes."""
+        store = self._vector_store
+        if store is not None and self._vector_store_kb_version == kb_version:
+            return store
+        return None
+
+    def text_to_sql(self):
+        """(SQLDatabase, query chain), reflected once and reused for analytics queries."""
+        if self._text_to_sql is None:
+            with self._lock:
+                if self._text_to_sql is None:
+                    self._text_to_sql = build_text_to_sql_chain(
+                        self.settings, self._build_chat_model(temperature=0)
+                    )
+        return self._text_to_sql
+
+    def close(self) -> None:
+        if self.outcomes is not None:
+            self.outcomes.close()
+        self.embeddings.save()
+        self.http_client.close()
+        self.sessions.close()
+        if self.shared_cache is not None:
+            self.shared_cache.close()
+
+    async def aclose(self) -> None:
+        self.close()
+        await self.http_async_client.aclose()
+
+
+def preload(settings: Settings, policies: PolicyRegistry, store, kb_version: str | None) -> None:
+    """Hand a policy registry and vector store loaded before forking to the first registry built with ``settings``.
+
+    Forked workers then share those pages with the parent copy-on-write instead
+    of each parsing and loading its own. ``store`` may be None (the worker
+    builds it on first use).
+    """
+    _PRELOADED[registry_key(settings)] = (policies, store, kb_version)
+
+
+def get_registry(settings: Settings) -> ClientRegistry:
+    """Return the shared registry, replacing it if the relevant settings changed."""
+    global _REGISTRY
+    registry = _REGISTRY
+    if registry is not None and registry.key == registry_key(settings):
+        return registry
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None or _REGISTRY.key != registry_key(settings):
+            if _REGISTRY is not None:
+                # In-flight requests may still hold the old async pool; only drop the sync one.
+                _REGISTRY.close()
+            _REGISTRY = ClientRegistry(settings)
+        return _REGISTRY
+
+
+def current_registry() -> ClientRegistry | None:
+    """The registry if one has been built, without building it."""
+    return _REGISTRY
+
+
+async def close_registry() -> None:
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        registry, _REGISTRY = _REGISTRY, None
+    if registry is not None:
+        await registry.aclose()
+    close_pools()
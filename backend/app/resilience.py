@@ -0,0 +1,282 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import random
+import sys
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+
+import httpx
+
+from . import metrics
+
+
+T = TypeVar("T")
+
+TRANSPORT_ERRORS: tuple[type[BaseException], ...] = (httpx.TransportError, asyncio.TimeoutError)
+
+
+def retryable_errors() -> tuple[type[BaseException], ...]:
+    """Transient upstream errors worth retrying.
+
+    openai's error types are only included once the openai client has been
+    imported (by the Azure backend): until then none of them can be raised,
+    and other backends never import it.
+    """
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return TRANSPORT_ERRORS
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+        *TRANSPORT_ERRORS,
+    )
+
+
+def rejected_errors() -> tuple[type[BaseException], ...]:
+    """Errors that refuse this one request (bad request, content filter) rather than say the upstream is down."""
+    openai = sys.modules.get("openai")
+    return (openai.BadRequestError,) if openai is not None else ()
+
+
+class UpstreamUnavailable(RuntimeError):
+    """The call did not produce a result: circuit open, queue deadline passed, retries exhausted, or an error."""
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """Server-requested delay from a Retry-After / retry-after-ms header, if the error carries one."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None  # HTTP-date form; fall back to our own backoff.
+    return None
+
+
+def prompt_key(messages: list[dict[str, str]]) -> str:
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures; after ``reset_seconds`` lets one probe through."""
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            return True
+        # Half-open admits a single probe; everyone else fails fast until it reports back.
+        return False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    """Concurrency limit, single-flight, retries and a circuit breaker around one upstream (LLM or embeddings).
+
+    At most ``max_concurrency`` calls are in flight; a caller that cannot get a
+    slot within ``queue_timeout`` seconds fails fast instead of queueing forever.
+    Each attempt is bounded by ``call_timeout``. Retryable errors are retried up
+    to ``max_retries`` times with full-jitter exponential backoff, or after the
+    server's Retry-After when it fits under ``max_delay``. Calls sharing a key
+    while one is in flight await that call instead of issuing their own. Every
+    failure reaches the caller as UpstreamUnavailable, so one except clause
+    covers failover.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        queue_timeout: float,
+        call_timeout: float,
+        max_retries: int,
+        base_delay: float,
+        max_delay: float,
+        breaker: CircuitBreaker,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._in_use = 0
+
+    def _bind(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio primitives belong to one loop; a fresh asyncio.run gets fresh ones.
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+        return self._semaphore
+
+    async def call(self, fn: Callable[[], Awaitable[T]], key: str | None = None) -> T:
+        self._bind()
+        if key is None:
+            return await self._call(fn)
+        shared = self._inflight.get(key)
+        if shared is not None:
+            metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="coalesced")
+            return await asyncio.shield(shared)
+        future = asyncio.ensure_future(self._call(fn))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        semaphore = self._bind()
+        attempt = 0
+        while True:
+            await self._acquire(semaphore)
+            try:
+                result = await asyncio.wait_for(fn(), self.call_timeout)
+            except Exception as exc:
+                delay = self._failed(exc, attempt)
+            except BaseException:
+                self._abandoned()
+                raise
+            else:
+                self.breaker.record_success()
+                metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="ok")
+                return result
+            finally:
+                self._release(semaphore)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """The items of a streamed call, holding the concurrency slot until the stream ends or is closed.
+
+        Items cannot be taken back once sent, so only opening the stream (up to
+        the first item) is retried; a failure after that ends the stream with
+        UpstreamUnavailable. Each item must arrive within ``call_timeout``.
+        Callers that stop early should close the iterator (``contextlib.aclosing``).
+        """
+        semaphore = self._bind()
+        attempt = 0
+        while True:
+            await self._acquire(semaphore)
+            stream = None
+            started = False
+            try:
+                stream = open_stream()
+                while True:
+                    try:
+                        item = await asyncio.wait_for(anext(stream), self.call_timeout)
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    yield item
+            except Exception as exc:
+                if not started:
+                    delay = self._failed(exc, attempt)
+                else:
+                    self.breaker.record_failure()
+                    metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="error")
+                    raise UpstreamUnavailable(f"{self.name}: stream broke off: {type(exc).__name__}") from exc
+            except BaseException:
+                self._abandoned()
+                raise
+            else:
+                self.breaker.record_success()
+                metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="ok")
+                return
+            finally:
+                if stream is not None and hasattr(stream, "aclose"):
+                    with contextlib.suppress(Exception):
+                        await stream.aclose()
+                self._release(semaphore)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _acquire(self, semaphore: asyncio.Semaphore) -> None:
+        if not self.breaker.allow():
+            metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="circuit_open")
+            raise UpstreamUnavailable(f"{self.name}: circuit open")
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome="queue_timeout")
+            self._abandoned()  # Do not leave the probe slot claimed.
+            raise UpstreamUnavailable(f"{self.name}: no capacity within {self.queue_timeout:g}s") from None
+        self._in_use += 1
+
+    def _release(self, semaphore: asyncio.Semaphore) -> None:
+        self._in_use -= 1
+        semaphore.release()
+        metrics.CIRCUIT_STATE.set(self.breaker.state, upstream=self.name)
+
+    def _failed(self, exc: Exception, attempt: int) -> float:
+        """Seconds to wait before retrying a failed attempt; raises UpstreamUnavailable when it is not retried."""
+        if isinstance(exc, retryable_errors()):
+            self.breaker.record_failure()
+            delay = self._backoff(attempt, exc)
+            if attempt < self.max_retries and delay is not None:
+                metrics.UPSTREAM_RETRIES.inc(upstream=self.name)
+                return delay
+            outcome = "error"
+        elif isinstance(exc, rejected_errors()):
+            # The upstream answered but refused this request (e.g. content filter): says nothing
+            # about its health either way, but a half-open probe must still settle.
+            self._abandoned()
+            outcome = "rejected"
+        else:
+            # Auth, permissions, a missing deployment: will not heal on its own, so it counts
+            # against the circuit like an outage instead of keeping it closed.
+            self.breaker.record_failure()
+            outcome = "error"
+        metrics.UPSTREAM_CALLS.inc(upstream=self.name, outcome=outcome)
+        raise UpstreamUnavailable(f"{self.name}: {type(exc).__name__}") from exc
+
+    def _abandoned(self) -> None:
+        if self.breaker.state == CircuitBreaker.HALF_OPEN:
+            self.breaker.record_failure()  # A probe that never reported back must not wedge the breaker half-open.
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float | None:
+        """Seconds to wait before the next attempt, or None when the server asks for longer than we allow."""
+        requested = retry_after_seconds(exc)
+        if requested is not None:
+            return requested if requested <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": ("closed", "open", "half_open")[self.breaker.state],
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self._in_use,
+            "coalescing": len(self._inflight),
+        }
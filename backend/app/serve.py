@@ -0,0 +1,151 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from .config import BASE_DIR, Settings, get_settings
+
+
+# A worker that died is replaced after this pause, so a crash loop cannot spin the CPU.
+RESTART_DELAY_SECONDS = 1.0
+LISTEN_BACKLOG = 2048
+
+
+def preload(settings: Settings) -> None:
+    """Parse the policy tables and load the FAISS index in this (parent) process, for the workers to inherit.
+
+    A missing index artifact is built by a separate process first: index
+    training starts OpenMP threads, and a process with threads must not fork.
+    Nothing here opens a connection; every worker builds its own clients.
+    """
+    from .fakes import FakeEmbeddings
+    from .policies import PolicyRegistry
+    from .rag import MANIFEST_FILE, index_fingerprint, load_index_artifact
+    from .registry import preload as preload_registry
+
+    policies = PolicyRegistry(settings.data_dir, settings.policy_reload_interval_seconds)
+    snapshot = policies.current()
+    artifact = settings.index_dir / index_fingerprint(settings, list(snapshot.kb_docs.values()))
+    if not (artifact / MANIFEST_FILE).exists():
+        subprocess.run([sys.executable, "-m", "backend.app.rag"], cwd=BASE_DIR.parent, check=True)
+    try:
+        # Placeholder embeddings: each worker plugs its own pooled, guarded client in.
+        store = load_index_artifact(artifact, FakeEmbeddings(), settings)
+    except (OSError, RuntimeError, ValueError, KeyError) as exc:
+        print(f"Index not preloaded ({type(exc).__name__}: {exc}); each worker loads its own.")
+        store = None
+    preload_registry(settings, policies, store, snapshot.kb_version)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def spawn_worker(app, sock: socket.socket, log_level: str) -> int:
+    """Fork one uvicorn worker accepting on the shared socket; returns its pid in the parent."""
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 1
+    try:
+        # Own process group: a terminal Ctrl-C reaches the parent only, which then stops
+        # the workers once each, instead of a second signal forcing them down mid-drain.
+        os.setpgid(0, 0)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        import uvicorn
+
+        uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[sock])
+        status = 0
+    finally:
+        os._exit(status)
+
+
+def serve(host: str, port: int, workers: int, log_level: str = "info", preload_state: bool = True) -> int:
+    """Pre-fork server: load shared state once, fork ``workers`` uvicorn processes and keep them running."""
+    settings = get_settings()
+    sock = bind_socket(host, port)
+    if preload_state:
+        preload(settings)
+    from .main import app
+
+    # Move everything loaded so far out of the collector's reach: a collection in a
+    # worker would otherwise write to (and so un-share) every page holding it.
+    gc.collect()
+    gc.freeze()
+
+    stopping = False
+    children: dict[int, int] = {}
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(workers):
+        children[spawn_worker(app, sock, log_level)] = slot
+    print(f"Serving on {host}:{port} with {workers} worker(s): {', '.join(map(str, children))}")
+
+    exit_code = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        exit_code = os.waitstatus_to_exitcode(status)
+        print(f"Worker {pid} exited with status {exit_code}; restarting it.")
+        time.sleep(RESTART_DELAY_SECONDS)
+        if not stopping:
+            children[spawn_worker(app, sock, log_level)] = slot
+    sock.close()
+    return exit_code if not stopping else 0
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Multi-process server sharing the index and caches across workers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument(
+        "--no-preload",
+        action="store_true",
+        help="Let every worker load the policies and index itself (for comparison).",
+    )
+    args = parser.parse_args()
+    if args.workers < 1:
+        raise SystemExit("--workers must be at least 1.")
+
+    load_dotenv()
+    if args.workers > 1:
+        # Per-process stores would fragment: the next turn of a session may land on another worker.
+        os.environ.setdefault("APP_SESSION_BACKEND", "sqlite")
+        os.environ.setdefault("APP_SHARED_CACHE_PATH", str(BASE_DIR / "data" / "shared_cache.db"))
+        if os.environ["APP_SESSION_BACKEND"].strip().lower() != "sqlite":
+            raise SystemExit("APP_SESSION_BACKEND must be 'sqlite' with more than one worker.")
+    sys.exit(serve(args.host, args.port, args.workers, args.log_level, preload_state=not args.no_preload))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+
+from .config import Settings
+
+
+class SessionStore(ABC):
+    """Conversation history per session_id, capped at ``max_messages`` per session.
+
+    Each session also carries a running summary of the messages trimmed off its front.
+    """
+
+    def __init__(self, max_messages: int, ttl_seconds: float, max_sessions: int):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+
+    @abstractmethod
+    def get_history(self, session_id: str) -> list[dict[str, str]]:
+        ...
+
+    @abstractmethod
+    def append(self, session_id: str, role: str, content: str) -> list[dict[str, str]]:
+        """Add a message; returns the oldest messages evicted to stay within ``max_messages``."""
+
+    @abstractmethod
+    def get_summary(self, session_id: str) -> str:
+        ...
+
+    @abstractmethod
+    def set_summary(self, session_id: str, summary: str) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict[str, int]:
+        """Gauges: live sessions, stored messages and approximate bytes held."""
+
+    def close(self) -> None:
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """LRU + TTL store; sessions are ordered by last use so expiry pops from the front."""
+
+    def __init__(self, max_messages: int, ttl_seconds: float, max_sessions: int):
+        super().__init__(max_messages, ttl_seconds, max_sessions)
+        self._sessions: OrderedDict[str, tuple[float, list[dict[str, str]]]] = OrderedDict()
+        self._summaries: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+    def _drop(self, session_id: str) -> None:
+        _, messages = self._sessions.pop(session_id)
+        self._bytes -= sum(len(m["content"]) for m in messages)
+        self._bytes -= len(self._summaries.pop(session_id, ""))
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            session_id, (touched, _) = next(iter(self._sessions.items()))
+            if now - touched <= self.ttl_seconds:
+                break
+            self._drop(session_id)
+
+    def get_history(self, session_id: str) -> list[dict[str, str]]:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            return list(entry[1])
+
+    def append(self, session_id: str, role: str, content: str) -> list[dict[str, str]]:
+        now = time.monotonic()
+        dropped: list[dict[str, str]] = []
+        with self._lock:
+            self._expire(now)
+            _, messages = self._sessions.get(session_id, (now, []))
+            messages.append({"role": role, "content": content})
+            self._bytes += len(content)
+            if len(messages) > self.max_messages:
+                dropped = messages[: -self.max_messages]
+                self._bytes -= sum(len(m["content"]) for m in dropped)
+                del messages[: -self.max_messages]
+            self._sessions[session_id] = (now, messages)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._drop(next(iter(self._sessions)))
+        return dropped
+
+    def get_summary(self, session_id: str) -> str:
+        with self._lock:
+            return self._summaries.get(session_id, "") if session_id in self._sessions else ""
+
+    def set_summary(self, session_id: str, summary: str) -> None:
+        with self._lock:
+            if session_id in self._sessions:
+                self._bytes += len(summary) - len(self._summaries.get(session_id, ""))
+                self._summaries[session_id] = summary
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(messages) for _, messages in self._sessions.values()),
+                "bytes": self._bytes,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Shared on-disk store (WAL mode) so every uvicorn worker sees the same sessions."""
+
+    # Expiry and LRU trimming are amortized over this many appends.
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: Path, max_messages: int, ttl_seconds: float, max_sessions: int):
+        super().__init__(max_messages, ttl_seconds, max_sessions)
+        self.path = path
+        self._local = threading.local()
+        # Every thread's connection (request threads, asyncio.to_thread workers), so close() reaches them all.
+        self._connections: set[sqlite3.Connection] = set()
+        self._connections_lock = threading.Lock()
+        self._appends = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL,
+                summary TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at);
+            CREATE TABLE IF NOT EXISTS session_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_session_messages_session ON session_messages(session_id, id);
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "summary" not in columns:
+            # Stores created before session summaries existed.
+            conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Used only by the thread that opened it; check_same_thread is off so close() can close it.
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.add(conn)
+        return conn
+
+    def get_history(self, session_id: str) -> list[dict[str, str]]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_seconds:
+            return []
+        rows = conn.execute(
+            "SELECT role, content FROM session_messages WHERE session_id = ? ORDER BY id",
+            (session_id,),
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, session_id: str, role: str, content: str) -> list[dict[str, str]]:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is not None and now - row[0] > self.ttl_seconds:
+                conn.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+                conn.execute("UPDATE sessions SET summary = '' WHERE session_id = ?", (session_id,))
+            conn.execute(
+                "INSERT INTO sessions (session_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (session_id, now),
+            )
+            conn.execute(
+                "INSERT INTO session_messages (session_id, role, content) VALUES (?, ?, ?)",
+                (session_id, role, content),
+            )
+            dropped = conn.execute(
+                "DELETE FROM session_messages WHERE session_id = ? AND id NOT IN ("
+                "SELECT id FROM session_messages WHERE session_id = ? ORDER BY id DESC LIMIT ?) "
+                "RETURNING id, role, content",
+                (session_id, session_id, self.max_messages),
+            ).fetchall()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._appends += 1
+        if self._appends % self.PRUNE_EVERY == 0:
+            self.prune()
+        return [{"role": role, "content": content} for _, role, content in sorted(dropped)]
+
+    def get_summary(self, session_id: str) -> str:
+        row = self._conn().execute(
+            "SELECT updated_at, summary FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_seconds:
+            return ""
+        return row[1]
+
+    def set_summary(self, session_id: str, summary: str) -> None:
+        self._conn().execute("UPDATE sessions SET summary = ? WHERE session_id = ?", (summary, session_id))
+
+    def prune(self) -> None:
+        """Drop expired sessions and the least recently used ones beyond max_sessions."""
+        conn = self._conn()
+        cutoff = time.time() - self.ttl_seconds
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ? OR session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (cutoff, self.max_sessions),
+            )
+            conn.execute(
+                "DELETE FROM session_messages WHERE session_id NOT IN (SELECT session_id FROM sessions)"
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> dict[str, int]:
+        conn = self._conn()
+        sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        messages = conn.execute("SELECT COUNT(*) FROM session_messages").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {"sessions": sessions, "messages": messages, "bytes": page_count * page_size}
+
+    def close(self) -> None:
+        """Close the connections of every thread that used the store; idle WAL readers go with them."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            conn.close()
+        self._local.conn = None
+
+
+def build_session_store(settings: Settings) -> SessionStore:
+    if settings.session_backend == "sqlite":
+        return SQLiteSessionStore(
+            settings.session_db_path,
+            max_messages=settings.session_max_messages,
+            ttl_seconds=settings.session_ttl_seconds,
+            max_sessions=settings.session_max_sessions,
+        )
+    return InMemorySessionStore(
+        max_messages=settings.session_max_messages,
+        ttl_seconds=settings.session_ttl_seconds,
+        max_sessions=settings.session_max_sessions,
+    )
@@ -0,0 +1,295 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .sql import SQLITE_MAX_PARAMS
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+INSERT_EMBEDDING = "INSERT OR IGNORE INTO embeddings (identity, key, vector) VALUES (?, ?, ?)"
+INSERT_RESPONSE = (
+    "INSERT INTO responses (version, bucket, vector, response, created_at, origin) VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+_STOP = object()
+
+
+class SharedCache:
+    """Cache tables shared by every worker process through one SQLite file (WAL mode).
+
+    Holds query embeddings and cached LLM decisions, so what one worker computed
+    is reused by the others instead of each warming its own copy. It sits behind
+    the in-process caches, which stay the first lookup.
+
+    Reads are blocking calls; async callers run them in a thread. Writes only
+    enqueue: a background thread commits them in batched transactions, so lock
+    contention on the file never stalls a request. Everything here is best
+    effort: a busy or unreadable file counts as a miss, and a write that fails
+    or finds the queue full is dropped.
+    """
+
+    # Size and TTL trimming are amortized over this many committed batches per process.
+    PRUNE_EVERY = 200
+
+    def __init__(
+        self,
+        path: Path,
+        max_embeddings: int = 4096,
+        max_responses: int = 1024,
+        response_ttl_seconds: float = 900.0,
+        busy_timeout: float = 0.25,
+        write_timeout: float = 5.0,
+        max_pending: int = 1000,
+        batch_size: int = 256,
+    ):
+        self.path = path
+        self.max_embeddings = max_embeddings
+        self.max_responses = max_responses
+        self.response_ttl_seconds = response_ttl_seconds
+        self.busy_timeout = busy_timeout
+        self.write_timeout = write_timeout
+        self.batch_size = batch_size
+        # Tags the decisions this process publishes, so it does not merge them back in.
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        # Every reader thread's connection (asyncio.to_thread workers), so close() reaches them all.
+        self._connections: set[sqlite3.Connection] = set()
+        self._connections_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._batches = 0
+        self._closed = False
+        self.errors = 0
+        self.dropped = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    identity TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    UNIQUE (identity, key)
+                );
+                CREATE TABLE IF NOT EXISTS responses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    version TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    origin TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_responses_version ON responses(version, id);
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(responses)")}
+            if "origin" not in columns:
+                conn.execute("ALTER TABLE responses ADD COLUMN origin TEXT")  # A file from before origins.
+        finally:
+            conn.close()
+        self._writer = threading.Thread(target=self._run, name="shared-cache-writer", daemon=True)
+        self._writer.start()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Used only by the thread that opened it; check_same_thread is off so close() can close it.
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.add(conn)
+        return conn
+
+    def get_embeddings(self, identity: str, keys: list[str]) -> dict[str, list[float]]:
+        """The vectors stored for ``keys`` (blocking); missing keys are left out."""
+        import numpy as np
+
+        found: dict[str, list[float]] = {}
+        try:
+            conn = self._conn()
+            for start in range(0, len(keys), SQLITE_MAX_PARAMS):
+                chunk = keys[start : start + SQLITE_MAX_PARAMS]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE identity = ? AND key IN ({','.join('?' * len(chunk))})",
+                    [identity, *chunk],
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+        except sqlite3.Error:
+            self.errors += 1
+        return found
+
+    def get_embedding(self, identity: str, key: str) -> list[float] | None:
+        return self.get_embeddings(identity, [key]).get(key)
+
+    def put_embeddings(self, identity: str, items: list[tuple[str, list[float]]]) -> None:
+        """Queue vectors for the writer thread; returns at once."""
+        if not items:
+            return
+        import numpy as np
+
+        rows = [(identity, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+        self._submit(INSERT_EMBEDDING, rows)
+
+    def responses_since(self, version: str, after_id: int) -> "list[tuple[int, str, np.ndarray, dict[str, Any], float]]":
+        """Unexpired decisions other processes stored for ``version`` after ``after_id`` (blocking).
+
+        Rows are (id, bucket, vector, response, created_at).
+        """
+        import numpy as np
+
+        try:
+            rows = self._conn().execute(
+                "SELECT id, bucket, vector, response, created_at FROM responses "
+                "WHERE version = ? AND id > ? AND created_at >= ? AND origin IS NOT ? ORDER BY id",
+                (version, after_id, time.time() - self.response_ttl_seconds, self.origin),
+            ).fetchall()
+        except sqlite3.Error:
+            self.errors += 1
+            return []
+        return [
+            (entry_id, bucket, np.frombuffer(vector, dtype=np.float32), json.loads(response), created_at)
+            for entry_id, bucket, vector, response, created_at in rows
+        ]
+
+    def put_response(self, version: str, bucket: str, vector: "np.ndarray", response: dict[str, Any]) -> None:
+        """Queue a decision for the writer thread; returns at once."""
+        import numpy as np
+
+        row = (
+            version,
+            bucket,
+            np.asarray(vector, dtype=np.float32).tobytes(),
+            json.dumps(response),
+            time.time(),
+            self.origin,
+        )
+        self._submit(INSERT_RESPONSE, [row])
+
+    def _submit(self, sql: str, rows: list[tuple]) -> None:
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait((sql, rows))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until every queued write is committed or dropped; False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.path, timeout=self.write_timeout, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                writes = []
+                for item in batch:
+                    if item is _STOP:
+                        stopping = True
+                    else:
+                        writes.append(item)
+                if writes:
+                    self._commit(conn, writes)
+                for _ in batch:
+                    self._queue.task_done()
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, writes: list[tuple[str, list[tuple]]]) -> None:
+        grouped: dict[str, list[tuple]] = {}
+        for sql, rows in writes:
+            grouped.setdefault(sql, []).extend(rows)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, rows in grouped.items():
+                    conn.executemany(sql, rows)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            self.errors += 1
+            return
+        self._batches += 1
+        if self._batches % self.PRUNE_EVERY == 0:
+            self._prune(conn)
+
+    def prune(self) -> None:
+        """Drop expired decisions, and the oldest rows beyond each table's cap."""
+        self._prune(self._conn())
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM responses WHERE created_at < ? OR id <= (SELECT MAX(id) FROM responses) - ?",
+                    (time.time() - self.response_ttl_seconds, self.max_responses),
+                )
+                conn.execute(
+                    "DELETE FROM embeddings WHERE id <= (SELECT MAX(id) FROM embeddings) - ?",
+                    (self.max_embeddings,),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self) -> dict[str, int]:
+        try:
+            conn = self._conn()
+            embeddings = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            responses = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        except sqlite3.Error:
+            self.errors += 1
+            return {"errors": self.errors, "pending": self._queue.qsize(), "dropped": self.dropped}
+        return {
+            "embeddings": embeddings,
+            "responses": responses,
+            "bytes": page_count * page_size,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Commit what is queued, then stop the writer."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+            self._writer.join(timeout)
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            conn.close()
+        self._local.conn = None
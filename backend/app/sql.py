@@ -1,11 +1,30 @@
+import asyncio
+import os
 import re
-
-from langchain.chains import create_sql_query_chain
-from langchain_community.utilities import SQLDatabase
-from langchain_openai import AzureChatOpenAI
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
 
 from .config import Settings
 
+if TYPE_CHECKING:
+    from langchain_community.utilities import SQLDatabase
+    from langchain_core.language_models.chat_models import BaseChatModel
+
+
+# Stay under SQLite's default bound-parameter limit on older builds.
+SQLITE_MAX_PARAMS = 900
+
+# Rolling windows reported for complaint aggregates, in days.
+SHORT_WINDOW_DAYS = 7
+LONG_WINDOW_DAYS = 30
+
+# Per-connection cache of compiled statements, keyed on SQL text; pooled connections keep it warm.
+CACHED_STATEMENTS = 256
 
 DISALLOWED_SQL = re.compile(
     r"\b(INSERT|UPDATE|DELETE|DROP|ALTER|PRAGMA|ATTACH|DETACH|REPLACE)\b",
@@ -27,20 +46,440 @@ def is_safe_select(sql: str, allowed_tables: list[str]) -> bool:
     return table_ok
 
 
-def run_text_to_sql(question: str, settings: Settings) -> str | None:
+class ConnectionPool:
+    """Thread-safe pool of read-only SQLite connections to one database file.
+
+    Opening a connection re-reads the schema and throws away the statement
+    cache, which costs more than the indexed lookup itself; pooled connections
+    keep both. Connections are opened ``mode=ro`` with ``query_only`` set, and
+    at most ``size`` idle ones are kept. When the file is replaced (new inode,
+    e.g. an atomic rename by a re-import), idle connections to the old file are
+    closed rather than reused.
+    """
+
+    def __init__(self, db_path: Path, size: int = 8, mmap_size_mb: int = 256, cache_size_mb: int = 16):
+        self.db_path = Path(db_path)
+        self.size = size
+        self.mmap_size_mb = mmap_size_mb
+        self.cache_size_mb = cache_size_mb
+        self._idle: list[tuple[tuple[int, int] | None, sqlite3.Connection]] = []
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _file_id(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"{self.db_path.resolve().as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size_mb * 1024 * 1024}")
+        conn.execute(f"PRAGMA cache_size={-self.cache_size_mb * 1024}")  # Negative means KiB.
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA query_only=ON")
+        self.opened += 1
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        file_id = self._file_id()
+        stale: list[sqlite3.Connection] = []
+        conn = None
+        with self._lock:
+            while self._idle:
+                idle_id, candidate = self._idle.pop()
+                if idle_id == file_id:
+                    conn = candidate
+                    break
+                stale.append(candidate)
+        for old in stale:
+            old.close()
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            conn.close()
+            raise
+        except BaseException:
+            self._release(file_id, conn)
+            raise
+        else:
+            self._release(file_id, conn)
+
+    def _release(self, file_id: tuple[int, int] | None, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((file_id, conn))
+                return
+        conn.close()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            idle = len(self._idle)
+        return {"idle": idle, "opened": self.opened}
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, conn in idle:
+            conn.close()
+
+
+_POOLS: dict[tuple, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(settings: Settings) -> ConnectionPool:
+    """The shared pool for ``settings.db_path``, created on first use."""
+    key = (str(settings.db_path), settings.db_pool_size, settings.db_mmap_size_mb, settings.db_cache_size_mb)
+    pool = _POOLS.get(key)
+    if pool is not None:
+        return pool
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                settings.db_path,
+                size=settings.db_pool_size,
+                mmap_size_mb=settings.db_mmap_size_mb,
+                cache_size_mb=settings.db_cache_size_mb,
+            )
+            _POOLS[key] = pool
+        return pool
+
+
+def close_pools() -> None:
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
+@dataclass(frozen=True)
+class ComplaintRecord:
+    order_id: str
+    complaint_type: str
+    resolution: str
+    created_at: str
+
+
+@dataclass(frozen=True)
+class ComplaintAggregate:
+    """Precomputed complaint counts for one order, customer or restaurant."""
+
+    scope: str
+    key: str
+    total: int
+    recent_short: int
+    recent_long: int
+    last_complaint_at: str | None
+    last_complaint_type: str | None
+    last_resolution: str | None
+
+    def summary(self) -> str:
+        return (
+            f"{self.scope} {self.key}: {self.total} complaint(s) "
+            f"({SHORT_WINDOW_DAYS}d {self.recent_short}, {LONG_WINDOW_DAYS}d {self.recent_long}); "
+            f"last {self.last_complaint_at} {self.last_complaint_type} -> {self.last_resolution}"
+        )
+
+
+@dataclass(frozen=True)
+class ComplaintHistory:
+    order_id: str
+    records: list[ComplaintRecord] = field(default_factory=list)
+    counts_by_type: dict[str, int] = field(default_factory=dict)
+    latest_resolution: str | None = None
+    aggregates: list[ComplaintAggregate] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        for aggregate in self.aggregates:
+            if aggregate.scope == "order":
+                return aggregate.total
+        return sum(self.counts_by_type.values())
+
+    def scope_total(self, scope: str) -> int:
+        """Complaint total for the order's ``scope`` ("order", "customer" or "restaurant"); 0 when none is recorded."""
+        return next((aggregate.total for aggregate in self.aggregates if aggregate.scope == scope), 0)
+
+    @property
+    def clean(self) -> bool:
+        """No complaints on record for the order, its customer or its restaurant."""
+        return not self.total and not any(aggregate.total for aggregate in self.aggregates)
+
+    def summary(self) -> str | None:
+        """Compact, prompt-ready description of the order's complaint history."""
+        aggregates = [aggregate for aggregate in self.aggregates if aggregate.total]
+        if aggregates:
+            # Order, customer and restaurant signals in a line each, then the order's recent complaints.
+            lines = [aggregate.summary() for aggregate in aggregates]
+        elif self.total:
+            counts = ", ".join(f"{ctype} x{count}" for ctype, count in self.counts_by_type.items())
+            lines = [f"{self.total} prior complaint(s): {counts}; most recent resolution: {self.latest_resolution}"]
+        else:
+            return None
+        lines.extend(
+            f"- {record.created_at} {record.complaint_type} -> {record.resolution}"
+            for record in self.records
+        )
+        return "\n".join(lines)
+
+
+def _missing_schema(exc: sqlite3.OperationalError) -> bool:
+    """True for a database from before the aggregate tables and the orders columns they are keyed on."""
+    return str(exc).startswith(("no such table", "no such column"))
+
+
+class ComplaintRepository:
+    """Parameterized, read-only queries over the complaints table."""
+
+    HISTORY_SQL = (
+        "SELECT order_id, complaint_type, resolution, created_at FROM complaints "
+        "WHERE order_id = ? ORDER BY created_at DESC LIMIT ?"
+    )
+    COUNTS_BY_TYPE_SQL = (
+        "SELECT complaint_type, COUNT(*) FROM complaints "
+        "WHERE order_id = ? GROUP BY complaint_type ORDER BY COUNT(*) DESC, complaint_type"
+    )
+    ALL_COUNTS_BY_TYPE_SQL = (
+        "SELECT complaint_type, COUNT(*) FROM complaints "
+        "GROUP BY complaint_type ORDER BY COUNT(*) DESC, complaint_type"
+    )
+    LATEST_RESOLUTION_SQL = (
+        "SELECT resolution FROM complaints WHERE order_id = ? ORDER BY created_at DESC LIMIT 1"
+    )
+    # One statement, primary-key lookups only: the order's aggregate row plus its customer's and
+    # restaurant's, each with rolling-window counts summed from at most LONG_WINDOW_DAYS daily rows.
+    AGGREGATES_SQL = """
+        SELECT a.scope, a.scope_key, a.total,
+            (SELECT COALESCE(SUM(d.complaints), 0) FROM complaint_daily d
+             WHERE d.scope = a.scope AND d.scope_key = a.scope_key AND d.day >= :short_since),
+            (SELECT COALESCE(SUM(d.complaints), 0) FROM complaint_daily d
+             WHERE d.scope = a.scope AND d.scope_key = a.scope_key AND d.day >= :long_since),
+            a.last_complaint_at, a.last_complaint_type, a.last_resolution
+        FROM complaint_aggregates a
+        WHERE (a.scope = 'order' AND a.scope_key = :order_id)
+            OR (a.scope = 'customer' AND a.scope_key = (SELECT customer_id FROM orders WHERE order_id = :order_id))
+            OR (a.scope = 'restaurant' AND a.scope_key = (SELECT restaurant_id FROM orders WHERE order_id = :order_id))
+        ORDER BY CASE a.scope WHEN 'order' THEN 0 WHEN 'customer' THEN 1 ELSE 2 END
+    """
+
+    # The batch form of AGGREGATES_SQL, for one scope: ? = scope, short_since, long_since, then the keys.
+    SCOPE_AGGREGATES_SQL = """
+        SELECT a.scope, a.scope_key, a.total,
+            (SELECT COALESCE(SUM(d.complaints), 0) FROM complaint_daily d
+             WHERE d.scope = a.scope AND d.scope_key = a.scope_key AND d.day >= ?2),
+            (SELECT COALESCE(SUM(d.complaints), 0) FROM complaint_daily d
+             WHERE d.scope = a.scope AND d.scope_key = a.scope_key AND d.day >= ?3),
+            a.last_complaint_at, a.last_complaint_type, a.last_resolution
+        FROM complaint_aggregates a
+        WHERE a.scope = ?1 AND a.scope_key IN ({placeholders})
+    """
+
+    def __init__(self, db_path: Path, history_limit: int = 5, pool: ConnectionPool | None = None):
+        self.db_path = db_path
+        self.history_limit = history_limit
+        self.pool = pool
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+            return
+        conn = sqlite3.connect(self.db_path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def history_for_order(self, order_id: str, limit: int | None = None) -> list[ComplaintRecord]:
+        with self._connection() as conn:
+            rows = conn.execute(self.HISTORY_SQL, (order_id, limit or self.history_limit)).fetchall()
+        return [ComplaintRecord(*row) for row in rows]
+
+    def counts_by_type(self, order_id: str | None = None) -> dict[str, int]:
+        with self._connection() as conn:
+            if order_id is None:
+                rows = conn.execute(self.ALL_COUNTS_BY_TYPE_SQL).fetchall()
+            else:
+                rows = conn.execute(self.COUNTS_BY_TYPE_SQL, (order_id,)).fetchall()
+        return {ctype: count for ctype, count in rows}
+
+    def latest_resolution(self, order_id: str) -> str | None:
+        with self._connection() as conn:
+            row = conn.execute(self.LATEST_RESOLUTION_SQL, (order_id,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _window_starts(today: date | None = None) -> tuple[str, str]:
+        today = today or date.today()
+        return (
+            (today - timedelta(days=SHORT_WINDOW_DAYS - 1)).isoformat(),
+            (today - timedelta(days=LONG_WINDOW_DAYS - 1)).isoformat(),
+        )
+
+    def _aggregates(self, conn: sqlite3.Connection, order_id: str, today: date | None = None) -> list[ComplaintAggregate]:
+        short_since, long_since = self._window_starts(today)
+        params = {"order_id": order_id, "short_since": short_since, "long_since": long_since}
+        return [ComplaintAggregate(*row) for row in conn.execute(self.AGGREGATES_SQL, params)]
+
+    def _aggregates_for_chunk(
+        self, conn: sqlite3.Connection, order_ids: list[str], today: date | None = None
+    ) -> dict[str, list[ComplaintAggregate]]:
+        """Aggregates for up to SQLITE_MAX_PARAMS orders: one orders query, then one query per scope."""
+        placeholders = ",".join("?" * len(order_ids))
+        owners = conn.execute(
+            f"SELECT order_id, customer_id, restaurant_id FROM orders WHERE order_id IN ({placeholders})",
+            order_ids,
+        ).fetchall()
+        keys_by_scope = {
+            "order": {order_id: order_id for order_id in order_ids},
+            "customer": {row[0]: row[1] for row in owners if row[1] is not None},
+            "restaurant": {row[0]: row[2] for row in owners if row[2] is not None},
+        }
+        window = self._window_starts(today)
+        aggregates: dict[str, list[ComplaintAggregate]] = {order_id: [] for order_id in order_ids}
+        # Scopes in the order AGGREGATES_SQL returns them: order, customer, restaurant.
+        for scope, keys in keys_by_scope.items():
+            unique_keys = list(dict.fromkeys(keys.values()))
+            if not unique_keys:
+                continue
+            rows = conn.execute(
+                self.SCOPE_AGGREGATES_SQL.format(placeholders=",".join("?" * len(unique_keys))),
+                [scope, *window, *unique_keys],
+            ).fetchall()
+            by_key = {row[1]: ComplaintAggregate(*row) for row in rows}
+            for order_id, key in keys.items():
+                if key in by_key:
+                    aggregates[order_id].append(by_key[key])
+        return aggregates
+
+    def aggregates_for_order(self, order_id: str, today: date | None = None) -> list[ComplaintAggregate]:
+        with self._connection() as conn:
+            return self._aggregates(conn, order_id, today)
+
+    def get_history(self, order_id: str, conn: sqlite3.Connection | None = None) -> ComplaintHistory:
+        """All complaint facts for one order, read over a single connection (``conn`` when given)."""
+        if conn is None:
+            with self._connection() as conn:
+                return self.get_history(order_id, conn)
+        records = [ComplaintRecord(*row) for row in conn.execute(self.HISTORY_SQL, (order_id, self.history_limit))]
+        try:
+            aggregates = self._aggregates(conn, order_id)
+        except sqlite3.OperationalError as exc:
+            if not _missing_schema(exc):
+                raise
+            # A database from before the trigger-maintained aggregate tables: count the slow way.
+            counts = conn.execute(self.COUNTS_BY_TYPE_SQL, (order_id,)).fetchall()
+            latest = conn.execute(self.LATEST_RESOLUTION_SQL, (order_id,)).fetchone()
+            return ComplaintHistory(
+                order_id=order_id,
+                records=records,
+                counts_by_type=dict(counts),
+                latest_resolution=latest[0] if latest else None,
+            )
+        order_aggregate = next((a for a in aggregates if a.scope == "order"), None)
+        return ComplaintHistory(
+            order_id=order_id,
+            records=records,
+            latest_resolution=order_aggregate.last_resolution if order_aggregate else None,
+            aggregates=aggregates,
+        )
+
+    def histories_for_orders(self, order_ids: list[str]) -> dict[str, ComplaintHistory]:
+        """Complaint history for many orders with one ``IN (...)`` query per chunk of IDs."""
+        rows_by_order: dict[str, list[tuple]] = {order_id: [] for order_id in order_ids}
+        unique_ids = list(rows_by_order)
+        aggregates: dict[str, list[ComplaintAggregate]] = {}
+        has_aggregates = True
+        with self._connection() as conn:
+            for start in range(0, len(unique_ids), SQLITE_MAX_PARAMS):
+                chunk = unique_ids[start : start + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    "SELECT order_id, complaint_type, resolution, created_at FROM complaints "
+                    f"WHERE order_id IN ({placeholders}) ORDER BY order_id, created_at DESC",
+                    chunk,
+                ).fetchall()
+                for row in rows:
+                    rows_by_order[row[0]].append(row)
+                if has_aggregates:
+                    try:
+                        aggregates.update(self._aggregates_for_chunk(conn, chunk))
+                    except sqlite3.OperationalError as exc:
+                        if not _missing_schema(exc):
+                            raise
+                        has_aggregates = False  # From before the aggregate tables: counts come from the rows.
+
+        histories = {}
+        for order_id, rows in rows_by_order.items():
+            counts: dict[str, int] = {}
+            for row in rows:
+                counts[row[1]] = counts.get(row[1], 0) + 1
+            histories[order_id] = ComplaintHistory(
+                order_id=order_id,
+                records=[ComplaintRecord(*row) for row in rows[: self.history_limit]],
+                counts_by_type=dict(sorted(counts.items(), key=lambda item: (-item[1], item[0]))),
+                latest_resolution=rows[0][2] if rows else None,
+                aggregates=aggregates.get(order_id, []),
+            )
+        return histories
+
+
+def get_complaint_history(order_id: str, settings: Settings) -> ComplaintHistory:
+    return ComplaintRepository(settings.db_path, pool=get_pool(settings)).get_history(order_id)
+
+
+async def aget_complaint_history(order_id: str, settings: Settings) -> ComplaintHistory:
+    return await asyncio.to_thread(get_complaint_history, order_id, settings)
+
+
+def build_text_to_sql_chain(settings: Settings, llm: "BaseChatModel | None" = None):
+    # Imported here: langchain.chains and SQLAlchemy are only needed when analytics is enabled.
+    from langchain.chains import create_sql_query_chain
+    from langchain_community.utilities import SQLDatabase
+    from langchain_openai import AzureChatOpenAI
+
     db = SQLDatabase.from_uri(f"sqlite:///{settings.db_path}")
-    llm = AzureChatOpenAI(
+    llm = llm or AzureChatOpenAI(
         azure_endpoint=settings.azure_endpoint,
         api_key=settings.azure_api_key,
         api_version=settings.azure_api_version,
         azure_deployment=settings.azure_deployment,
         temperature=0,
     )
-    chain = create_sql_query_chain(llm, db)
-    sql = chain.invoke({"question": question})
+    return db, create_sql_query_chain(llm, db)
+
+
+def _clean_generated_sql(sql) -> str:
     if isinstance(sql, dict):
         sql = sql.get("result", "")
-    sql = str(sql).replace("SQLQuery:", "").strip()
+    return str(sql).replace("SQLQuery:", "").strip()
+
+
+def run_text_to_sql(question: str, db: "SQLDatabase", chain) -> str | None:
+    sql = _clean_generated_sql(chain.invoke({"question": question}))
     if not is_safe_select(sql, ["orders", "complaints", "policies"]):
         return None
     return db.run(sql)
+
+
+async def arun_text_to_sql(question: str, db: "SQLDatabase", chain) -> str | None:
+    # db.run is a blocking SQLAlchemy call; the LLM call is native async.
+    sql = _clean_generated_sql(await chain.ainvoke({"question": question}))
+    if not is_safe_select(sql, ["orders", "complaints", "policies"]):
+        return None
+    return await asyncio.to_thread(db.run, sql)
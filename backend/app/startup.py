@@ -0,0 +1,127 @@
+import asyncio
+import importlib
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Iterator
+
+from .config import Settings
+from .prompting import count_tokens
+from .registry import get_registry
+from .sql import get_pool
+
+
+WARMUP_QUERY = "my order arrived late and the food was cold"
+
+
+def process_age_seconds() -> float | None:
+    """Seconds since this process started (Linux only): interpreter, server and app imports included."""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as handle:
+            # The command name may contain spaces; fields after it are fixed.
+            fields = handle.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def backend_modules(settings: Settings) -> list[str]:
+    """Heavy client libraries the configured backends import lazily, in the order they are needed."""
+    modules = []
+    if settings.llm_backend == "azure":
+        modules.append("langchain_openai")
+        if settings.hf_embeddings_model:
+            modules.extend(["langchain_community.embeddings", "sentence_transformers"])
+    # The policy index is FAISS for every backend.
+    modules.extend(["numpy", "faiss", "langchain_community.vectorstores"])
+    if settings.text_to_sql_analytics:
+        modules.extend(["sqlalchemy", "langchain.chains"])
+    return modules
+
+
+class StartupReport:
+    """Per-phase timings of the warm-up, and whether this worker is ready to serve."""
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self.ready = False
+        self.error: str | None = None
+        self.warnings: list[str] = []
+        self.process_age_at_start = process_age_seconds()
+        self._started = time.perf_counter()
+        self.total_seconds: float | None = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def finish(self, error: str | None = None) -> None:
+        self.error = error
+        self.ready = error is None
+        self.total_seconds = time.perf_counter() - self._started
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "pid": os.getpid(),  # Which worker answered, under the multi-process launcher.
+            "ready": self.ready,
+            "error": self.error,
+            "warnings": self.warnings,
+            # Before the first phase: interpreter start plus the eager imports of the server and app.
+            "process_age_at_start_s": self.process_age_at_start,
+            "warmup_s": self.total_seconds,
+            "phases_s": self.phases,
+        }
+
+
+async def warm_up(settings: Settings, report: StartupReport) -> None:
+    """Import the configured backends, build clients, load the index and open pools before traffic.
+
+    Requests arriving earlier still work: each piece is built on first use
+    regardless, the warm-up only gets there first. ``report.ready`` flips once
+    every phase succeeded.
+    """
+    try:
+        for module in backend_modules(settings):
+            with report.phase(f"import:{module}"):
+                await asyncio.to_thread(importlib.import_module, module)
+        with report.phase("clients"):
+            registry = await asyncio.to_thread(get_registry, settings)
+        with report.phase("policies"):
+            await asyncio.to_thread(registry.policies.current)
+        with report.phase("vector_store"):
+            await asyncio.to_thread(registry.vector_store)
+        with report.phase("db_pool"):
+            await asyncio.to_thread(_open_pool, settings)
+        with report.phase("tokenizer"):
+            await asyncio.to_thread(count_tokens, WARMUP_QUERY, settings.tokenizer_encoding)
+        if settings.text_to_sql_analytics:
+            with report.phase("text_to_sql"):
+                await asyncio.to_thread(registry.text_to_sql)
+        if settings.warmup_prime_upstreams:
+            # One real embeddings call: loads a local model / opens the TLS connection to Azure.
+            # An upstream outage must not keep the worker unready: requests fail over without it.
+            with report.phase("prime_embeddings"):
+                try:
+                    await registry.embeddings.aembed_query(WARMUP_QUERY)
+                except Exception as exc:
+                    report.warnings.append(f"prime_embeddings: {type(exc).__name__}: {exc}")
+    except asyncio.CancelledError:
+        report.finish("warm-up cancelled")
+        raise
+    except Exception as exc:
+        report.finish(f"{type(exc).__name__}: {exc}")
+        return
+    report.finish()
+
+
+def _open_pool(settings: Settings) -> None:
+    """Fill the connection pool so the first requests skip connect and schema parsing."""
+    pool = get_pool(settings)
+    with ExitStack() as stack:
+        for _ in range(settings.db_pool_size):
+            stack.enter_context(pool.connection()).execute("SELECT 1 FROM orders LIMIT 1").fetchall()
@@ -0,0 +1,97 @@
+import json
+from typing import Any
+
+
+_END = object()
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class MessageFieldExtractor:
+    """Incrementally pulls the top-level "message" string out of a streamed JSON object.
+
+    feed() takes raw model output chunks and returns the newly decoded part of the
+    message value, so it can be forwarded to the client while the rest of the
+    object (resolution, escalate, ...) is still being generated.
+    """
+
+    FIELD = "message"
+
+    def __init__(self):
+        self.text = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = ""  # pending escape sequence, e.g. "\\" or "\\u00"
+        self._string = []
+        self._last_key: str | None = None
+        self._last_string: str | None = None
+        self._awaiting_value = False
+        self._streaming = False
+        self._done = False
+
+    def feed(self, chunk: str) -> str:
+        out: list[str] = []
+        for char in chunk:
+            if self._done:
+                break
+            if self._in_string:
+                decoded = self._string_char(char)
+                if decoded is None:
+                    continue
+                if decoded is _END:
+                    self._close_string()
+                    continue
+                self._string.append(decoded)
+                if self._streaming:
+                    out.append(decoded)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string = []
+                self._streaming = self._awaiting_value and self._depth == 1 and self._last_key == self.FIELD
+                self._awaiting_value = False
+            elif char in "{[":
+                self._depth += 1
+                self._awaiting_value = False
+            elif char in "}]":
+                self._depth -= 1
+            elif char == ":" and self._depth == 1:
+                self._last_key = self._last_string
+                self._awaiting_value = True
+            elif char == ",":
+                self._awaiting_value = False
+        delta = "".join(out)
+        self.text += delta
+        return delta
+
+    def _string_char(self, char: str):
+        if self._escape:
+            self._escape += char
+            if self._escape.startswith("\\u"):
+                if len(self._escape) < 6:
+                    return None
+                code, self._escape = self._escape[2:], ""
+                try:
+                    return chr(int(code, 16))
+                except ValueError:
+                    return ""
+            decoded, self._escape = _ESCAPES.get(char, char), ""
+            return decoded
+        if char == "\\":
+            self._escape = "\\"
+            return None
+        if char == '"':
+            return _END
+        return char
+
+    def _close_string(self) -> None:
+        self._in_string = False
+        self._last_string = "".join(self._string)
+        if self._streaming:
+            self._streaming = False
+            self._done = True
+
+
+def sse_event(event: str, data: Any) -> str:
+    """One Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,47 @@
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_REQUEST_ID: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# Listeners receive (stage, seconds) for every finished span. With none registered,
+# span() only pays for one truthiness check.
+_LISTENERS: list[Callable[[str, float], None]] = []
+
+
+def add_listener(listener: Callable[[str, float], None]) -> None:
+    _LISTENERS.append(listener)
+
+
+def remove_listener(listener: Callable[[str, float], None]) -> None:
+    _LISTENERS.remove(listener)
+
+
+def new_request_id(incoming: str | None = None) -> str:
+    """Adopt the caller's request ID (sanitized) or mint one, and bind it to the current context."""
+    request_id = (incoming or "").strip()[:64] or uuid.uuid4().hex
+    _REQUEST_ID.set(request_id)
+    return request_id
+
+
+def current_request_id() -> str | None:
+    return _REQUEST_ID.get()
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    if not _LISTENERS:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for listener in _LISTENERS:
+            listener(stage, elapsed)
@@ -0,0 +1,134 @@
+import argparse
+import dataclasses
+import json
+import os
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from .load_test import percentile
+
+
+REGIONS = 20
+
+
+def synthetic_corpus(count: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    """Unit vectors drawn around random centroids, roughly how topical policy chunks cluster."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centroids[rng.integers(0, clusters, count)] + 0.35 * rng.standard_normal((count, dimension)).astype(
+        np.float32
+    )
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def time_queries(search, queries: np.ndarray) -> tuple[list[list[int]], list[float]]:
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        ids = search(query[None, :])
+        latencies.append(time.perf_counter() - started)
+        results.append(ids)
+    return results, latencies
+
+
+def recall_at_k(results: list[list[int]], truth: list[list[int]], k: int) -> float:
+    hits = sum(len(set(found[:k]) & set(expected[:k])) for found, expected in zip(results, truth))
+    total = sum(min(k, len(expected)) for expected in truth)
+    return hits / total if total else 1.0
+
+
+def run(args: argparse.Namespace) -> dict:
+    from backend.app.config import get_settings
+    from backend.app.fakes import FakeEmbeddings
+    from backend.app.rag import _wrap_store, build_faiss_index, search_by_vectors
+
+    build_threads = faiss.omp_get_max_threads()
+    # Queries come from the same distribution but are not themselves in the corpus.
+    everything = synthetic_corpus(args.docs + args.queries, args.dim, args.clusters, args.seed)
+    vectors, queries = everything[: args.docs], everything[args.docs :]
+    rng = np.random.default_rng(args.seed + 1)
+    regions = rng.integers(0, REGIONS, args.docs)
+    doc_ids = [str(i) for i in range(args.docs)]
+    docs = [
+        Document(page_content="", metadata={"position": position, "region": f"r{region}"})
+        for position, region in enumerate(regions)
+    ]
+    base = get_settings()
+
+    report = {"docs": args.docs, "dim": args.dim, "queries": args.queries, "k": args.k, "indexes": {}}
+    truth = truth_filtered = None
+    for kind in ["flat", *[kind for kind in args.types if kind != "flat"]]:
+        settings = dataclasses.replace(base, index_type=kind, index_ann_min_docs=0)
+        faiss.omp_set_num_threads(build_threads)
+        started = time.perf_counter()
+        index = build_faiss_index(vectors, settings)
+        build_seconds = time.perf_counter() - started
+        store = _wrap_store(FakeEmbeddings(size=args.dim), index, doc_ids, docs)
+        faiss.omp_set_num_threads(args.threads)
+
+        def search(query, store=store):
+            _, indices = store.index.search(query, args.k)
+            return [int(i) for i in indices[0] if i != -1]
+
+        def search_filtered(query, store=store):
+            found = search_by_vectors(store, query.tolist(), args.k, filter={"region": "r0"})[0]
+            return [doc.metadata["position"] for doc in found]
+
+        results, latencies = time_queries(search, queries)
+        filtered, filtered_latencies = time_queries(search_filtered, queries)
+        if truth is None:
+            truth, truth_filtered = results, filtered
+        report["indexes"][kind] = {
+            "build_s": build_seconds,
+            "memory_mb": len(faiss.serialize_index(index)) / 1e6,
+            "recall_at_k": recall_at_k(results, truth, args.k),
+            "filtered_recall_at_k": recall_at_k(filtered, truth_filtered, args.k),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "filtered_p50_ms": percentile(filtered_latencies, 50) * 1000,
+        }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['docs']} docs x {report['dim']} dims, {report['queries']} queries, recall@{report['k']} vs flat")
+    print(
+        f"{'index':<8}{'build s':>10}{'MB':>10}{'recall':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'filt recall':>13}{'filt p50':>10}"
+    )
+    for kind, row in report["indexes"].items():
+        print(
+            f"{kind:<8}{row['build_s']:>10.2f}{row['memory_mb']:>10.1f}{row['recall_at_k']:>10.3f}"
+            f"{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['filtered_recall_at_k']:>13.3f}"
+            f"{row['filtered_p50_ms']:>10.3f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall, latency and memory of the FAISS index types vs flat search.")
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--types", nargs="+", default=["ivf", "hnsw", "pq"], help="Index types besides flat.")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads while querying (1 = per-request latency).")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", type=Path, help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    # Index knobs (APP_INDEX_NLIST, APP_INDEX_NPROBE, APP_INDEX_HNSW_*, APP_INDEX_PQ_M) come from the environment.
+    os.environ.setdefault("APP_LLM_BACKEND", "fake")
+    report = run(args)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
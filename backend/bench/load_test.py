@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import MutableMapping
+
+import httpx
+
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus.jsonl"
+DEFAULT_DB = Path(__file__).resolve().parents[1] / "data" / "complaints.db"
+
+
+def load_corpus(path: Path) -> list[dict]:
+    items = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line:
+            items.append(json.loads(line))
+    if not items:
+        raise SystemExit(f"Corpus {path} is empty.")
+    return items
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": max(values, default=0.0) * 1000,
+    }
+
+
+def rss_mb() -> float:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    # Set before importing the app so get_settings() picks the offline backends up.
+    if not args.live:
+        os.environ["APP_LLM_BACKEND"] = "fake"
+        os.environ["APP_FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+        os.environ["APP_FAKE_EMBEDDINGS_LATENCY_MS"] = str(args.embeddings_latency_ms)
+        os.environ["APP_FAKE_LLM_ERROR_RATE"] = str(args.llm_error_rate)
+    # Keep benchmark index artifacts away from the real ones.
+    os.environ.setdefault("APP_INDEX_DIR", tempfile.mkdtemp(prefix="bench-index-"))
+    isolate_database(os.environ)
+
+
+def isolate_database(env: MutableMapping[str, str]) -> None:
+    """Point the run at a scratch copy of the order database, and record the app's decisions into that copy."""
+    if "APP_DB_PATH" in env:
+        return
+    scratch = Path(tempfile.mkdtemp(prefix="bench-db-"))
+    shutil.copyfile(DEFAULT_DB, scratch / DEFAULT_DB.name)
+    env["APP_DB_PATH"] = str(scratch / DEFAULT_DB.name)
+    env.setdefault("APP_OUTCOME_JOURNAL_DIR", str(scratch / "outcomes"))
+    env.setdefault("APP_OUTCOME_RECORDING", "true")
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 300.0) -> dict:
+    """Poll /ready until the app finished its warm-up; returns the startup report."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        response = await client.get("/ready")
+        report = response.json()
+        if response.status_code == 200 or report.get("error") or time.perf_counter() > deadline:
+            return report
+        await asyncio.sleep(0.05)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    configure_environment(args)
+    from backend.app import tracing
+    from backend.app.main import app
+
+    corpus = load_corpus(args.corpus)
+    stages: dict[str, list[float]] = defaultdict(list)
+    tracing.add_listener(lambda stage, seconds: stages[stage].append(seconds))
+
+    latencies: list[float] = []
+    errors: dict[str, int] = defaultdict(int)
+    payloads = itertools.islice(itertools.cycle(corpus), args.requests)
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        while True:
+            try:
+                payload = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.post("/chat", json=payload)
+                if response.status_code != 200:
+                    errors[str(response.status_code)] += 1
+                    continue
+            except httpx.HTTPError as exc:
+                errors[type(exc).__name__] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            startup = await wait_ready(client)
+            await client.post("/chat", json=corpus[0])  # warm-up, excluded from the report
+            stages.clear()
+            rss_before = rss_mb()
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+            rss_after = rss_mb()
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "backend": "live" if args.live else "fake",
+        "llm_latency_ms": None if args.live else args.llm_latency_ms,
+        "embeddings_latency_ms": None if args.live else args.embeddings_latency_ms,
+        "startup": startup,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "errors": dict(errors),
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(values) for stage, values in sorted(stages.items())},
+        "rss_mb": {"before": rss_before, "after": rss_after, "growth": rss_after - rss_before},
+    }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['requests']} requests @ concurrency {report['concurrency']} ({report['backend']} backend): "
+        f"{report['throughput_rps']:.1f} req/s in {report['elapsed_s']:.2f}s, errors={report['errors'] or 0}"
+    )
+    print(f"RSS {report['rss_mb']['before']:.1f} -> {report['rss_mb']['after']:.1f} MB "
+          f"(+{report['rss_mb']['growth']:.1f} MB)")
+    startup = report.get("startup") or {}
+    if startup.get("warmup_s") is not None:
+        phases = ", ".join(f"{name} {seconds * 1000:.0f}" for name, seconds in startup["phases_s"].items())
+        print(f"warm-up {startup['warmup_s'] * 1000:.0f} ms ({phases}); ready={startup['ready']}")
+    print(f"{'stage':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = [("end_to_end", report["latency"])] + list(report["stages"].items())
+    for name, row in rows:
+        print(
+            f"{name:<20}{row['count']:>8}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            f"{row['p99_ms']:>10.2f}{row['max_ms']:>10.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load test for POST /chat.")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="JSONL of ChatRequest bodies.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--embeddings-latency-ms", type=float, default=50.0)
+    parser.add_argument(
+        "--llm-error-rate", type=float, default=0.0, help="Share of fake LLM calls that fail (exercises failover)."
+    )
+    parser.add_argument("--live", action="store_true", help="Use the configured Azure/HF backends instead of fakes.")
+    parser.add_argument("--json", type=Path, help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import dataclasses
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from .load_test import rss_mb, summarize
+
+
+MODES = ("vector", "hybrid", "lexical")
+KEYWORD_TEMPLATE = "Problem with my order: {}"
+
+
+def seed_labels(snapshot) -> list[dict]:
+    """A labeled set from the data itself: every policy keyword and every KB title, with the policies it names.
+
+    Keywords are folded into the BM25 index, so this set flatters the lexical
+    side; curate a JSONL of real complaint messages for decisions that matter.
+    """
+    labels: dict[str, dict] = {}
+
+    def add(message: str, policy_id: str, source: str) -> None:
+        entry = labels.setdefault(message, {"message": message, "expected": [], "source": source})
+        if policy_id not in entry["expected"]:
+            entry["expected"].append(policy_id)
+
+    for policy in snapshot.policies:
+        for keyword in policy.get("keywords", []):
+            add(KEYWORD_TEMPLATE.format(keyword), policy["policy_id"], "keyword")
+    for doc in snapshot.kb_docs.values():
+        add(doc.metadata["title"], doc.metadata["policy_id"], "title")
+    return list(labels.values())
+
+
+def load_labels(path: Path) -> list[dict]:
+    labels = []
+    for number, line in enumerate(path.read_text(encoding="utf-8").splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        expected = item.get("expected")
+        expected = [expected] if isinstance(expected, str) else expected
+        if not item.get("message") or not expected:
+            raise SystemExit(f"{path}:{number}: each line needs a 'message' and its 'expected' policy_id(s).")
+        labels.append({"message": item["message"], "expected": list(expected), "source": item.get("source", "file")})
+    if not labels:
+        raise SystemExit(f"Labeled set {path} is empty.")
+    return labels
+
+
+def backend_settings(base, backend: str):
+    """Settings whose build_embeddings gives ``backend``: 'fake', 'azure' or 'hf:<model>'."""
+    if backend == "fake":
+        return dataclasses.replace(base, llm_backend="fake", hf_embeddings_model=None)
+    if backend.startswith("hf:") and len(backend) > 3:
+        return dataclasses.replace(base, llm_backend="azure", hf_embeddings_model=backend[3:])
+    if backend == "azure":
+        if not (base.azure_endpoint and base.azure_api_key and base.azure_embeddings_deployment):
+            raise SystemExit(
+                "Backend 'azure' needs AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, "
+                "AZURE_OPENAI_API_VERSION and AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT."
+            )
+        return dataclasses.replace(base, llm_backend="azure", hf_embeddings_model=None)
+    raise SystemExit(f"Unknown backend {backend!r}; expected 'fake', 'azure' or 'hf:<model>'.")
+
+
+def configured_backends(base) -> list[str]:
+    """The fake embeddings plus whichever real backends the environment configures."""
+    backends = ["fake"]
+    if base.hf_embeddings_model:
+        backends.append(f"hf:{base.hf_embeddings_model}")
+    if base.azure_endpoint and base.azure_api_key and base.azure_embeddings_deployment:
+        backends.append("azure")
+    return backends
+
+
+def rank(message: str, store, snapshot, settings, depth: int) -> tuple[list[str], float, float]:
+    """KB doc IDs in the order the agent's retrieval would rank them, plus embedding and search seconds."""
+    from backend.app.agent import FUSION_CANDIDATES, lexical_candidates, lexical_is_decisive
+    from backend.app.lexical import reciprocal_rank_fusion
+    from backend.app.policies import kb_doc_id
+    from backend.app.rag import search_by_vectors
+
+    started = time.perf_counter()
+    lexical = lexical_candidates(message, snapshot, settings)
+    if lexical and lexical_is_decisive(lexical, settings):
+        return [doc_id for doc_id, _ in lexical[:depth]], 0.0, time.perf_counter() - started
+    embed_started = time.perf_counter()
+    vector = store.embeddings.embed_query(message)
+    embed_seconds = time.perf_counter() - embed_started
+    dense = search_by_vectors(store, [vector], max(depth, FUSION_CANDIDATES) if lexical else depth)[0]
+    ranked = [kb_doc_id(doc) for doc in dense]
+    if lexical:
+        ranked = reciprocal_rank_fusion([ranked, [doc_id for doc_id, _ in lexical]])
+    return ranked[:depth], embed_seconds, time.perf_counter() - started - embed_seconds
+
+
+def score(labels: list[dict], rankings: list[list[str]], snapshot, ks: list[int]) -> dict:
+    """hit@k (an expected policy among the top k snippets) and MRR of the first expected one."""
+    hits = {k: 0 for k in ks}
+    reciprocal = 0.0
+    for label, ranked in zip(labels, rankings):
+        policies = [snapshot.kb_docs[doc_id].metadata.get("policy_id") for doc_id in ranked]
+        first = next((rank for rank, policy in enumerate(policies, start=1) if policy in label["expected"]), None)
+        if first is None:
+            continue
+        reciprocal += 1.0 / first
+        for k in ks:
+            hits[k] += first <= k
+    total = len(labels)
+    return {
+        "queries": total,
+        "hit_at_k": {str(k): hits[k] / total if total else 0.0 for k in ks},
+        "mrr": reciprocal / total if total else 0.0,
+    }
+
+
+def evaluate(
+    labels: list[dict], store, snapshot, settings, mode: str, ks: list[int], served_k: int
+) -> dict:
+    settings = dataclasses.replace(settings, retrieval_mode=mode)
+    depth = max(ks)
+    rankings, embed_latencies, search_latencies = [], [], []
+    for label in labels:
+        ranked, embed_seconds, search_seconds = rank(label["message"], store, snapshot, settings, depth)
+        rankings.append(ranked)
+        embed_latencies.append(embed_seconds)
+        search_latencies.append(search_seconds)
+    result = score(labels, rankings, snapshot, ks)
+    sources = sorted({label["source"] for label in labels})
+    if len(sources) > 1:
+        result["by_source"] = {}
+        for source in sources:
+            picked = [i for i, label in enumerate(labels) if label["source"] == source]
+            result["by_source"][source] = score(
+                [labels[i] for i in picked], [rankings[i] for i in picked], snapshot, ks
+            )
+    result["latency"] = {
+        "embed": summarize(embed_latencies),
+        "search": summarize(search_latencies),
+        "total": summarize([e + s for e, s in zip(embed_latencies, search_latencies)]),
+    }
+    # Listed so two reports can be diffed query by query, not just on the averages.
+    result["misses"] = [
+        label["message"]
+        for label, ranked in zip(labels, rankings)
+        if not {snapshot.kb_docs[doc_id].metadata.get("policy_id") for doc_id in ranked[:served_k]}
+        & set(label["expected"])
+    ]
+    return result
+
+
+def run(args: argparse.Namespace) -> dict:
+    from backend.app.agent import POLICY_SNIPPETS_K
+    from backend.app.config import get_settings
+    from backend.app.policies import load_snapshot
+    from backend.app.rag import _wrap_store, build_embeddings, build_faiss_index, embeddings_identity
+
+    base = get_settings()
+    snapshot = load_snapshot(args.data_dir or base.data_dir)
+    labels = load_labels(args.labels) if args.labels else seed_labels(snapshot)
+    if args.write_labels:
+        args.write_labels.write_text("".join(json.dumps(label) + "\n" for label in labels), encoding="utf-8")
+    ks = sorted(set(args.k))
+    served_k = POLICY_SNIPPETS_K if POLICY_SNIPPETS_K in ks else ks[-1]
+    backends = args.backends or configured_backends(base)
+    faiss.omp_set_num_threads(args.threads)
+
+    report = {
+        "kb_version": snapshot.kb_version,
+        "kb_docs": len(snapshot.kb_docs),
+        "labels": {
+            "count": len(labels),
+            "source": str(args.labels) if args.labels else "seeded",
+            "sha256": hashlib.sha256(json.dumps(labels, sort_keys=True).encode("utf-8")).hexdigest()[:12],
+        },
+        "k": ks,
+        "served_k": served_k,
+        "backends": {},
+        "runs": [],
+    }
+    docs = list(snapshot.kb_docs.values())
+    for backend in backends:
+        settings = backend_settings(base, backend)
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        embeddings = build_embeddings(settings)
+        vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+        report["backends"][backend] = {
+            "identity": embeddings_identity(settings),
+            "dimension": int(vectors.shape[1]),
+            # Client or model load plus one batch embedding of the whole KB.
+            "embed_kb_s": time.perf_counter() - started,
+            # Process-wide: libraries already loaded by an earlier backend are not counted again.
+            "rss_delta_mb": rss_mb() - rss_before,
+        }
+        for kind in args.types:
+            row = {"backend": backend, "index": kind}
+            index_settings = dataclasses.replace(settings, index_type=kind, index_ann_min_docs=0)
+            started = time.perf_counter()
+            try:
+                index = build_faiss_index(vectors, index_settings)
+            except RuntimeError as exc:
+                # IVF/PQ training needs more vectors than a small KB may have.
+                report["runs"].extend({**row, "mode": mode, "error": str(exc)} for mode in args.modes)
+                continue
+            row["build_s"] = time.perf_counter() - started
+            row["index_bytes"] = len(faiss.serialize_index(index))
+            store = _wrap_store(embeddings, index, list(snapshot.kb_docs), docs)
+            for mode in args.modes:
+                result = evaluate(labels, store, snapshot, index_settings, mode, ks, served_k)
+                report["runs"].append({**row, "mode": mode, **result})
+                print(
+                    f"{backend} {kind} {mode}: hit@{served_k} {result['hit_at_k'][str(served_k)]:.3f}",
+                    file=sys.stderr,
+                )
+    return report
+
+
+def print_report(report: dict) -> None:
+    labels = report["labels"]
+    print(
+        f"{labels['count']} labeled queries ({labels['source']}, {labels['sha256']}) over {report['kb_docs']} KB "
+        f"entries (kb {report['kb_version']}); the agent uses the top {report['served_k']}"
+    )
+    for backend, info in report["backends"].items():
+        print(f"  {backend}: dim {info['dimension']}, KB embedded in {info['embed_kb_s']:.2f} s, +{info['rss_delta_mb']:.0f} MB RSS")
+    hit_columns = "".join(f"{'hit@' + str(k):>8}" for k in report["k"])
+    print(f"{'backend':<24}{'index':<7}{'mode':<9}{hit_columns}{'MRR':>8}{'p50 ms':>9}{'p95 ms':>9}{'build ms':>10}{'KB':>8}")
+    for row in report["runs"]:
+        prefix = f"{row['backend']:<24}{row['index']:<7}{row['mode']:<9}"
+        if "error" in row:
+            print(f"{prefix}error: {row['error']}")
+            continue
+        hits = "".join(f"{row['hit_at_k'][str(k)]:>8.3f}" for k in report["k"])
+        latency = row["latency"]["total"]
+        print(
+            f"{prefix}{hits}{row['mrr']:>8.3f}{latency['p50_ms']:>9.2f}{latency['p95_ms']:>9.2f}"
+            f"{row['build_s'] * 1000:>10.2f}{row['index_bytes'] / 1024:>8.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Retrieval accuracy (hit@k, MRR), latency and cost per embedding backend, index type and mode."
+    )
+    parser.add_argument(
+        "--labels",
+        type=Path,
+        help="JSONL of {\"message\", \"expected\": [policy_id, ...]}; default: seeded from policy keywords and KB titles.",
+    )
+    parser.add_argument("--write-labels", type=Path, help="Write the labeled set used to this JSONL path.")
+    parser.add_argument("--data-dir", type=Path, help="Directory with policies.json and knowledge_base.json.")
+    parser.add_argument(
+        "--backends", nargs="+", help="'fake', 'azure' and/or 'hf:<model>'; default: fake plus the configured ones."
+    )
+    parser.add_argument("--types", nargs="+", default=["flat", "hnsw", "ivf", "pq"], help="FAISS index types.")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES, help="APP_RETRIEVAL_MODE values.")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads while querying.")
+    parser.add_argument("--json", type=Path, help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+    if min(args.k) < 1:
+        raise SystemExit("--k values must be at least 1.")
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    # Real backends are only used when listed (or configured); the chat model is never called.
+    os.environ.setdefault("APP_LLM_BACKEND", "fake")
+    report = run(args)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import json
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from .load_test import percentile
+
+
+COMPLAINT_TYPES = ["missing item", "late delivery", "cold food", "wrong order", "spillage", "quality issue"]
+RESOLUTIONS = ["full_refund", "partial_refund", "replacement", "coupon", "apology"]
+
+
+def build_database(path: Path, orders: int, complaints_per_order: float, indexed: bool, seed: int) -> None:
+    from backend.data.init_db import INDEXES, SCHEMA, refresh_aggregates
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.executemany(
+            "INSERT INTO orders (order_id, items, status, delivered_at, customer_id, restaurant_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    f"ZOM{i:08d}",
+                    "Paneer Tikka, Naan",
+                    "delivered",
+                    "2026-02-04 19:05",
+                    f"CUST-{rng.randrange(max(1, orders // 5))}",
+                    f"RES-{rng.randrange(max(1, orders // 200))}",
+                )
+                for i in range(orders)
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO complaints (order_id, complaint_type, resolution, created_at) VALUES (?, ?, ?, ?)",
+            (
+                (
+                    f"ZOM{rng.randrange(orders):08d}",
+                    rng.choice(COMPLAINT_TYPES),
+                    rng.choice(RESOLUTIONS),
+                    f"2026-01-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+                )
+                for _ in range(int(orders * complaints_per_order))
+            ),
+        )
+        if indexed:
+            for statement in INDEXES:
+                conn.execute(statement)
+            refresh_aggregates(conn)
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def lookup(conn: sqlite3.Connection, repository, order_id: str, aggregated: bool) -> None:
+    from backend.app.agent import ORDER_SQL
+
+    conn.execute(ORDER_SQL, (order_id,)).fetchone()
+    conn.execute(repository.HISTORY_SQL, (order_id, repository.history_limit)).fetchall()
+    if aggregated:
+        repository._aggregates(conn, order_id)
+    else:
+        conn.execute(repository.COUNTS_BY_TYPE_SQL, (order_id,)).fetchall()
+        conn.execute(repository.LATEST_RESOLUTION_SQL, (order_id,)).fetchone()
+
+
+def time_lookups(path: Path, order_ids: list[str], indexed: bool, pooled: bool) -> list[float]:
+    """Order plus complaint history per lookup, as one /chat request does."""
+    from backend.app.sql import ComplaintRepository, ConnectionPool
+
+    repository = ComplaintRepository(path)
+    pool = ConnectionPool(path) if pooled else None
+    latencies = []
+    try:
+        for order_id in order_ids:
+            started = time.perf_counter()
+            if pool is not None:
+                with pool.connection() as conn:
+                    lookup(conn, repository, order_id, indexed)
+            else:
+                # What the lookups did before pooling: a fresh connection per request.
+                conn = sqlite3.connect(path)
+                try:
+                    lookup(conn, repository, order_id, indexed)
+                finally:
+                    conn.close()
+            latencies.append(time.perf_counter() - started)
+    finally:
+        if pool is not None:
+            pool.close()
+    return latencies
+
+
+def run(args: argparse.Namespace) -> list[dict]:
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for orders in args.orders:
+            rng = random.Random(args.seed)
+            order_ids = [f"ZOM{rng.randrange(orders):08d}" for _ in range(args.lookups)]
+            for indexed, pooled in ((False, False), (True, False), (True, True)):
+                path = Path(tmp) / f"orders-{orders}-{int(indexed)}.db"
+                if not path.exists():
+                    started = time.perf_counter()
+                    build_database(path, orders, args.complaints_per_order, indexed, args.seed)
+                    print(f"built {path.name} in {time.perf_counter() - started:.1f}s", flush=True)
+                latencies = time_lookups(path, order_ids, indexed, pooled)
+                rows.append(
+                    {
+                        "orders": orders,
+                        "complaints": int(orders * args.complaints_per_order),
+                        "indexed": indexed,
+                        "pooled": pooled,
+                        "p50_ms": percentile(latencies, 50) * 1000,
+                        "p99_ms": percentile(latencies, 99) * 1000,
+                        "lookups_per_s": len(latencies) / sum(latencies),
+                    }
+                )
+    return rows
+
+
+def print_report(rows: list[dict]) -> None:
+    print(f"{'orders':>10}{'complaints':>12}{'indexed':>9}{'pooled':>8}{'p50 ms':>10}{'p99 ms':>10}{'lookups/s':>12}")
+    for row in rows:
+        print(
+            f"{row['orders']:>10}{row['complaints']:>12}{str(row['indexed']):>9}{str(row['pooled']):>8}"
+            f"{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['lookups_per_s']:>12.0f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Order + complaint-history lookup latency with and without indexes/pooling.")
+    parser.add_argument("--orders", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--complaints-per-order", type=float, default=2.0)
+    parser.add_argument("--lookups", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", type=Path, help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    rows = run(args)
+    print_report(rows)
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from .load_test import DEFAULT_CORPUS, isolate_database, load_corpus, summarize
+
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def memory_kb(pid: int) -> dict[str, int]:
+    """Rss, Pss and private (USS) kB of one process, from /proc (Linux only)."""
+    fields = {"Rss": 0, "Pss": 0, "Private_Clean": 0, "Private_Dirty": 0}
+    try:
+        for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+            name, _, rest = line.partition(":")
+            if name in fields:
+                fields[name] = int(rest.split()[0])
+    except (OSError, ValueError):
+        return {"rss": 0, "pss": 0, "uss": 0}
+    return {"rss": fields["Rss"], "pss": fields["Pss"], "uss": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def worker_pids(parent: int) -> list[int]:
+    try:
+        return [int(pid) for pid in Path(f"/proc/{parent}/task/{parent}/children").read_text().split()]
+    except OSError:
+        return []
+
+
+def memory_report(parent: int) -> dict[str, float]:
+    workers = [memory_kb(pid) for pid in worker_pids(parent)]
+    launcher = memory_kb(parent)
+    total = [launcher, *workers]
+    return {
+        # RSS double-counts shared pages; PSS splits them between the processes sharing them.
+        "rss_sum_mb": sum(item["rss"] for item in total) / 1024,
+        "pss_sum_mb": sum(item["pss"] for item in total) / 1024,
+        "launcher_rss_mb": launcher["rss"] / 1024,
+        "worker_rss_mb": sum(item["rss"] for item in workers) / len(workers) / 1024 if workers else 0.0,
+        "worker_uss_mb": sum(item["uss"] for item in workers) / len(workers) / 1024 if workers else 0.0,
+    }
+
+
+async def wait_workers(client: httpx.AsyncClient, workers: int, timeout: float = 120.0) -> None:
+    """Poll /ready on fresh connections until ``workers`` distinct pids report ready."""
+    ready: set[int] = set()
+    deadline = time.perf_counter() + timeout
+    while len(ready) < workers:
+        if time.perf_counter() > deadline:
+            raise SystemExit(f"Only {len(ready)} of {workers} workers became ready.")
+        try:
+            response = await client.get("/ready", headers={"Connection": "close"})
+            if response.status_code == 200:
+                ready.add(response.json()["pid"])
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.02)
+
+
+async def drive(base_url: str, corpus: list[dict], requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors: dict[str, int] = defaultdict(int)
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in itertools.islice(itertools.cycle(corpus), requests):
+        queue.put_nowait(payload)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        while True:
+            try:
+                payload = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.post("/chat", json=payload)
+                if response.status_code != 200:
+                    errors[str(response.status_code)] += 1
+                    continue
+            except httpx.HTTPError as exc:
+                errors[type(exc).__name__] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "errors": dict(errors),
+        "latency": summarize(latencies),
+    }
+
+
+def run_one(workers: int, args: argparse.Namespace, corpus: list[dict], env: dict[str, str]) -> dict:
+    command = [sys.executable, "-m", "backend.app.serve", "--workers", str(workers), "--port", str(args.port)]
+    if args.no_preload:
+        command.append("--no-preload")
+    launcher = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+
+        async def measure() -> tuple[dict, dict, dict]:
+            async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+                await wait_workers(client, workers)
+            idle = memory_report(launcher.pid)
+            # One pass so every worker has served traffic before the measured run.
+            await drive(base_url, corpus, workers * 4, workers * 4)
+            load = await drive(base_url, corpus, args.requests, args.concurrency)
+            return idle, load, memory_report(launcher.pid)
+
+        idle, load, loaded = asyncio.run(measure())
+    finally:
+        launcher.send_signal(signal.SIGTERM)
+        try:
+            launcher.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            launcher.kill()
+            launcher.wait()
+    return {"workers": workers, **load, "memory_idle": idle, "memory_loaded": loaded}
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['requests']} requests @ concurrency {report['concurrency']}, fake LLM "
+        f"{report['llm_latency_ms']:g} ms, preload={'off' if report['no_preload'] else 'on'}"
+    )
+    print(
+        f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}"
+        f"{'RSS sum':>10}{'PSS sum':>10}{'RSS/wkr':>10}{'USS/wkr':>10}"
+    )
+    for row in report["runs"]:
+        memory = row["memory_loaded"]
+        print(
+            f"{row['workers']:>8}{row['throughput_rps']:>10.1f}{row['latency']['p50_ms']:>10.1f}"
+            f"{row['latency']['p95_ms']:>10.1f}{sum(row['errors'].values()):>8}"
+            f"{memory['rss_sum_mb']:>10.1f}{memory['pss_sum_mb']:>10.1f}"
+            f"{memory['worker_rss_mb']:>10.1f}{memory['worker_uss_mb']:>10.1f}"
+        )
+    print("Memory in MB after the run; PSS is the real footprint, RSS counts shared pages once per worker.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput and memory of the pre-fork server at several worker counts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="JSONL of ChatRequest bodies.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embeddings-latency-ms", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--no-preload", action="store_true", help="Each worker loads its own policies and index.")
+    parser.add_argument("--json", type=Path, help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="bench-workers-"))
+    env = {
+        **os.environ,
+        "APP_LLM_BACKEND": "fake",
+        "APP_FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "APP_FAKE_EMBEDDINGS_LATENCY_MS": str(args.embeddings_latency_ms),
+        "APP_INDEX_DIR": os.environ.get("APP_INDEX_DIR", str(scratch / "index")),
+        "APP_SESSION_BACKEND": "sqlite",
+        "APP_SESSION_DB_PATH": str(scratch / "sessions.db"),
+    }
+    isolate_database(env)
+    corpus = load_corpus(args.corpus)
+    runs = []
+    for workers in args.workers:
+        # A fresh shared cache per run, so later runs do not start warm.
+        run_env = {**env, "APP_SHARED_CACHE_PATH": str(scratch / f"shared_cache_{workers}.db")}
+        runs.append(run_one(workers, args, corpus, run_env))
+        print(f"{workers} worker(s): {runs[-1]['throughput_rps']:.1f} req/s", file=sys.stderr)
+
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "llm_latency_ms": args.llm_latency_ms,
+        "no_preload": args.no_preload,
+        "runs": runs,
+    }
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import argparse
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import sqlite3
+import stat
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from backend.data.init_db import DB_PATH, INDEXES, SCHEMA, TRIGGERS, create_schema, refresh_aggregates
+
+
+TABLES = {
+    "orders": {
+        "columns": ["order_id", "items", "status", "delivered_at", "customer_id", "restaurant_id"],
+        "required": ["order_id", "items", "status"],
+        "upsert": (
+            "INSERT INTO orders (order_id, items, status, delivered_at, customer_id, restaurant_id) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(order_id) DO UPDATE SET items = excluded.items, status = excluded.status, "
+            "delivered_at = excluded.delivered_at, customer_id = excluded.customer_id, "
+            "restaurant_id = excluded.restaurant_id"
+        ),
+    },
+    "complaints": {
+        "columns": ["order_id", "complaint_type", "resolution", "created_at"],
+        "required": ["order_id", "complaint_type", "resolution", "created_at"],
+        # Complaints have no natural key: a complaint is identified by (order_id, complaint_type, created_at),
+        # so a re-sent row updates its resolution and a new one is appended. Both lookups use the covering index.
+        "update": (
+            "UPDATE complaints SET resolution = ? "
+            "WHERE order_id = ? AND complaint_type = ? AND created_at = ?"
+        ),
+        "upsert": (
+            "INSERT INTO complaints (order_id, complaint_type, resolution, created_at) "
+            "SELECT ?1, ?2, ?3, ?4 WHERE NOT EXISTS ("
+            "SELECT 1 FROM complaints WHERE order_id = ?1 AND created_at = ?4 AND complaint_type = ?2)"
+        ),
+    },
+    "policies": {
+        "columns": ["policy_id", "scenario", "default_resolution"],
+        "required": ["policy_id", "scenario", "default_resolution"],
+        "upsert": (
+            "INSERT INTO policies (policy_id, scenario, default_resolution) VALUES (?, ?, ?) "
+            "ON CONFLICT(policy_id) DO UPDATE SET scenario = excluded.scenario, "
+            "default_resolution = excluded.default_resolution"
+        ),
+    },
+}
+
+# Tables the app writes (not loaded from files): a rebuild always carries them over.
+CARRIED_TABLES = ["resolution_outcomes"]
+
+# After a rebuild that reloaded complaints, point carried outcomes at the same complaint under its new id.
+REMAP_OUTCOME_COMPLAINTS = """
+    UPDATE main.resolution_outcomes SET complaint_id = (
+        SELECT fresh.id FROM current.complaints AS old
+        JOIN main.complaints AS fresh ON fresh.order_id = old.order_id
+            AND fresh.created_at = old.created_at AND fresh.complaint_type = old.complaint_type
+        WHERE old.id = resolution_outcomes.complaint_id
+        LIMIT 1
+    )
+    WHERE complaint_id IS NOT NULL
+"""
+
+DEFAULT_CHUNK_SIZE = 50_000
+READ_CHUNK_CHARS = 1 << 16
+# Bulk-load page cache; the load is single-writer and the file is private until the swap.
+LOAD_CACHE_SIZE_MB = 512
+
+
+def _open_text(path: Path) -> io.TextIOBase:
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def _format(path: Path) -> str:
+    suffix = Path(path.stem).suffix if path.suffix == ".gz" else path.suffix
+    formats = {".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv"}
+    if suffix.lower() not in formats:
+        raise SystemExit(f"{path}: unsupported format {suffix!r}; use .json, .jsonl, .ndjson or .csv (optionally .gz).")
+    return formats[suffix.lower()]
+
+
+def iter_json_array(handle: io.TextIOBase) -> Iterator[dict[str, Any]]:
+    """Objects of a top-level JSON array, decoded one at a time from fixed-size reads."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    while True:
+        # Skip whitespace and separators; refill when the buffer runs dry.
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer):
+                break
+            chunk = handle.read(READ_CHUNK_CHARS)
+            if not chunk:
+                if started:
+                    raise ValueError("unterminated JSON array")
+                return
+            buffer, position = chunk, 0
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("expected a JSON array of records")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+        while True:
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError:
+                chunk = handle.read(READ_CHUNK_CHARS)
+                if not chunk:
+                    raise
+                buffer, position = buffer[position:] + chunk, 0
+        yield record
+        position = end
+
+
+def iter_records(path: Path) -> Iterator[dict[str, Any]]:
+    fmt = _format(path)
+    with _open_text(path) as handle:
+        if fmt == "json":
+            yield from iter_json_array(handle)
+        elif fmt == "jsonl":
+            for line in handle:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            for row in csv.DictReader(handle):
+                yield {key: (value if value != "" else None) for key, value in row.items()}
+
+
+def iter_rows(table: str, path: Path) -> Iterator[tuple]:
+    spec = TABLES[table]
+    for number, record in enumerate(iter_records(path), start=1):
+        missing = [column for column in spec["required"] if record.get(column) in (None, "")]
+        if missing:
+            raise SystemExit(f"{path}: record {number} is missing {', '.join(missing)}.")
+        yield tuple(record.get(column) for column in spec["columns"])
+
+
+def _chunks(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _load_table(conn: sqlite3.Connection, table: str, path: Path, chunk_size: int, upsert: bool) -> int:
+    spec = TABLES[table]
+    columns = spec["columns"]
+    if upsert:
+        statement = spec["upsert"]
+    else:
+        statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    total = 0
+    started = time.perf_counter()
+    for chunk in _chunks(iter_rows(table, path), chunk_size):
+        if upsert and "update" in spec:
+            conn.executemany(spec["update"], [(row[2], row[0], row[1], row[3]) for row in chunk])
+        conn.executemany(statement, chunk)
+        total += len(chunk)
+        elapsed = time.perf_counter() - started
+        print(f"  {table}: {total} rows ({total / elapsed if elapsed else 0:.0f}/s)", end="\r", file=sys.stderr)
+    print(f"  {table}: {total} rows from {path.name} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return total
+
+
+def _copy_table(conn: sqlite3.Connection, table: str) -> None:
+    """Copy ``table`` from the attached ``current`` database; it may predate newer columns, so copy the ones it has."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA current.table_info({table})")}
+    wanted = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    columns = ", ".join(column for column in wanted if column in existing)
+    if columns:
+        conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM current.{table}")
+
+
+def rebuild(db_path: Path, sources: dict[str, Path], chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict[str, int]:
+    """Build a fresh database next to ``db_path`` and atomically rename it into place.
+
+    Readers keep using the old file until the rename; a failed load leaves it
+    untouched. Tables without a source, and the app-written CARRIED_TABLES,
+    are copied over from the current database, if there is one, keeping their
+    row ids; outcomes are relinked when complaints are reloaded.
+    """
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=db_path.parent, prefix=f".{db_path.name}.", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    counts: dict[str, int] = {}
+    try:
+        conn = sqlite3.connect(tmp_path.as_uri(), uri=True, isolation_level=None)
+        try:
+            # Nothing reads the file until it is complete, so durability during the load buys nothing.
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA main.locking_mode=EXCLUSIVE")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute(f"PRAGMA cache_size={-LOAD_CACHE_SIZE_MB * 1024}")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            for table in TABLES:
+                if table in sources:
+                    conn.execute("BEGIN")
+                    counts[table] = _load_table(conn, table, sources[table], chunk_size, upsert=False)
+                    conn.execute("COMMIT")
+                elif db_path.exists():
+                    # Copied with their ids (complaints.id is what resolution_outcomes.complaint_id points at).
+                    conn.execute("ATTACH DATABASE ? AS current", (f"{db_path.resolve().as_uri()}?mode=ro",))
+                    _copy_table(conn, table)
+                    conn.execute("DETACH DATABASE current")
+                    counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            # Indexes are cheaper to build once over sorted data than to maintain row by row.
+            started = time.perf_counter()
+            for statement in INDEXES:
+                conn.execute(statement)
+            if db_path.exists():
+                conn.execute("ATTACH DATABASE ? AS current", (f"{db_path.resolve().as_uri()}?mode=ro",))
+                for table in CARRIED_TABLES:
+                    _copy_table(conn, table)
+                if "complaints" in sources:
+                    # Reloaded complaints got new ids: follow each outcome's complaint by its natural key,
+                    # and unlink outcomes whose complaint is not in the new file.
+                    conn.execute(REMAP_OUTCOME_COMPLAINTS)
+                conn.execute("DETACH DATABASE current")
+            # Aggregates in one grouped pass, then triggers to keep them current from here on.
+            conn.execute("BEGIN")
+            refresh_aggregates(conn)
+            conn.execute("COMMIT")
+            for statement in TRIGGERS:
+                conn.execute(statement)
+            conn.execute("ANALYZE")
+            print(f"  indexes and aggregates built in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            conn.execute("PRAGMA main.locking_mode=NORMAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        with open(tmp_path, "rb+") as handle:
+            os.fsync(handle.fileno())
+        # mkstemp creates the file owner-only; keep the permissions readers already have.
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(db_path).st_mode) if db_path.exists() else 0o644)
+        _retire_wal(db_path)
+        os.replace(tmp_path, db_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return counts
+
+
+def _retire_wal(db_path: Path) -> None:
+    """Fold the old file's WAL back into it and empty it, so it cannot be replayed onto the new file."""
+    if not db_path.exists():
+        return
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def upsert(db_path: Path, sources: dict[str, Path], chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict[str, int]:
+    """Apply a delta in place, in one transaction: readers see all of it or none of it."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    counts: dict[str, int] = {}
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA cache_size={-LOAD_CACHE_SIZE_MB * 1024}")
+        # Brings an older file up to date, including aggregates; from then on triggers maintain them.
+        create_schema(conn)
+        # The complaint triggers only see complaints; note orders whose customer or restaurant changes.
+        conn.execute("CREATE TEMP TABLE reattributed (order_id TEXT PRIMARY KEY)")
+        conn.execute(
+            "CREATE TEMP TRIGGER orders_reattributed AFTER UPDATE OF customer_id, restaurant_id ON main.orders "
+            "WHEN OLD.customer_id IS NOT NEW.customer_id OR OLD.restaurant_id IS NOT NEW.restaurant_id "
+            "BEGIN INSERT OR IGNORE INTO reattributed VALUES (NEW.order_id); END"
+        )
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table, path in sources.items():
+                counts[table] = _load_table(conn, table, path, chunk_size, upsert=True)
+            if conn.execute(
+                "SELECT 1 FROM reattributed r JOIN complaints c ON c.order_id = r.order_id LIMIT 1"
+            ).fetchone():
+                # Past complaints move to another customer or restaurant: recount everything.
+                refresh_aggregates(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Load orders, complaints and policies from JSON, JSONL or CSV (optionally gzipped) in constant memory."
+    )
+    parser.add_argument("--orders", type=Path)
+    parser.add_argument("--complaints", type=Path)
+    parser.add_argument("--policies", type=Path)
+    parser.add_argument("--db", type=Path, default=DB_PATH)
+    parser.add_argument(
+        "--mode",
+        choices=["rebuild", "upsert"],
+        default="rebuild",
+        help="rebuild: load into a new file and swap it in. upsert: apply the files as a delta to the existing database.",
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    sources = {table: getattr(args, table) for table in TABLES if getattr(args, table) is not None}
+    if not sources:
+        parser.error("pass at least one of --orders, --complaints, --policies")
+    started = time.perf_counter()
+    if args.mode == "rebuild":
+        counts = rebuild(args.db, sources, args.chunk_size)
+    else:
+        if not args.db.exists():
+            parser.error(f"{args.db} does not exist; run a rebuild first")
+        counts = upsert(args.db, sources, args.chunk_size)
+    summary = ", ".join(f"{table}={count}" for table, count in counts.items())
+    print(f"{args.mode} of {args.db} done in {time.perf_counter() - started:.1f}s ({summary})")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,204 @@ def load_json(path: Path) -> list[dict]:
     return json.loads(path.read_text(encoding="utf-8"))
 
 
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id TEXT PRIMARY KEY,
+        items TEXT NOT NULL,
+        status TEXT NOT NULL,
+        delivered_at TEXT,
+        customer_id TEXT,
+        restaurant_id TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS complaints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id TEXT NOT NULL,
+        complaint_type TEXT NOT NULL,
+        resolution TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS policies (
+        policy_id TEXT PRIMARY KEY,
+        scenario TEXT NOT NULL,
+        default_resolution TEXT NOT NULL
+    )
+    """,
+    # One row per agent decision, written by the app's outcome recorder (backend/app/outcomes.py).
+    # complaint_id links the turns of a conversation to the complaint the first one opened.
+    """
+    CREATE TABLE IF NOT EXISTS resolution_outcomes (
+        outcome_id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        order_id TEXT,
+        complaint_type TEXT,
+        complaint_id INTEGER,
+        source TEXT NOT NULL,
+        status TEXT NOT NULL,
+        resolution TEXT,
+        escalate INTEGER NOT NULL,
+        policy_citations TEXT NOT NULL,
+        policy_version TEXT,
+        latency_ms REAL,
+        input_tokens INTEGER,
+        output_tokens INTEGER
+    )
+    """,
+    # Complaint counts and the latest complaint per order, customer and restaurant ("scopes"),
+    # kept current by the triggers below so the app reads them with primary-key lookups.
+    """
+    CREATE TABLE IF NOT EXISTS complaint_aggregates (
+        scope TEXT NOT NULL,
+        scope_key TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        last_complaint_at TEXT,
+        last_complaint_type TEXT,
+        last_resolution TEXT,
+        PRIMARY KEY (scope, scope_key)
+    ) WITHOUT ROWID
+    """,
+    # Per-day counts; rolling windows are a short primary-key range scan over these.
+    """
+    CREATE TABLE IF NOT EXISTS complaint_daily (
+        scope TEXT NOT NULL,
+        scope_key TEXT NOT NULL,
+        day TEXT NOT NULL,
+        complaints INTEGER NOT NULL,
+        PRIMARY KEY (scope, scope_key, day)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS complaint_scopes AS
+    SELECT 'order' AS scope, c.order_id AS scope_key, c.created_at, c.complaint_type, c.resolution
+    FROM complaints c
+    UNION ALL
+    SELECT 'customer', o.customer_id, c.created_at, c.complaint_type, c.resolution
+    FROM complaints c JOIN orders o ON o.order_id = c.order_id WHERE o.customer_id IS NOT NULL
+    UNION ALL
+    SELECT 'restaurant', o.restaurant_id, c.created_at, c.complaint_type, c.resolution
+    FROM complaints c JOIN orders o ON o.order_id = c.order_id WHERE o.restaurant_id IS NOT NULL
+    """,
+]
+
+# Columns added to existing tables after their first release: (table, column, type).
+MIGRATIONS = [
+    ("orders", "customer_id", "TEXT"),
+    ("orders", "restaurant_id", "TEXT"),
+]
+
+
+def _scopes(row: str) -> str:
+    """The (scope, scope_key) pairs a trigger's NEW/OLD complaint row counts towards."""
+    return f"""
+        SELECT 'order' AS scope, {row}.order_id AS scope_key
+        UNION ALL
+        SELECT 'customer', customer_id FROM orders WHERE order_id = {row}.order_id AND customer_id IS NOT NULL
+        UNION ALL
+        SELECT 'restaurant', restaurant_id FROM orders WHERE order_id = {row}.order_id AND restaurant_id IS NOT NULL
+    """
+
+
+_IS_LATEST = "last_complaint_at IS NULL OR NEW.created_at >= last_complaint_at"
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS complaints_aggregate_insert AFTER INSERT ON complaints
+    BEGIN
+        INSERT OR IGNORE INTO complaint_aggregates (scope, scope_key, total)
+        SELECT scope, scope_key, 0 FROM ({_scopes("NEW")});
+        UPDATE complaint_aggregates SET
+            total = total + 1,
+            last_complaint_at = CASE WHEN {_IS_LATEST} THEN NEW.created_at ELSE last_complaint_at END,
+            last_complaint_type = CASE WHEN {_IS_LATEST} THEN NEW.complaint_type ELSE last_complaint_type END,
+            last_resolution = CASE WHEN {_IS_LATEST} THEN NEW.resolution ELSE last_resolution END
+        WHERE (scope, scope_key) IN ({_scopes("NEW")});
+        INSERT OR IGNORE INTO complaint_daily (scope, scope_key, day, complaints)
+        SELECT scope, scope_key, substr(NEW.created_at, 1, 10), 0 FROM ({_scopes("NEW")});
+        UPDATE complaint_daily SET complaints = complaints + 1
+        WHERE day = substr(NEW.created_at, 1, 10) AND (scope, scope_key) IN ({_scopes("NEW")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS complaints_aggregate_update AFTER UPDATE OF resolution ON complaints
+    BEGIN
+        UPDATE complaint_aggregates SET last_resolution = NEW.resolution
+        WHERE last_complaint_at = NEW.created_at AND last_complaint_type = NEW.complaint_type
+            AND (scope, scope_key) IN ({_scopes("NEW")});
+    END
+    """,
+    # Deletes only adjust the counts; the "last" columns catch up on the next refresh.
+    f"""
+    CREATE TRIGGER IF NOT EXISTS complaints_aggregate_delete AFTER DELETE ON complaints
+    BEGIN
+        UPDATE complaint_aggregates SET total = total - 1 WHERE (scope, scope_key) IN ({_scopes("OLD")});
+        UPDATE complaint_daily SET complaints = complaints - 1
+        WHERE day = substr(OLD.created_at, 1, 10) AND (scope, scope_key) IN ({_scopes("OLD")});
+    END
+    """,
+]
+
+# Recompute the aggregates from scratch (bulk loads, or a database that predates them).
+REFRESH_AGGREGATES = [
+    "DELETE FROM complaint_aggregates",
+    "DELETE FROM complaint_daily",
+    """
+    INSERT INTO complaint_daily (scope, scope_key, day, complaints)
+    SELECT scope, scope_key, substr(created_at, 1, 10), COUNT(*)
+    FROM complaint_scopes GROUP BY scope, scope_key, substr(created_at, 1, 10)
+    """,
+    # SQLite fills the bare columns from the row that supplied MAX(created_at).
+    """
+    INSERT INTO complaint_aggregates
+        (scope, scope_key, total, last_complaint_at, last_complaint_type, last_resolution)
+    SELECT scope, scope_key, COUNT(*), MAX(created_at), complaint_type, resolution
+    FROM complaint_scopes GROUP BY scope, scope_key
+    """,
+]
+
+INDEXES = [
+    # Leads with (order_id, created_at) for the per-order history queries and also carries the
+    # remaining selected columns, so those queries never touch the table itself.
+    "CREATE INDEX IF NOT EXISTS idx_complaints_order_created "
+    "ON complaints(order_id, created_at, complaint_type, resolution)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)",
+    "CREATE INDEX IF NOT EXISTS idx_resolution_outcomes_session ON resolution_outcomes(session_id, order_id)",
+]
+
+
+def migrate(conn: sqlite3.Connection) -> None:
+    for table, column, column_type in MIGRATIONS:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+def refresh_aggregates(conn: sqlite3.Connection) -> None:
+    for statement in REFRESH_AGGREGATES:
+        conn.execute(statement)
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    """Tables, indexes and aggregate triggers; safe to run against an existing database."""
+    # WAL is persistent in the file, so the app's read-only connections inherit it.
+    conn.execute("PRAGMA journal_mode=WAL")
+    had_aggregates = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'complaint_aggregates'"
+    ).fetchone()
+    for statement in SCHEMA:
+        conn.execute(statement)
+    migrate(conn)
+    for statement in INDEXES + TRIGGERS:
+        conn.execute(statement)
+    if not had_aggregates:
+        refresh_aggregates(conn)
+        conn.commit()
+
+
 def init_db() -> None:
     orders = load_json(BASE_DIR / "orders.json")
     complaints = load_json(BASE_DIR / "complaints.json")
@@ -18,45 +216,22 @@ def init_db() -> None:
 
     conn = sqlite3.connect(DB_PATH)
     try:
+        create_schema(conn)
         cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS orders (
-                order_id TEXT PRIMARY KEY,
-                items TEXT NOT NULL,
-                status TEXT NOT NULL,
-                delivered_at TEXT
-            )
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS complaints (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id TEXT NOT NULL,
-                complaint_type TEXT NOT NULL,
-                resolution TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS policies (
-                policy_id TEXT PRIMARY KEY,
-                scenario TEXT NOT NULL,
-                default_resolution TEXT NOT NULL
-            )
-            """
-        )
 
+        # Recorded outcomes link to complaints by id; reloading the complaints orphans them.
+        cur.execute("DELETE FROM resolution_outcomes")
         cur.execute("DELETE FROM orders")
         cur.execute("DELETE FROM complaints")
         cur.execute("DELETE FROM policies")
 
         cur.executemany(
-            "INSERT INTO orders (order_id, items, status, delivered_at) VALUES (?, ?, ?, ?)",
-            [(o["order_id"], o["items"], o["status"], o["delivered_at"]) for o in orders],
+            "INSERT INTO orders (order_id, items, status, delivered_at, customer_id, restaurant_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (o["order_id"], o["items"], o["status"], o["delivered_at"], o.get("customer_id"), o.get("restaurant_id"))
+                for o in orders
+            ],
         )
         cur.executemany(
             "INSERT INTO complaints (order_id, complaint_type, resolution, created_at) VALUES (?, ?, ?, ?)",
@@ -73,7 +248,10 @@ def init_db() -> None:
             ],
         )
 
+        # The delete/insert above went through the triggers row by row; start the aggregates clean.
+        refresh_aggregates(conn)
         conn.commit()
+        conn.execute("ANALYZE")
     finally:
         conn.close()
 
@@ -0,0 +1,63 @@
+import asyncio
+import shutil
+from pathlib import Path
+
+import pytest
+
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+
+
+class FakeClock:
+    """Stands in for the ``time`` module where a test needs to move time forward."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def complaints_db(tmp_path: Path) -> Path:
+    """A scratch copy of the checked-in sample database; tests never write to the tracked file."""
+    path = tmp_path / "complaints.db"
+    shutil.copyfile(DATA_DIR / "complaints.db", path)
+    return path
+
+
+@pytest.fixture
+def fake_settings(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, complaints_db: Path):
+    """Settings for the offline fake LLM/embeddings backend, with every file the app writes under tmp_path."""
+    from backend.app.config import get_settings
+    from backend.app.registry import close_registry
+
+    env = {
+        "APP_LLM_BACKEND": "fake",
+        "APP_DB_PATH": str(complaints_db),
+        "APP_INDEX_DIR": str(tmp_path / "index"),
+        "APP_SESSION_BACKEND": "memory",
+        "APP_OUTCOME_RECORDING": "false",
+        "APP_RESPONSE_CACHE": "false",
+        "APP_FAST_PATH": "false",
+        "APP_EMBEDDING_CACHE_PATH": "",
+        "APP_SHARED_CACHE_PATH": "",
+        "APP_FAKE_LLM_LATENCY_MS": "0",
+        "APP_FAKE_EMBEDDINGS_LATENCY_MS": "0",
+        "APP_FAKE_LLM_ERROR_RATE": "0",
+    }
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    yield get_settings()
+    asyncio.run(close_registry())
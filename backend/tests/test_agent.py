@@ -0,0 +1,102 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+from backend.app import agent
+from backend.app.agent import ahandle_chat, astream_chat
+from backend.app.fakes import FakeChatModel
+from backend.app.registry import get_registry
+
+
+MESSAGE = "My fries were missing from the order"
+
+
+def upstream_error(cls, code: int):
+    response = httpx.Response(code, request=httpx.Request("POST", "https://upstream.test"))
+    return cls("upstream said no", response=response, body=None)
+
+
+def expected_failover(settings):
+    return agent.rule_based_fallback(MESSAGE, agent.load_policies(settings))
+
+
+async def stream_events(settings, session_id=None):
+    return [event async for event in astream_chat(MESSAGE, "ZOM123", session_id, settings)]
+
+
+def test_chat_answers_from_the_llm(fake_settings):
+    result = asyncio.run(ahandle_chat(MESSAGE, "ZOM123", None, fake_settings))
+    assert result["status"] == "handled"
+    assert result["policy_citations"] == ["POL-001"]
+    assert result["order_summary"].startswith("Order ZOM123")
+    assert result["token_usage"]["llm_input"] > 0
+    history = agent.get_conversation_history(result["session_id"], fake_settings)
+    assert [message["role"] for message in history] == ["user", "assistant"]
+
+
+def test_llm_errors_fail_over_to_the_keyword_rules(fake_settings, monkeypatch):
+    async def unauthorized(self, messages, stop=None, run_manager=None, **kwargs):
+        raise upstream_error(openai.AuthenticationError, 401)
+
+    monkeypatch.setattr(FakeChatModel, "_agenerate", unauthorized)
+    result = asyncio.run(ahandle_chat(MESSAGE, "ZOM123", None, fake_settings))
+    expected = expected_failover(fake_settings)
+    assert result["message"] == expected["message"]
+    assert result["policy_citations"] == expected["policy_citations"]
+    guard = get_registry(fake_settings).llm_guard
+    assert guard.breaker.failures == 1
+    assert guard.stats()["in_flight"] == 0
+
+
+def test_streamed_tokens_spell_out_the_final_message(fake_settings):
+    events = asyncio.run(stream_events(fake_settings))
+    names = [name for name, _ in events]
+    assert names[0] == "progress"
+    assert names[-1] == "final"
+    assert "fallback" not in names
+    final = events[-1][1]
+    assert "".join(data["text"] for name, data in events if name == "token") == final["message"]
+    assert final["token_usage"]["llm_output"] > 0
+    assert get_registry(fake_settings).llm_guard.stats()["in_flight"] == 0
+
+
+def test_a_stream_that_breaks_off_is_replaced_by_the_failover(fake_settings, monkeypatch):
+    async def break_off(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self._reply(messages)
+        cut = content.index('"message"') + 40  # Partway into the message.
+        for start in range(0, cut, 16):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=content[start : min(start + 16, cut)]))
+        raise upstream_error(openai.InternalServerError, 500)
+
+    monkeypatch.setattr(FakeChatModel, "_astream", break_off)
+    events = asyncio.run(stream_events(fake_settings))
+    names = [name for name, _ in events if name != "progress"]
+    expected = expected_failover(fake_settings)["message"]
+    # Partial LLM tokens, then the signal to discard them, then the failover message whole.
+    assert names[-3:] == ["fallback", "token", "final"]
+    assert names[:-3] and set(names[:-3]) == {"token"}
+    assert events[-2][1] == {"text": expected}
+    assert events[-1][1]["message"] == expected
+    assert get_registry(fake_settings).llm_guard.stats()["in_flight"] == 0
+
+
+def test_a_stream_that_fails_before_the_first_token_sends_no_fallback_event(fake_settings, monkeypatch):
+    async def unreachable(self, messages, stop=None, run_manager=None, **kwargs):
+        raise openai.APIConnectionError(request=httpx.Request("POST", "https://upstream.test"))
+        yield  # pragma: no cover - makes this an async generator
+
+    monkeypatch.setattr(FakeChatModel, "_astream", unreachable)
+    events = asyncio.run(stream_events(fake_settings))
+    names = [name for name, _ in events if name != "progress"]
+    assert names == ["token", "final"]
+    assert events[-1][1]["message"] == expected_failover(fake_settings)["message"]
+
+
+@pytest.mark.parametrize("message", ["", "   ", "x" * 5000])
+def test_invalid_messages_are_rejected(message):
+    with pytest.raises(ValueError):
+        agent.validate_message(message)
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from backend.app.decision import parse_decision, repair_json, response_format
+
+
+DECISION = {
+    "status": "handled",
+    "resolution": "refund",
+    "message": "Sorry about the missing fries, a refund is on its way.",
+    "escalate": False,
+    "policy_citations": ["POL-001"],
+    "next_steps": ["Confirm refund"],
+}
+RAW = json.dumps(DECISION)
+
+
+def test_well_formed_output_parses_in_one_pass():
+    assert parse_decision(RAW) == (DECISION, "ok")
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        f"```json\n{RAW}\n```",
+        f"Here is my decision:\n{RAW}\nLet me know if you need anything else.",
+        RAW.replace('"next_steps"', '"extra": 1, "next_steps"'),
+    ],
+    ids=["code-fence", "prose", "extra-key"],
+)
+def test_wrapped_output_is_repaired_or_accepted(raw):
+    decision, outcome = parse_decision(raw)
+    assert decision == DECISION
+    assert outcome in {"ok", "repaired"}
+
+
+def test_trailing_commas_are_repaired():
+    raw = RAW.replace('["POL-001"]', '["POL-001",]').replace("}", ",}")
+    assert parse_decision(raw) == (DECISION, "repaired")
+
+
+def test_output_cut_off_inside_a_string_is_closed():
+    raw = RAW[: RAW.index("Confirm refund") + len("Confirm re")]
+    decision, outcome = parse_decision(raw)
+    assert outcome == "repaired"
+    assert decision["next_steps"] == ["Confirm re"]
+    assert decision["message"] == DECISION["message"]
+
+
+def test_output_cut_off_inside_a_key_drops_the_partial_member():
+    raw = RAW[: RAW.index('"next_steps"') + len('"next_st')]
+    decision, outcome = parse_decision(raw)
+    assert outcome == "repaired"
+    assert decision["next_steps"] == []
+    assert decision["policy_citations"] == ["POL-001"]
+
+
+def test_bare_strings_become_one_item_lists():
+    raw = RAW.replace('["POL-001"]', '"POL-001"')
+    decision, _ = parse_decision(raw)
+    assert decision["policy_citations"] == ["POL-001"]
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        "I'm sorry, I can't help with that.",
+        json.dumps({**DECISION, "message": ""}),
+        json.dumps({key: value for key, value in DECISION.items() if key != "escalate"}),
+        '["not", "an", "object"]',
+        "",
+    ],
+    ids=["prose-only", "empty-message", "missing-escalate", "array", "empty"],
+)
+def test_unusable_output_fails(raw):
+    assert parse_decision(raw) == (None, "failed")
+
+
+def test_repair_json_returns_none_for_non_objects():
+    assert repair_json("no braces here") is None
+    assert repair_json("{'single': 'quotes'}") is None
+
+
+def test_repair_json_leaves_balanced_garbage_alone():
+    assert repair_json('{"a": 1 "b": 2}') is None
+
+
+def test_response_format_per_mode():
+    assert response_format("prompt") is None
+    assert response_format("json_object") == {"type": "json_object"}
+    schema = response_format("json_schema")
+    assert schema["type"] == "json_schema"
+    assert schema["json_schema"]["strict"] is True
+    assert set(schema["json_schema"]["schema"]["required"]) == set(DECISION)
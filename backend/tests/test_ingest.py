@@ -0,0 +1,204 @@
+import csv
+import gzip
+import io
+import json
+import sqlite3
+
+import pytest
+
+from backend.data import ingest
+from backend.data.ingest import iter_json_array, rebuild, upsert
+
+
+ORDERS = [
+    {"order_id": "O1", "items": "naan", "status": "delivered", "customer_id": "C1", "restaurant_id": "R1"},
+    {"order_id": "O2", "items": "biryani", "status": "delivered", "customer_id": "C1", "restaurant_id": "R2"},
+    {"order_id": "O3", "items": "dosa", "status": "cancelled", "customer_id": "C2", "restaurant_id": "R2"},
+]
+COMPLAINTS = [
+    {"order_id": "O1", "complaint_type": "missing item", "resolution": "refund", "created_at": "2026-01-01 10:00"},
+    {"order_id": "O2", "complaint_type": "late delivery", "resolution": "coupon", "created_at": "2026-01-02 10:00"},
+    {"order_id": "O2", "complaint_type": "cold food", "resolution": "none", "created_at": "2026-01-03 10:00"},
+]
+POLICIES = [
+    {"policy_id": "POL-1", "scenario": "Missing item", "default_resolution": "refund"},
+    {"policy_id": "POL-2", "scenario": "Late delivery", "default_resolution": "coupon"},
+]
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+    return path
+
+
+def write_csv_gz(path, records):
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=list(records[0]))
+    writer.writeheader()
+    writer.writerows(records)
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as handle:
+        handle.write(text.getvalue())
+    return path
+
+
+def write_json(path, records):
+    path.write_text(json.dumps(records), encoding="utf-8")
+    return path
+
+
+def query(db, sql, *params):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def aggregate(db, scope, key):
+    rows = query(
+        db,
+        "SELECT total, last_complaint_at, last_resolution FROM complaint_aggregates WHERE scope = ? AND scope_key = ?",
+        scope,
+        key,
+    )
+    return rows[0] if rows else None
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A database built by ingest from the three sample sources above."""
+    path = tmp_path / "complaints.db"
+    rebuild(
+        path,
+        {
+            "orders": write_jsonl(tmp_path / "orders.jsonl", ORDERS),
+            "complaints": write_csv_gz(tmp_path / "complaints.csv.gz", COMPLAINTS),
+            "policies": write_json(tmp_path / "policies.json", POLICIES),
+        },
+    )
+    return path
+
+
+def add_outcome(db, outcome_id, complaint_id):
+    conn = sqlite3.connect(db)
+    conn.execute(
+        "INSERT INTO resolution_outcomes (outcome_id, created_at, session_id, complaint_id, source, status, "
+        "escalate, policy_citations) VALUES (?, '2026-01-04 10:00', 's', ?, 'llm', 'handled', 0, '[]')",
+        (outcome_id, complaint_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_rebuild_loads_every_format_and_builds_aggregates(db):
+    assert query(db, "SELECT COUNT(*) FROM orders") == [(3,)]
+    assert query(db, "SELECT COUNT(*) FROM complaints") == [(3,)]
+    assert query(db, "SELECT COUNT(*) FROM policies") == [(2,)]
+    assert aggregate(db, "customer", "C1") == (3, "2026-01-03 10:00", "none")
+    assert aggregate(db, "restaurant", "R2") == (2, "2026-01-03 10:00", "none")
+    assert aggregate(db, "customer", "C2") is None
+    assert query(db, "PRAGMA journal_mode") == [("wal",)]
+
+
+def test_aggregates_stay_current_after_rebuild(db):
+    conn = sqlite3.connect(db)
+    conn.execute(
+        "INSERT INTO complaints (order_id, complaint_type, resolution, created_at) "
+        "VALUES ('O3', 'wrong item', 'refund', '2026-01-05 10:00')"
+    )
+    conn.commit()
+    conn.close()
+    assert aggregate(db, "customer", "C2") == (1, "2026-01-05 10:00", "refund")
+
+
+def test_rebuild_copies_unsourced_tables_with_their_ids(db, tmp_path):
+    conn = sqlite3.connect(db)
+    conn.execute("DELETE FROM complaints WHERE created_at = '2026-01-02 10:00'")  # Leave a gap in the ids.
+    conn.commit()
+    conn.close()
+    before = query(db, "SELECT * FROM complaints ORDER BY id")
+    add_outcome(db, "kept", before[-1][0])
+    changed = [dict(ORDERS[0], status="refunded"), *ORDERS[1:]]
+    counts = rebuild(db, {"orders": write_jsonl(tmp_path / "orders-2.jsonl", changed)})
+    assert counts == {"orders": 3, "complaints": 2, "policies": 2}
+    assert query(db, "SELECT * FROM complaints ORDER BY id") == before
+    assert query(db, "SELECT complaint_id FROM resolution_outcomes") == [(before[-1][0],)]
+    assert query(db, "SELECT status FROM orders WHERE order_id = 'O1'") == [("refunded",)]
+    assert aggregate(db, "customer", "C1") == (2, "2026-01-03 10:00", "none")
+
+
+def test_reloaded_complaints_keep_their_outcomes(db, tmp_path):
+    ids = dict(query(db, "SELECT complaint_type, id FROM complaints"))
+    add_outcome(db, "cold", ids["cold food"])
+    add_outcome(db, "late", ids["late delivery"])
+    add_outcome(db, "unlinked", None)
+    # The new file lists complaints in another order and drops the late delivery.
+    reordered = [COMPLAINTS[2], COMPLAINTS[0]]
+    rebuild(db, {"complaints": write_jsonl(tmp_path / "complaints-2.jsonl", reordered)})
+    rows = query(
+        db,
+        "SELECT o.outcome_id, c.complaint_type FROM resolution_outcomes o "
+        "LEFT JOIN complaints c ON c.id = o.complaint_id ORDER BY o.outcome_id",
+    )
+    assert rows == [("cold", "cold food"), ("late", None), ("unlinked", None)]
+    assert query(db, "SELECT complaint_id FROM resolution_outcomes WHERE outcome_id = 'late'") == [(None,)]
+
+
+def test_a_failed_rebuild_leaves_the_database_untouched(db, tmp_path):
+    original = db.read_bytes()
+    broken = [COMPLAINTS[0], {k: v for k, v in COMPLAINTS[1].items() if k != "resolution"}]
+    with pytest.raises(SystemExit, match="record 2 is missing resolution"):
+        rebuild(db, {"complaints": write_jsonl(tmp_path / "broken.jsonl", broken)})
+    assert db.read_bytes() == original
+    assert not list(tmp_path.glob(".complaints.db.*.tmp"))
+
+
+def test_unsupported_formats_are_refused(db, tmp_path):
+    with pytest.raises(SystemExit, match="unsupported format"):
+        rebuild(db, {"orders": write_jsonl(tmp_path / "orders.xml", ORDERS)})
+
+
+def test_upsert_updates_and_appends_complaints(db, tmp_path):
+    resent = dict(COMPLAINTS[1], resolution="refund")
+    new = {"order_id": "O3", "complaint_type": "wrong item", "resolution": "redelivery", "created_at": "2026-01-06 10:00"}
+    counts = upsert(db, {"complaints": write_jsonl(tmp_path / "delta.jsonl", [resent, new])})
+    assert counts == {"complaints": 2}
+    assert query(db, "SELECT COUNT(*) FROM complaints") == [(4,)]
+    assert query(db, "SELECT resolution FROM complaints WHERE complaint_type = 'late delivery'") == [("refund",)]
+    assert aggregate(db, "customer", "C2") == (1, "2026-01-06 10:00", "redelivery")
+    # Upserting the same delta again changes nothing.
+    upsert(db, {"complaints": write_jsonl(tmp_path / "delta.jsonl", [resent, new])})
+    assert query(db, "SELECT COUNT(*) FROM complaints") == [(4,)]
+
+
+def test_upsert_recounts_aggregates_when_orders_move(db, tmp_path):
+    moved = [dict(ORDERS[1], customer_id="C2"), {"order_id": "O4", "items": "idli", "status": "placed"}]
+    counts = upsert(db, {"orders": write_jsonl(tmp_path / "orders-delta.jsonl", moved)})
+    assert counts == {"orders": 2}
+    assert query(db, "SELECT COUNT(*) FROM orders") == [(4,)]
+    assert aggregate(db, "customer", "C1") == (1, "2026-01-01 10:00", "refund")
+    assert aggregate(db, "customer", "C2") == (2, "2026-01-03 10:00", "none")
+
+
+def test_upsert_is_all_or_nothing(db, tmp_path):
+    good = dict(COMPLAINTS[0], resolution="changed")
+    bad = {"order_id": "O1", "complaint_type": "late delivery"}
+    with pytest.raises(SystemExit):
+        upsert(db, {"complaints": write_jsonl(tmp_path / "delta.jsonl", [good, bad])})
+    assert query(db, "SELECT resolution FROM complaints WHERE complaint_type = 'missing item'") == [("refund",)]
+
+
+def test_json_arrays_are_read_in_small_chunks(monkeypatch):
+    monkeypatch.setattr(ingest, "READ_CHUNK_CHARS", 7)
+    records = [{"id": n, "text": "naan, ] \"quoted\" " * n} for n in range(20)]
+    text = " \n[\n" + ",\n".join(json.dumps(record) for record in records) + "\n]\n"
+    assert list(iter_json_array(io.StringIO(text))) == records
+    assert list(iter_json_array(io.StringIO("[]"))) == []
+    assert list(iter_json_array(io.StringIO(""))) == []
+
+
+@pytest.mark.parametrize("text", ['{"id": 1}', '[{"id": 1}, {"id": 2}', '[{"id": 1}, {"id": '])
+def test_malformed_json_arrays_are_errors(text, monkeypatch):
+    monkeypatch.setattr(ingest, "READ_CHUNK_CHARS", 4)
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text)))
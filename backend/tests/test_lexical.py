@@ -0,0 +1,91 @@
+import pytest
+from langchain_core.documents import Document
+
+from backend.app.lexical import BM25Index, is_decisive, reciprocal_rank_fusion, tokenize
+
+
+DOCS = {
+    "kb-missing": Document(
+        page_content="Offer redelivery of the missing item or a partial refund.",
+        metadata={"policy_id": "P-MISSING", "title": "Missing item"},
+    ),
+    "kb-seal": Document(
+        page_content="If the package seal was broken or tampered, refund the order.",
+        metadata={"policy_id": "P-SEAL", "title": "Tampered packaging"},
+    ),
+    "kb-late": Document(
+        page_content="Late deliveries beyond the promised window get a delivery fee refund.",
+        metadata={"policy_id": "P-LATE", "title": "Late delivery"},
+    ),
+}
+POLICIES = [
+    {"policy_id": "P-MISSING", "keywords": ["missing fries"]},
+    {"policy_id": "P-SEAL", "keywords": ["unsealed"]},
+]
+
+
+def test_tokenize_drops_stopwords_and_stems():
+    assert tokenize("The seals were SEALED and it's smelling") == ["seal", "seal", "its", "smell"]
+    assert tokenize("glass dress") == ["glass", "dress"]  # -ss is not a plural.
+
+
+@pytest.fixture
+def index() -> BM25Index:
+    return BM25Index(DOCS, POLICIES)
+
+
+def test_best_matching_document_ranks_first(index):
+    assert index.search("the seal on my package was broken", k=3)[0][0] == "kb-seal"
+    assert index.search("my delivery was late", k=3)[0][0] == "kb-late"
+
+
+def test_policy_keywords_are_searchable(index):
+    # "fries" and "unsealed" only appear in the policies' keywords.
+    assert index.search("fries", k=3)[0][0] == "kb-missing"
+    assert index.search("unsealed", k=3)[0][0] == "kb-seal"
+
+
+def test_documents_sharing_no_term_are_omitted(index):
+    assert index.search("pizza", k=3) == []
+    assert {doc_id for doc_id, _ in index.search("refund", k=3)} == set(DOCS)
+
+
+def test_k_limits_and_scores_descend(index):
+    results = index.search("refund delivery missing seal", k=2)
+    assert len(results) == 2
+    assert results[0][1] >= results[1][1] > 0
+
+
+def test_rarer_terms_weigh_more(index):
+    [(top, _)] = index.search("refund seal", k=1)  # "refund" is in every doc, "seal" in one.
+    assert top == "kb-seal"
+
+
+def test_empty_index():
+    assert BM25Index({}, []).search("anything", k=3) == []
+
+
+@pytest.mark.parametrize(
+    "results, decisive",
+    [
+        ([], False),
+        ([("a", 3.0)], False),
+        ([("a", 5.0)], True),
+        ([("a", 5.0), ("b", 2.5)], True),
+        ([("a", 5.0), ("b", 3.0)], False),
+    ],
+)
+def test_is_decisive(results, decisive):
+    assert is_decisive(results, min_score=4, margin=2) is decisive
+
+
+def test_rrf_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["d", "b", "c"]])
+    assert fused[0] == "b"  # Second in both beats first in one.
+    assert set(fused) == {"a", "b", "c", "d"}
+    assert fused.index("c") < fused.index("a")  # Even third in both does.
+
+
+def test_rrf_single_ranking_keeps_order():
+    assert reciprocal_rank_fusion([["x", "y", "z"]]) == ["x", "y", "z"]
+    assert reciprocal_rank_fusion([]) == []
@@ -0,0 +1,69 @@
+import json
+
+from backend.app.matcher import KeywordMatcher, normalize_text
+
+from conftest import DATA_DIR
+
+
+POLICIES = [
+    {"policy_id": "LATE", "keywords": ["late", "late delivery", "delayed"]},
+    {"policy_id": "COLD", "keywords": ["cold", "cold food"]},
+    {"policy_id": "MISSING", "keywords": ["missing item", "didn't get", "not delivered"]},
+    {"policy_id": "SPILL", "keywords": ["spilled", "cold"]},
+]
+
+
+def ids(matches):
+    return [match.policy["policy_id"] for match in matches]
+
+
+def test_normalize_text():
+    assert normalize_text("  I DIDN’T\tget   it ") == "i didn't get it"
+    assert normalize_text("`quoted`") == "'quoted'"
+
+
+def test_longest_keyword_wins_and_scores_per_word():
+    [match] = KeywordMatcher(POLICIES[:1]).match("Very LATE delivery again")
+    assert match.keywords == ["late delivery"]
+    assert match.score == 2
+
+
+def test_keywords_only_match_whole_words():
+    matcher = KeywordMatcher(POLICIES)
+    assert matcher.match("the coldness of it all, chocolate") == []
+    assert ids(matcher.match("chocolate was cold.")) == ["COLD", "SPILL"]
+
+
+def test_curly_apostrophes_and_case_are_normalized():
+    assert ids(KeywordMatcher(POLICIES).match("I DIDN’T GET my naan")) == ["MISSING"]
+
+
+def test_best_first_with_ties_in_policy_order():
+    matcher = KeywordMatcher(POLICIES)
+    matches = matcher.match("Cold, spilled and late")
+    assert ids(matches) == ["SPILL", "LATE", "COLD"]
+    assert [match.score for match in matches] == [2, 1, 1]
+
+
+def test_a_longer_keyword_shadows_its_prefix():
+    # "cold food" is matched as one keyword, so SPILL's "cold" does not fire.
+    matches = KeywordMatcher(POLICIES).match("Cold food, spilled")
+    assert ids(matches) == ["COLD", "SPILL"]
+    assert [match.keywords for match in matches] == [["cold food"], ["spilled"]]
+
+
+def test_a_keyword_counts_once_per_policy():
+    [match] = KeywordMatcher(POLICIES[:1]).match("late, late, so late")
+    assert match.score == 1
+
+
+def test_no_keywords_never_matches():
+    assert KeywordMatcher([{"policy_id": "X", "keywords": []}]).match("anything") == []
+    assert KeywordMatcher([]).match("anything") == []
+
+
+def test_sample_policies():
+    policies = json.loads((DATA_DIR / "policies.json").read_text(encoding="utf-8"))
+    matcher = KeywordMatcher(policies)
+    assert ids(matcher.match("My fries were missing, I didn't get them"))[0] == "POL-001"
+    assert matcher.match("Thanks, all good!") == []
@@ -0,0 +1,186 @@
+import json
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+
+import pytest
+
+from backend.app.outcomes import OutcomeRecorder
+from backend.data.init_db import create_schema
+
+from conftest import DATA_DIR
+
+
+HOLD_LOCK = """
+import sys
+from backend.app.outcomes import _lock_journal
+with open(sys.argv[1], "rb+") as handle:
+    _lock_journal(handle)
+    print("locked", flush=True)
+    sys.stdin.read()
+"""
+
+
+def outcome(**fields):
+    return {
+        "outcome_id": uuid.uuid4().hex,
+        "created_at": "2026-10-17 10:00",
+        "session_id": "session-1",
+        "order_id": "ZOM123",
+        "complaint_type": "missing item",
+        "source": "llm",
+        "status": "handled",
+        "resolution": "partial_refund",
+        "escalate": False,
+        "policy_citations": ["POL-001"],
+        **fields,
+    }
+
+
+@pytest.fixture
+def recorder(complaints_db, tmp_path):
+    recorder = OutcomeRecorder(complaints_db, tmp_path / "journal", flush_interval=0.02)
+    yield recorder
+    recorder.close()
+
+
+def query(db, sql, *params):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.02)
+
+
+def test_outcomes_are_committed_and_open_a_complaint(recorder, complaints_db):
+    complaints_before = query(complaints_db, "SELECT COUNT(*) FROM complaints")[0][0]
+    first = outcome()
+    recorder.record(first)
+    assert recorder.flush()
+    [(complaint_id, citations)] = query(
+        complaints_db,
+        "SELECT complaint_id, policy_citations FROM resolution_outcomes WHERE outcome_id = ?",
+        first["outcome_id"],
+    )
+    assert json.loads(citations) == ["POL-001"]
+    assert query(complaints_db, "SELECT order_id, resolution FROM complaints WHERE id = ?", complaint_id) == [
+        ("ZOM123", "partial_refund")
+    ]
+    assert query(complaints_db, "SELECT COUNT(*) FROM complaints")[0][0] == complaints_before + 1
+    assert recorder.stats()["committed"] == 1
+
+
+def test_later_turns_update_the_conversations_complaint(recorder, complaints_db):
+    recorder.record(outcome(resolution=None, escalate=True))
+    recorder.record(outcome(resolution="redelivery"))
+    recorder.record(outcome(session_id="session-2"))
+    assert recorder.flush()
+    rows = query(
+        complaints_db,
+        "SELECT o.session_id, c.resolution FROM resolution_outcomes o JOIN complaints c ON c.id = o.complaint_id "
+        "ORDER BY o.session_id",
+    )
+    assert rows == [("session-1", "redelivery"), ("session-1", "redelivery"), ("session-2", "partial_refund")]
+    # The aggregate triggers saw the agent's complaints too.
+    [(total,)] = query(complaints_db, "SELECT total FROM complaint_aggregates WHERE scope = 'order' AND scope_key = 'ZOM123'")
+    assert total == 1 + 2
+
+
+def test_turns_without_an_order_record_no_complaint(recorder, complaints_db):
+    recorder.record(outcome(order_id=None, complaint_type=None))
+    assert recorder.flush()
+    assert query(complaints_db, "SELECT complaint_id FROM resolution_outcomes") == [(None,)]
+
+
+def test_orphaned_journal_is_replayed_once(complaints_db, tmp_path):
+    journal_dir = tmp_path / "journal"
+    journal_dir.mkdir()
+    left_behind = outcome()
+    orphan = journal_dir / "outcomes-999999.jsonl"
+    # A process died mid-write: the last line is incomplete, and one outcome was already committed.
+    orphan.write_text(json.dumps(left_behind) + "\n" + json.dumps(left_behind) + "\n" + '{"outcome_id": "tru')
+    recorder = OutcomeRecorder(complaints_db, journal_dir, flush_interval=0.02)
+    try:
+        assert recorder.flush()
+        assert not orphan.exists()
+        assert recorder.stats()["replayed"] == 2
+        assert query(complaints_db, "SELECT COUNT(*) FROM resolution_outcomes")[0][0] == 1
+    finally:
+        recorder.close()
+
+
+def test_a_live_processs_journal_is_left_alone(complaints_db, tmp_path):
+    journal_dir = tmp_path / "journal"
+    journal_dir.mkdir()
+    live = journal_dir / "outcomes-1.jsonl"
+    live.write_text(json.dumps(outcome()) + "\n")
+    holder = subprocess.Popen(
+        [sys.executable, "-c", HOLD_LOCK, str(live)],
+        cwd=DATA_DIR.parents[1],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        recorder = OutcomeRecorder(complaints_db, journal_dir, flush_interval=0.02)
+        try:
+            assert recorder.flush()
+            assert recorder.stats()["replayed"] == 0
+        finally:
+            recorder.close()
+        assert live.exists()
+        assert query(complaints_db, "SELECT COUNT(*) FROM resolution_outcomes")[0][0] == 0
+    finally:
+        holder.communicate("")
+    # Once that process is gone its journal is an orphan like any other.
+    recorder = OutcomeRecorder(complaints_db, journal_dir, flush_interval=0.02)
+    try:
+        assert recorder.flush()
+    finally:
+        recorder.close()
+    assert not live.exists()
+    assert query(complaints_db, "SELECT COUNT(*) FROM resolution_outcomes")[0][0] == 1
+
+
+def test_overflow_spills_to_the_journal_and_is_committed_from_there(complaints_db, tmp_path):
+    recorder = OutcomeRecorder(complaints_db, tmp_path / "journal", max_pending=1, flush_interval=0.02)
+    try:
+        for n in range(20):
+            recorder.record(outcome(session_id=f"s{n}"))
+        assert recorder.flush()
+        assert recorder.stats()["spilled"] > 0
+        assert query(complaints_db, "SELECT COUNT(*) FROM resolution_outcomes")[0][0] == 20
+    finally:
+        recorder.close()
+    assert not recorder.journal_path.exists()  # Fully committed, so removed on close.
+
+
+def test_missing_schema_is_not_created_but_waited_for(tmp_path):
+    db = tmp_path / "old.db"
+    sqlite3.connect(db).close()
+    recorder = OutcomeRecorder(db, tmp_path / "journal", flush_interval=0.02)
+    try:
+        recorder.record(outcome(order_id=None, complaint_type=None))
+        wait_until(lambda: recorder.stats()["errors"] > 0)
+        tables = {name for (name,) in query(db, "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert "resolution_outcomes" not in tables  # The writer never migrates the file itself.
+        assert recorder.journal_path.stat().st_size > 0
+        conn = sqlite3.connect(db)
+        create_schema(conn)
+        conn.commit()
+        conn.close()
+        wait_until(lambda: recorder.stats()["committed"] == 1)
+    finally:
+        recorder.close()
+    assert query(db, "SELECT COUNT(*) FROM resolution_outcomes")[0][0] == 1
@@ -0,0 +1,68 @@
+import asyncio
+
+from langchain_core.embeddings import Embeddings
+
+from backend.app.query_embeddings import QueryEmbeddings
+
+
+class RecordingEmbeddings(Embeddings):
+    """Embeds a text as its length, and remembers every text it was asked for."""
+
+    def __init__(self):
+        self.seen: list[str] = []
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.seen.extend(texts)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+def test_the_backend_gets_the_original_text_and_the_cache_the_normalized_key():
+    base = RecordingEmbeddings()
+    embeddings = QueryEmbeddings(base, batch_window_ms=0)
+    first = embeddings.embed_query("My  Fries were MISSING")
+    assert base.seen == ["My  Fries were MISSING"]
+    assert embeddings.embed_query("my fries were missing ") == first
+    assert base.calls == 1
+    assert embeddings.stats()["hits"] == 1
+
+
+def test_concurrent_misses_are_batched_and_deduplicated():
+    base = RecordingEmbeddings()
+    embeddings = QueryEmbeddings(base, batch_window_ms=5)
+
+    async def scenario():
+        return await asyncio.gather(
+            embeddings.aembed_query("Cold food"),
+            embeddings.aembed_query("cold  FOOD"),
+            embeddings.aembed_query("Late delivery"),
+        )
+
+    vectors = asyncio.run(scenario())
+    assert base.calls == 1
+    assert sorted(base.seen) == ["Cold food", "Late delivery"]
+    assert vectors[0] == vectors[1]
+    assert embeddings.stats()["batched_queries"] == 2
+
+
+def test_saved_cache_is_reloaded(tmp_path):
+    path = tmp_path / "embeddings.npz"
+    embeddings = QueryEmbeddings(RecordingEmbeddings(), cache_path=path, identity="fake")
+    for text in ("a", "bb", "ccc"):
+        embeddings.embed_query(text)
+    embeddings.save()
+
+    base = RecordingEmbeddings()
+    reloaded = QueryEmbeddings(base, max_entries=2, cache_path=path, identity="fake")
+    assert reloaded.stats()["entries"] == 2  # Only the most recent entries fit.
+    assert reloaded.embed_query("ccc") == [3.0]
+    assert base.calls == 0
+    assert QueryEmbeddings(base, cache_path=path, identity="other model").stats()["entries"] == 0
+    assert QueryEmbeddings(base, max_entries=0, cache_path=path, identity="fake").stats()["entries"] == 0
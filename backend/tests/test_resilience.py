@@ -0,0 +1,257 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from backend.app import resilience
+from backend.app.resilience import CircuitBreaker, UpstreamGuard, UpstreamUnavailable, retry_after_seconds
+
+
+def status_error(cls, code: int, headers: dict[str, str] | None = None):
+    response = httpx.Response(code, headers=headers, request=httpx.Request("POST", "https://upstream.test"))
+    return cls("upstream said no", response=response, body=None)
+
+
+def make_guard(**overrides) -> UpstreamGuard:
+    options = {
+        "max_concurrency": 2,
+        "queue_timeout": 0.05,
+        "call_timeout": 1.0,
+        "max_retries": 2,
+        "base_delay": 0.0,
+        "max_delay": 0.01,
+        "breaker": CircuitBreaker(failure_threshold=3, reset_seconds=30),
+    }
+    options.update(overrides)
+    return UpstreamGuard("test", **options)
+
+
+class Upstream:
+    """An async upstream that raises the queued errors in turn, then answers."""
+
+    def __init__(self, *errors: BaseException, result="ok"):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+def test_breaker_opens_after_consecutive_failures(clock, monkeypatch):
+    monkeypatch.setattr(resilience, "time", clock)
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()  # The success reset the count.
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_admits_one_probe(clock, monkeypatch):
+    monkeypatch.setattr(resilience, "time", clock)
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.advance(29)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # Everyone else waits for the probe.
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_transient_errors_are_retried():
+    guard = make_guard()
+    upstream = Upstream(status_error(openai.RateLimitError, 429), httpx.ConnectError("reset"))
+    assert asyncio.run(guard.call(upstream)) == "ok"
+    assert upstream.calls == 3
+    assert guard.breaker.failures == 0  # The final success closes the count again.
+
+
+def test_retries_run_out():
+    guard = make_guard(max_retries=1)
+    upstream = Upstream(*[status_error(openai.InternalServerError, 503)] * 3)
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(guard.call(upstream))
+    assert upstream.calls == 2
+    assert guard.breaker.failures == 2
+
+
+def test_a_long_retry_after_is_not_waited_for():
+    guard = make_guard()
+    upstream = Upstream(status_error(openai.RateLimitError, 429, {"retry-after": "60"}))
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(guard.call(upstream))
+    assert upstream.calls == 1
+
+
+def test_timeouts_are_retried():
+    guard = make_guard(call_timeout=0.01, max_retries=1)
+    calls = 0
+
+    async def slow_then_fast():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await asyncio.sleep(1)
+        return "ok"
+
+    assert asyncio.run(guard.call(slow_then_fast)) == "ok"
+    assert calls == 2
+
+
+def test_auth_errors_fail_without_retry_and_open_the_circuit():
+    guard = make_guard()
+    for _ in range(3):
+        upstream = Upstream(status_error(openai.AuthenticationError, 401))
+        with pytest.raises(UpstreamUnavailable) as caught:
+            asyncio.run(guard.call(upstream))
+        assert upstream.calls == 1
+        assert isinstance(caught.value.__cause__, openai.AuthenticationError)
+    assert guard.stats()["state"] == "open"
+    upstream = Upstream()
+    with pytest.raises(UpstreamUnavailable, match="circuit open"):
+        asyncio.run(guard.call(upstream))
+    assert upstream.calls == 0
+
+
+def test_rejected_requests_leave_the_breaker_alone():
+    guard = make_guard()
+    guard.breaker.record_failure()
+    for _ in range(5):
+        with pytest.raises(UpstreamUnavailable):
+            asyncio.run(guard.call(Upstream(status_error(openai.BadRequestError, 400))))
+    assert guard.stats()["state"] == "closed"
+    assert guard.breaker.failures == 1
+
+
+def test_no_slot_within_the_queue_timeout_fails_fast():
+    guard = make_guard(max_concurrency=1)
+
+    async def scenario():
+        entered, release = asyncio.Event(), asyncio.Event()
+
+        async def hold():
+            entered.set()
+            await release.wait()
+            return "held"
+
+        holder = asyncio.create_task(guard.call(hold))
+        await entered.wait()
+        assert guard.stats()["in_flight"] == 1
+        with pytest.raises(UpstreamUnavailable, match="no capacity"):
+            await guard.call(Upstream())
+        release.set()
+        assert await holder == "held"
+
+    asyncio.run(scenario())
+    assert guard.stats()["in_flight"] == 0
+
+
+def test_calls_sharing_a_key_are_coalesced():
+    guard = make_guard()
+    upstream_calls = 0
+
+    async def slow():
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.01)
+        return "shared"
+
+    async def scenario():
+        return await asyncio.gather(*(guard.call(slow, key="same prompt") for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["shared"] * 5
+    assert upstream_calls == 1
+
+
+def stream_of(*items, fail_after: int | None = None, error: BaseException | None = None):
+    async def generate():
+        for position, item in enumerate(items):
+            if position == fail_after:
+                raise error
+            await asyncio.sleep(0)
+            yield item
+
+    return generate
+
+
+async def collect(guard: UpstreamGuard, open_stream):
+    seen, in_flight = [], []
+    async for item in guard.stream(open_stream):
+        seen.append(item)
+        in_flight.append(guard.stats()["in_flight"])
+    return seen, in_flight
+
+
+def test_stream_holds_its_slot_until_the_end():
+    guard = make_guard()
+    seen, in_flight = asyncio.run(collect(guard, stream_of("a", "b", "c")))
+    assert seen == ["a", "b", "c"]
+    assert in_flight == [1, 1, 1]
+    assert guard.stats()["in_flight"] == 0
+
+
+def test_stream_is_retried_only_before_the_first_item():
+    guard = make_guard()
+    opened = 0
+
+    def open_stream():
+        nonlocal opened
+        opened += 1
+        if opened == 1:
+            return stream_of("x", fail_after=0, error=httpx.ReadTimeout("slow"))()
+        return stream_of("a", "b")()
+
+    assert asyncio.run(collect(guard, open_stream))[0] == ["a", "b"]
+    assert opened == 2
+
+
+def test_a_stream_that_breaks_off_is_not_retried():
+    guard = make_guard()
+    seen = []
+
+    async def consume():
+        async for item in guard.stream(
+            stream_of("a", "b", "c", fail_after=2, error=status_error(openai.InternalServerError, 500))
+        ):
+            seen.append(item)
+
+    with pytest.raises(UpstreamUnavailable, match="stream broke off"):
+        asyncio.run(consume())
+    assert seen == ["a", "b"]
+    assert guard.breaker.failures == 1
+    assert guard.stats()["in_flight"] == 0
+
+
+def test_closing_a_stream_early_releases_the_slot():
+    guard = make_guard()
+
+    async def scenario():
+        stream = guard.stream(stream_of("a", "b", "c"))
+        assert await anext(stream) == "a"
+        assert guard.stats()["in_flight"] == 1
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert guard.stats()["in_flight"] == 0
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(status_error(openai.RateLimitError, 429, {"retry-after": "2"})) == 2.0
+    assert retry_after_seconds(status_error(openai.RateLimitError, 429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(status_error(openai.RateLimitError, 429, {"retry-after": "Wed, 21 Oct"})) is None
+    assert retry_after_seconds(httpx.ConnectError("no response")) is None
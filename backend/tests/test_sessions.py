@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from backend.app import sessions
+from backend.app.sessions import InMemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(sessions, "time", clock)
+    if request.param == "memory":
+        store = InMemorySessionStore(max_messages=3, ttl_seconds=60, max_sessions=2)
+    else:
+        store = SQLiteSessionStore(tmp_path / "sessions.db", max_messages=3, ttl_seconds=60, max_sessions=2)
+    yield store
+    store.close()
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+def test_history_is_capped_and_trimmed_messages_are_returned(store):
+    for n in range(3):
+        assert store.append("s", "user", f"m{n}") == []
+    assert contents(store.append("s", "assistant", "m3")) == ["m0"]
+    assert contents(store.get_history("s")) == ["m1", "m2", "m3"]
+    assert store.get_history("s")[-1]["role"] == "assistant"
+
+
+def test_idle_sessions_expire(store, clock):
+    store.append("s", "user", "hello")
+    store.set_summary("s", "earlier")
+    clock.advance(59)
+    assert contents(store.get_history("s")) == ["hello"]
+    clock.advance(61)
+    assert store.get_history("s") == []
+    assert store.get_summary("s") == ""
+
+
+def test_an_expired_session_starts_over(store, clock):
+    store.append("s", "user", "old")
+    store.set_summary("s", "old summary")
+    clock.advance(120)
+    store.append("s", "user", "new")
+    assert contents(store.get_history("s")) == ["new"]
+    assert store.get_summary("s") == ""
+
+
+def test_least_recently_used_session_is_evicted(store, clock):
+    store.append("a", "user", "a")
+    clock.advance(1)
+    store.append("b", "user", "b")
+    clock.advance(1)
+    if isinstance(store, InMemorySessionStore):
+        store.get_history("a")  # Reading counts as use in memory; the SQLite store orders by last write.
+    else:
+        store.append("a", "user", "a again")
+    clock.advance(1)
+    store.append("c", "user", "c")
+    if isinstance(store, SQLiteSessionStore):
+        store.prune()  # Amortized over PRUNE_EVERY appends; force it.
+    assert store.get_history("b") == []
+    assert store.get_history("a") != []
+    assert store.get_history("c") != []
+    assert store.stats()["sessions"] == 2
+
+
+def test_summary_belongs_to_a_live_session(store):
+    store.set_summary("nobody", "ignored")
+    assert store.get_summary("nobody") == ""
+    store.append("s", "user", "hi")
+    store.set_summary("s", "user said hi")
+    assert store.get_summary("s") == "user said hi"
+
+
+def test_stats_track_messages(store):
+    store.append("a", "user", "12345")
+    store.append("b", "user", "678")
+    stats = store.stats()
+    assert stats["sessions"] == 2
+    assert stats["messages"] == 2
+    assert stats["bytes"] > 0
+
+
+def test_in_memory_bytes_follow_trimming_and_eviction():
+    store = InMemorySessionStore(max_messages=2, ttl_seconds=60, max_sessions=1)
+    for content in ("aaaa", "bb", "c"):
+        store.append("s", "user", content)
+    assert store.stats()["bytes"] == 3
+    store.append("t", "user", "dddd")  # Evicts "s".
+    assert store.stats() == {"sessions": 1, "messages": 1, "bytes": 4}
+
+
+def test_sqlite_sessions_are_shared_between_store_instances(tmp_path):
+    first = SQLiteSessionStore(tmp_path / "sessions.db", max_messages=5, ttl_seconds=60, max_sessions=10)
+    second = SQLiteSessionStore(tmp_path / "sessions.db", max_messages=5, ttl_seconds=60, max_sessions=10)
+    try:
+        first.append("s", "user", "from worker one")
+        assert contents(second.get_history("s")) == ["from worker one"]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_sqlite_close_closes_every_threads_connection(tmp_path):
+    store = SQLiteSessionStore(tmp_path / "sessions.db", max_messages=5, ttl_seconds=60, max_sessions=100)
+
+    async def use_from_threads():
+        await asyncio.gather(*(asyncio.to_thread(store.append, f"s{n}", "user", "hi") for n in range(16)))
+
+    asyncio.run(use_from_threads())
+    connections = list(store._connections)
+    assert len(connections) > 1
+    store.close()
+    for conn in connections:
+        with pytest.raises(Exception, match="closed"):
+            conn.execute("SELECT 1")
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from backend.app.streaming import MessageFieldExtractor, sse_event
+
+
+DECISION = {
+    "status": "handled",
+    "resolution": "refund",
+    "message": 'Sorry — your "Paneer Tikka" was missing.\nA refund is on its way: café \\ 100%',
+    "escalate": False,
+    "policy_citations": ["POL-001"],
+    "next_steps": ["Confirm refund"],
+}
+
+
+def feed_in_chunks(raw: str, size: int) -> tuple[str, list[str]]:
+    extractor = MessageFieldExtractor()
+    deltas = [extractor.feed(raw[i : i + size]) for i in range(0, len(raw), size)]
+    return extractor.text, deltas
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, 1000])
+def test_message_survives_any_chunking(size):
+    raw = json.dumps(DECISION)  # \u escapes and \" \n \\ all split across chunk boundaries at size 1-7.
+    text, deltas = feed_in_chunks(raw, size)
+    assert text == DECISION["message"]
+    assert "".join(deltas) == DECISION["message"]
+
+
+def test_unicode_escape_split_across_chunks():
+    raw = '{"message": "caf\\u00e9 ok"}'
+    extractor = MessageFieldExtractor()
+    split = raw.index("u00e9") + 2  # Inside the four hex digits.
+    assert extractor.feed(raw[:split]) == "caf"
+    assert extractor.feed(raw[split:]) == "é ok"
+
+
+def test_message_is_streamed_as_it_arrives():
+    extractor = MessageFieldExtractor()
+    assert extractor.feed('{"status": "handled", "message": "Sorry ') == "Sorry "
+    assert extractor.feed("about that") == "about that"
+    assert extractor.feed('", "escalate": false}') == ""
+    assert extractor.text == "Sorry about that"
+
+
+def test_only_the_top_level_message_key_counts():
+    raw = json.dumps(
+        {
+            "status": "message",  # A value equal to the field name is not a key.
+            "details": {"message": "nested, not for the customer"},
+            "policy_citations": ["message"],
+            "message": "the real one",
+        }
+    )
+    assert feed_in_chunks(raw, 4)[0] == "the real one"
+
+
+def test_output_after_the_message_is_ignored():
+    extractor = MessageFieldExtractor()
+    extractor.feed('{"message": "first", "next_steps": ["x"]}')
+    assert extractor.feed('{"message": "second"}') == ""
+    assert extractor.text == "first"
+
+
+def test_no_message_field_yields_nothing():
+    text, deltas = feed_in_chunks('Sorry, I cannot answer that. {"status": "needs_human"}', 3)
+    assert text == ""
+    assert not any(deltas)
+
+
+def test_sse_event_frame():
+    assert sse_event("token", {"text": "hi"}) == 'event: token\ndata: {"text": "hi"}\n\n'
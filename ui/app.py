@@ -1,3 +1,5 @@
+import json
+
 import requests
 import streamlit as st
 
@@ -45,6 +47,29 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    # One keep-alive connection pool for the whole UI process.
+    return requests.Session()
+
+
+def iter_sse(resp: requests.Response):
+    """Yield (event, data) pairs from a Server-Sent Events response."""
+    event, data_lines = "message", []
+    for line in resp.iter_lines(chunk_size=None, decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
 st.markdown('<div class="zomato-title">Zomato Complaint Agent</div>', unsafe_allow_html=True)
 st.markdown(
     '<div class="zomato-subtitle">Report an issue and get refund/redelivery help via RAG + policy.</div>',
@@ -68,6 +93,7 @@ with st.sidebar:
         ),
     )
     st.caption("Tip: you can still type a custom message.")
+    stream_responses = st.checkbox("Stream responses", value=True)
     
     st.divider()
     if st.button("🔄 New Chat", use_container_width=True):
@@ -138,34 +164,65 @@ if user_message:
             "session_id": st.session_state.session_id,
         }
         with st.chat_message("assistant"):
+            session = get_http_session()
             try:
-                resp = requests.post(backend_url, json=payload, timeout=300)
-                if resp.status_code != 200:
-                    error_text = f"Backend error: {resp.status_code} - {resp.text}"
-                    st.error(error_text)
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": error_text}
-                    )
+                if stream_responses:
+                    status = st.empty()
+                    placeholder = st.empty()
+                    response_text = ""
+                    data = None
+                    with session.post(
+                        backend_url.rstrip("/") + "/stream", json=payload, timeout=300, stream=True
+                    ) as resp:
+                        if resp.status_code != 200:
+                            raise RuntimeError(f"Backend error: {resp.status_code} - {resp.text}")
+                        for event, event_data in iter_sse(resp):
+                            if event == "progress":
+                                status.caption(f"Working on it… ({event_data.get('stage')} done)")
+                            elif event == "token":
+                                response_text += event_data.get("text", "")
+                                placeholder.write(response_text + "▌")
+                            elif event == "fallback":
+                                # The model broke off mid-reply; the policy-rule answer follows as tokens.
+                                response_text = ""
+                                placeholder.empty()
+                            elif event == "final":
+                                data = event_data
+                            elif event == "error":
+                                raise RuntimeError(f"Backend error: {event_data.get('detail')}")
+                    status.empty()
+                    if data is None:
+                        raise RuntimeError("Backend closed the stream before sending a final response.")
+                    # The final event is authoritative (e.g. when the agent fell back to policy rules).
+                    response_text = data.get("message", response_text)
+                    placeholder.write(response_text)
                 else:
+                    resp = session.post(backend_url, json=payload, timeout=300)
+                    if resp.status_code != 200:
+                        raise RuntimeError(f"Backend error: {resp.status_code} - {resp.text}")
                     data = resp.json()
                     response_text = data.get("message", "")
-                    
-                    # Store session_id from backend response
-                    returned_session_id = data.get("session_id")
-                    if returned_session_id:
-                        st.session_state.session_id = returned_session_id
-                    
                     st.write(response_text)
-                    meta = {
-                        "resolution": data.get("resolution"),
-                        "escalate": data.get("escalate"),
-                        "order_summary": data.get("order_summary"),
-                        "policy_citations": data.get("policy_citations", []),
-                        "next_steps": data.get("next_steps", []),
-                    }
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": response_text, "meta": meta}
-                    )
+
+                # Store session_id from backend response
+                returned_session_id = data.get("session_id")
+                if returned_session_id:
+                    st.session_state.session_id = returned_session_id
+
+                meta = {
+                    "resolution": data.get("resolution"),
+                    "escalate": data.get("escalate"),
+                    "order_summary": data.get("order_summary"),
+                    "policy_citations": data.get("policy_citations", []),
+                    "next_steps": data.get("next_steps", []),
+                }
+                st.session_state.messages.append(
+                    {"role": "assistant", "content": response_text, "meta": meta}
+                )
+            except RuntimeError as exc:
+                error_text = str(exc)
+                st.error(error_text)
+                st.session_state.messages.append({"role": "assistant", "content": error_text})
             except requests.RequestException as exc:
                 err = f"Request failed: {exc}"
                 st.error(err)